@@ -0,0 +1,121 @@
+"""Scaling of data-parallel training with different numbers of worker processes."""
+import argparse
+import time
+
+import numpy as py_np
+import minpy.numpy as np
+import mxnet as mx
+from minpy.core import Function
+from minpy.nn import layers
+from minpy.nn.io import NDArrayIter
+from minpy.nn.model import ModelBase
+from minpy.nn.solver import Solver
+from minpy.nn.parallel import DataParallelSolver
+
+batch_size=128
+input_size=(3, 32, 32)
+flattened_input_size=3 * 32 * 32
+hidden_size=512
+num_classes=10
+
+class TwoLayerNet(ModelBase):
+    def __init__(self):
+        super(TwoLayerNet, self).__init__()
+        self.add_param(name='w1', shape=(flattened_input_size, hidden_size)) \
+            .add_param(name='b1', shape=(hidden_size,)) \
+            .add_param(name='w2', shape=(hidden_size, num_classes)) \
+            .add_param(name='b2', shape=(num_classes,))
+
+    def forward(self, X, mode):
+        # Workers see shards of a batch, so the batch size is taken from the data.
+        X = np.reshape(X, (X.shape[0], flattened_input_size))
+        y1 = layers.affine(X, self.params['w1'], self.params['b1'])
+        y2 = layers.relu(y1)
+        return layers.affine(y2, self.params['w2'], self.params['b2'])
+
+    def loss(self, predict, y):
+        return layers.softmax_loss(predict, y)
+
+class ConvolutionNet(ModelBase):
+    def __init__(self):
+        super(ConvolutionNet, self).__init__()
+        net = mx.sym.Variable(name='X')
+        net = mx.sym.Convolution(
+                data=net, name='conv', kernel=(7, 7), num_filter=32)
+        net = mx.sym.Activation(
+                data=net, act_type='relu')
+        net = mx.sym.Pooling(
+                data=net, name='pool', pool_type='max', kernel=(2, 2),
+                stride=(2, 2))
+        net = mx.sym.Flatten(data=net)
+        # Executors for shards of other sizes are bound on demand.
+        self.conv = Function(
+                net, input_shapes={'X': (batch_size,) + input_size},
+                name='conv')
+        self.add_params(self.conv.get_params())
+        conv_out_size = self.conv.get_one_output_shape()[1]
+        self.add_param(name='w1', shape=(conv_out_size, hidden_size)) \
+            .add_param(name='b1', shape=(hidden_size,)) \
+            .add_param(name='w2', shape=(hidden_size, num_classes)) \
+            .add_param(name='b2', shape=(num_classes,))
+
+    def forward(self, X, mode):
+        out = self.conv(X=X, **self.params)
+        out = layers.affine(out, self.params['w1'], self.params['b1'])
+        out = layers.relu(out)
+        return layers.affine(out, self.params['w2'], self.params['b2'])
+
+    def loss(self, predict, y):
+        return layers.softmax_loss(predict, y)
+
+def load_data(args):
+    if args.data_dir:
+        from examples.utils.data_utils import get_CIFAR10_data
+        data = get_CIFAR10_data(args.data_dir)
+        return data['X_train'], data['y_train']
+    num_samples = batch_size * args.num_batches
+    return (py_np.random.randn(num_samples, *input_size).astype(py_np.float32),
+            py_np.random.randint(num_classes, size=num_samples))
+
+def measure(args, X, y, num_workers):
+    model = TwoLayerNet() if args.model == 'mlp' else ConvolutionNet()
+    train_dataiter = NDArrayIter(X, y, batch_size=batch_size, shuffle=False,
+                                 last_batch_handle='discard')
+    if num_workers == 1:
+        solver = Solver(model, train_dataiter, None, verbose=False,
+                        update_rule='sgd_momentum', optim_config={'learning_rate': 1e-3})
+    else:
+        solver = DataParallelSolver(model, train_dataiter, None, verbose=False,
+                                    update_rule='sgd_momentum',
+                                    optim_config={'learning_rate': 1e-3},
+                                    num_workers=num_workers)
+    solver.init()
+    batches = [batch for _, batch in zip(range(args.num_batches), train_dataiter)]
+    # The first step forks workers and binds executors.
+    solver._step(batches[0])
+    start = time.time()
+    for batch in batches[1:]:
+        solver._step(batch)
+    elapsed = time.time() - start
+    if num_workers > 1:
+        solver.close()
+    return (len(batches) - 1) * batch_size / elapsed
+
+def main(args):
+    X, y = load_data(args)
+    throughputs = {}
+    for num_workers in args.workers:
+        throughputs[num_workers] = measure(args, X, y, num_workers)
+        base = throughputs[args.workers[0]] / args.workers[0]
+        print('%s, %d workers: %.1f samples/s, scaling efficiency %.2f' %
+              (args.model, num_workers, throughputs[num_workers],
+               throughputs[num_workers] / (base * num_workers)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Data-parallel scaling benchmark")
+    parser.add_argument('--data_dir', type=str, default=None,
+                        help='Directory of CIFAR-10. Random data is used if not given.')
+    parser.add_argument('--model', type=str, default='mlp', choices=['mlp', 'cnn'])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--num_batches', type=int, default=40)
+    main(parser.parse_args())
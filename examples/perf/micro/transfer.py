@@ -0,0 +1,48 @@
+"""Measure NumPy<->MXNet transfer cost of large activations on CPU.
+
+Activations produced by MXNet primitives are consumed by NumPy primitives and
+vice versa. With zero-copy synchronization the ledger should report no copied
+bytes for float32 arrays.
+"""
+import time
+
+import numpy
+import minpy
+import minpy.numpy as np
+from minpy import array
+from minpy.dispatch import policy
+
+SHAPE = (256, 4096)
+ITERATIONS = 50
+
+
+@minpy.wrap_policy(policy.OnlyNumPyPolicy())
+def numpy_step(x):
+    return np.maximum(x, 0)
+
+
+@minpy.wrap_policy(policy.OnlyMXNetPolicy())
+def mxnet_step(x):
+    return np.tanh(x)
+
+
+def run(zero_copy):
+    enabled = array.set_zero_copy(zero_copy)
+    x = array.wrap(numpy.random.rand(*SHAPE).astype(numpy.float32))
+    array.transfer_ledger.reset()
+    array.transfer_ledger.start()
+    start = time.time()
+    for _ in range(ITERATIONS):
+        x = numpy_step(mxnet_step(x))
+    x.wait_to_read()
+    elapsed = time.time() - start
+    array.transfer_ledger.stop()
+    print('zero copy {}: {:.3f}s, {} syncs, {} bytes copied'.format(
+        'on' if enabled else 'off', elapsed,
+        len(array.transfer_ledger.records), array.transfer_ledger.total_bytes))
+
+
+if __name__ == '__main__':
+    run(False)
+    run(True)
+    array.transfer_ledger.show()
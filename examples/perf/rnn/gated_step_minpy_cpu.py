@@ -0,0 +1,118 @@
+"""Benchmark fused LSTM/GRU step primitives against the same steps composed of MinPy ops."""
+import argparse
+import time
+
+import minpy
+import minpy.core as core
+import minpy.numpy as np
+from minpy.nn import layers
+from minpy.nn.model import ModelBase
+
+num_cold = 5
+
+
+def composed_lstm_step(x, prev_h, prev_c, Wx, Wh, b):
+    """`layers.lstm_step` built from dispatched ops, one tape record each."""
+    _, H = prev_c.shape
+    a = np.dot(x, Wx) + np.dot(prev_h, Wh) + b
+    i = layers.sigmoid(a[:, 0:H])
+    f = layers.sigmoid(a[:, H:2 * H])
+    o = layers.sigmoid(a[:, 2 * H:3 * H])
+    g = np.tanh(a[:, 3 * H:4 * H])
+    next_c = f * prev_c + i * g
+    next_h = o * np.tanh(next_c)
+    return next_h, next_c
+
+
+def composed_gru_step(x, prev_h, Wx, Wh, b, Wxh, Whh, bh):
+    """`layers.gru_step` built from dispatched ops, one tape record each."""
+    _, H = prev_h.shape
+    a = layers.sigmoid(np.dot(x, Wx) + np.dot(prev_h, Wh) + b)
+    r = a[:, 0:H]
+    z = a[:, H:2 * H]
+    h_m = np.tanh(np.dot(x, Wxh) + np.dot(r * prev_h, Whh) + bh)
+    return z * prev_h + (1 - z) * h_m
+
+
+class GatedNet(ModelBase):
+    def __init__(self, args):
+        super(GatedNet, self).__init__()
+        H = args.hidden_size
+        gates = 4 if args.cell == 'lstm' else 2
+        self.add_param(name='Wx', shape=(args.input_size, gates * H)) \
+            .add_param(name='Wh', shape=(H, gates * H))                 \
+            .add_param(name='b', shape=(gates * H,))                    \
+            .add_param(name='Wa', shape=(H, args.num_classes))          \
+            .add_param(name='ba', shape=(args.num_classes,))
+        if args.cell == 'gru':
+            self.add_param(name='Wxh', shape=(args.input_size, H)) \
+                .add_param(name='Whh', shape=(H, H))               \
+                .add_param(name='bh', shape=(H,))
+        self.cell = args.cell
+        self.composed = args.composed
+        self.num_unroll_steps = args.num_unroll_steps
+        self.hshape = (args.batch_size, H)
+
+    def forward(self, X, mode):
+        p = self.params
+        h = np.zeros(self.hshape)
+        if self.cell == 'lstm':
+            step = composed_lstm_step if self.composed else layers.lstm_step
+            c = np.zeros(self.hshape)
+            for _ in range(self.num_unroll_steps):
+                h, c = step(X, h, c, p['Wx'], p['Wh'], p['b'])
+        else:
+            step = composed_gru_step if self.composed else layers.gru_step
+            for _ in range(self.num_unroll_steps):
+                h = step(X, h, p['Wx'], p['Wh'], p['b'], p['Wxh'], p['Whh'], p['bh'])
+        return layers.affine(h, p['Wa'], p['ba'])
+
+    def loss(self, predict, y):
+        return layers.l2_loss(predict, y)
+
+
+def main(args):
+    minpy.set_global_policy(args.policy)
+    model = GatedNet(args)
+    for k, v in model.param_configs.items():
+        model.params[k] = np.random.randn(*v['shape']) * 0.01
+
+    data = np.random.randn(args.batch_size, args.input_size) # Data of only one time step.
+    label = np.zeros((args.batch_size,), dtype=int)
+
+    for l in range(args.num_loops):
+        if l == num_cold:
+            start = time.time()
+        def loss_func(*params):
+            f = model.forward(data, 'train')
+            return model.loss(f, label)
+        if args.only_forward:
+            loss = loss_func()
+            loss.asnumpy()
+        else:
+            param_arrays = list(model.params.values())
+            grad_and_loss_func = core.grad_and_loss(
+                loss_func, argnum=range(len(param_arrays)))
+            grad_arrays, loss = grad_and_loss_func(*param_arrays)
+            for grad in grad_arrays:
+                grad.asnumpy()
+    dur = time.time() - start
+    print('%s %s (%s): Per Loop Time: %.6f' %
+          (args.cell, 'composed' if args.composed else 'fused', args.policy,
+           dur / (args.num_loops - num_cold)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cell', default='lstm', choices=['lstm', 'gru'])
+    parser.add_argument('--composed', default=False, action='store_true',
+                        help='Use steps composed of MinPy ops instead of the fused primitive.')
+    parser.add_argument('--policy', default='only_numpy')
+    parser.add_argument('--only-forward', default=False, action='store_true')
+    parser.add_argument('--batch-size', default=32, type=int)
+    parser.add_argument('--hidden-size', default=256, type=int)
+    parser.add_argument('--input-size', default=128, type=int)
+    parser.add_argument('--num-classes', default=10, type=int)
+    parser.add_argument('--num-unroll-steps', default=30, type=int)
+    parser.add_argument('--num-loops', default=20, type=int)
+    main(parser.parse_args())
@@ -0,0 +1,87 @@
+"""Trains an `Agent` asynchronously with several worker processes and a parameter server.
+
+Each worker runs its own environments, computes gradients on its rollouts and pushes them
+to a server process (see `minpy.nn.parallel.AsyncTrainer`), which applies them as they
+arrive. Workers pull fresh parameters after every push.
+"""
+
+import argparse
+import time
+import numpy as np
+from minpy.nn.parallel import AsyncTrainer
+from config import Config
+from envs import Atari8080Preprocessor, ChainWalkEnv, IdentityPreprocessor
+from model import Agent
+from train import train_episode
+
+def make_envs(env_type, num_envs, seed):
+    if env_type == 'ChainWalk':
+        envs = [ChainWalkEnv() for _ in range(num_envs)]
+    else:
+        import gym
+        envs = [gym.make(env_type) for _ in range(num_envs)]
+    if env_type in ('ChainWalk', 'CartPole-v0'):
+        preprocessors = [IdentityPreprocessor(np.prod(envs[0].observation_space.shape))
+                         for _ in range(num_envs)]
+    else:
+        preprocessors = [Atari8080Preprocessor() for _ in range(num_envs)]
+    for i, env in enumerate(envs):
+        env.seed(seed + i)
+    return envs, preprocessors
+
+def run_worker(args, agent, rank, client):
+    """Run episodes in a worker process until the server has applied enough updates."""
+    np.random.seed(args.seed + rank)
+    envs, preprocessors = make_envs(args.env_type, args.num_envs, args.seed + rank * args.num_envs)
+
+    def push_and_pull(env_xs, env_as, env_rs, env_vs):
+        client.push(agent.compute_gradients(env_xs, env_as, env_rs, env_vs))
+        agent.params.update(client.pull())
+
+    agent.params.update(client.pull())
+    running_reward = None
+    i = 0
+    while not client.should_stop():
+        episode_rs = train_episode(agent, envs, preprocessors, t_max=args.t_max,
+                                   render=False, train_step=push_and_pull)
+        for er in episode_rs:
+            running_reward = er if running_reward is None else (
+                0.99 * running_reward + 0.01 * er)
+        if i % args.print_every == 0:
+            print('Worker %d: batch %d, batch avg. reward: %.2f, running reward: %.3f' %
+                  (rank, i, np.mean(episode_rs), running_reward))
+        i += 1
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num-workers', type=int, default=4)
+    parser.add_argument('--num-envs', type=int, default=4,
+                        help='Number of environments of each worker.')
+    parser.add_argument('--t-max', type=int, default=50)
+    parser.add_argument('--env-type', default='ChainWalk',
+                        help='A gym environment, or ChainWalk for a local stand-in.')
+    parser.add_argument('--num-updates', type=int, default=2000)
+    parser.add_argument('--max-staleness', type=int, default=None,
+                        help='Drop gradients computed on parameters older than this.')
+    parser.add_argument('--learning-rate', type=float, default=1e-3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--print-every', type=int, default=10)
+    parser.add_argument('--gpu', action='store_true')
+
+    args = parser.parse_args()
+    config = Config(args)
+    print('args=%s' % args)
+    np.random.seed(args.seed)
+
+    envs, preprocessors = make_envs(args.env_type, 1, args.seed)
+    agent = Agent(preprocessors[0].obs_size, envs[0].action_space.n, config=config)
+
+    trainer = AsyncTrainer(agent.params, update_rule=config.update_rule,
+                           optim_config={'learning_rate': config.learning_rate},
+                           num_workers=args.num_workers, max_staleness=args.max_staleness)
+    start = time.time()
+    agent.params.update(trainer.run(
+        lambda rank, client: run_worker(args, agent, rank, client), args.num_updates))
+    print('%d updates applied, %d stale gradients dropped (max. staleness %d) in %.1fs' %
+          (trainer.stats.applied, trainer.stats.dropped, trainer.stats.max_staleness_seen,
+           time.time() - start))
@@ -32,3 +32,49 @@ class IdentityPreprocessor(object):
 
     def preprocess(self, x):
         return x
+
+class Space(object):
+    def __init__(self, n=None, shape=None):
+        self.n = n
+        self.shape = shape
+
+class ChainWalkEnv(object):
+    """Local stand-in for a gym environment, used when gym or a display is not available.
+
+    The agent walks on a chain of `length` cells and observes its one-hot position.
+    Action 1 moves right and action 0 moves left, but a move slips to the other side with
+    probability `slip`. Reaching the right end gives a reward of 1 and ends the episode;
+    every other step costs 0.01. Episodes are cut after `max_steps` steps.
+    """
+    def __init__(self, length=10, slip=0.1, max_steps=100):
+        self.length = length
+        self.slip = slip
+        self.max_steps = max_steps
+        self.action_space = Space(n=2)
+        self.observation_space = Space(shape=(length,))
+        self.rng = np.random.RandomState()
+        self.pos = 0
+        self.t = 0
+
+    def seed(self, seed):
+        self.rng.seed(seed)
+
+    def reset(self):
+        self.pos = 0
+        self.t = 0
+        return self._observe()
+
+    def step(self, action):
+        move = 1 if action == 1 else -1
+        if self.rng.uniform() < self.slip:
+            move = -move
+        self.pos = min(max(self.pos + move, 0), self.length - 1)
+        self.t += 1
+        if self.pos == self.length - 1:
+            return self._observe(), 1.0, True, {}
+        return self._observe(), -0.01, self.t >= self.max_steps, {}
+
+    def _observe(self):
+        obs = np.zeros((1, self.length))
+        obs[0, self.pos] = 1.0
+        return obs
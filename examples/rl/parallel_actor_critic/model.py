@@ -47,6 +47,10 @@ class Agent(ModelBase):
         return as_
 
     def train_step(self, env_xs, env_as, env_rs, env_vs):
+        grads = self.compute_gradients(env_xs, env_as, env_rs, env_vs)
+        self._update_params(grads)
+
+    def compute_gradients(self, env_xs, env_as, env_rs, env_vs):
         # Stack all the observations and actions.
         xs = np.vstack(list(chain.from_iterable(env_xs)))
         as_ = numpy.array(list(chain.from_iterable(env_as)))[:, np.newaxis]
@@ -75,8 +79,7 @@ class Agent(ModelBase):
             loss_ = self.loss(ps, as_, vs, drs, advs)
             return loss_
 
-        grads = self._forward_backward(loss_func)
-        self._update_params(grads)
+        return self._forward_backward(loss_func)
 
     def _discount(self, x, gamma):
         return scipy.signal.lfilter([1], [1, -gamma], x[::-1], axis=0)[::-1]
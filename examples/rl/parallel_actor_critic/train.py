@@ -5,15 +5,19 @@ import os
 import pickle
 import time
 from datetime import datetime
-import gym
 import numpy as np
 from config import Config
 from envs import Atari8080Preprocessor, IdentityPreprocessor
 from model import Agent
 
-def train_episode(agent, envs, preprocessors, t_max, render):
-    """Complete an episode's worth of training for each environment."""
+def train_episode(agent, envs, preprocessors, t_max, render, train_step=None):
+    """Complete an episode's worth of training for each environment.
+
+    `train_step` is called with the trajectories every `t_max` steps, and defaults to
+    `agent.train_step`.
+    """
     num_envs = len(envs)
+    train_step = train_step or agent.train_step
 
     # Buffers to hold trajectories, e.g. `env_xs[i]` will hold the observations for environment `i`.
     env_xs, env_as = _2d_list(num_envs), _2d_list(num_envs)
@@ -62,7 +66,7 @@ def train_episode(agent, envs, preprocessors, t_max, render):
                     env_vs[i].append(extra_vs[i][0])
 
             # Perform update and clear buffers.
-            agent.train_step(env_xs, env_as, env_rs, env_vs)
+            train_step(env_xs, env_as, env_rs, env_vs)
             env_xs, env_as = _2d_list(num_envs), _2d_list(num_envs)
             env_rs, env_vs = _2d_list(num_envs), _2d_list(num_envs)
             t = 0
@@ -72,7 +76,7 @@ def train_episode(agent, envs, preprocessors, t_max, render):
 
     # Perform a final update when all episodes are finished.
     if len(env_xs[0]) > 0:
-        agent.train_step(env_xs, env_as, env_rs, env_vs)
+        train_step(env_xs, env_as, env_rs, env_vs)
 
     return episode_rs
 
@@ -110,6 +114,7 @@ if __name__ == '__main__':
         print('Created directory %s' % args.save_dir)
 
     # Create and seed the environments
+    import gym  # Imported here so that async_train.py can reuse `train_episode` without gym.
     envs = [gym.make(args.env_type) for _ in range(args.num_envs)]
     if args.env_type == 'CartPole-v0':
         preprocessors = [IdentityPreprocessor(np.prod(envs[0].observation_space.shape))
@@ -7,7 +7,6 @@ from __future__ import division
 
 import argparse
 
-import gym
 import minpy.numpy as np
 from minpy.nn.model import ModelBase
 import numpy
@@ -94,12 +93,14 @@ def main(args):
         from minpy.context import set_context, gpu
         set_context(gpu(0))  # set the global context as gpu(0)
 
-    env = gym.make("Pong-v0")
-    env.seed(args.seed)
+    import gym
+    envs = [gym.make("Pong-v0") for _ in range(args.num_envs)]
+    for i, env in enumerate(envs):
+        env.seed(args.seed + i)
     numpy.random.seed(args.seed)
 
     model = PolicyNetwork(PongPreprocessor())
-    solver = RLPolicyGradientSolver(model, env,
+    solver = RLPolicyGradientSolver(model, envs,
                                     update_rule='rmsprop',
                                     optim_config={
                                         'learning_rate': args.learning_rate,
@@ -115,7 +116,8 @@ def main(args):
                                     resume_from=args.resume_from,
                                     num_episodes=args.num_episodes,
                                     verbose=args.verbose,
-                                    print_every=args.print_every)
+                                    print_every=args.print_every,
+                                    num_workers=args.num_workers)
     solver.init()
     solver.train()
 
@@ -133,6 +135,10 @@ if __name__ == '__main__':
     parser.add_argument('--print_every', type=int, default=10)
     parser.add_argument('--verbose', action='store_true')
     parser.add_argument('--gpu', action='store_true')
+    parser.add_argument('--num-envs', type=int, default=1,
+                        help='Number of environments whose episodes are run together.')
+    parser.add_argument('--num-workers', type=int, default=0,
+                        help='Number of processes stepping the environments.')
     args = parser.parse_args()
     print('args=%s' % args)
     main(args)
@@ -1,11 +1,15 @@
+import copy
 import time
 import pickle
 import os
 
+import numpy
 import minpy.numpy as np
 from minpy import core
 from minpy.nn.solver import Solver
 
+from vec_env import RolloutBuffer, VecEnv
+
 
 class RLPolicyGradientSolver(Solver):
     """A custom `Solver` for models trained using policy gradient.
@@ -16,6 +20,9 @@ class RLPolicyGradientSolver(Solver):
         .loss(xs, ys, rs)
         .discount_rewards(rs)
         .preprocessor
+
+    `.choose_action(p)` is called for each environment, and `.discount_rewards(rs)` on the
+    rewards of each episode.
     """
 
     def __init__(self, model, env, **kwargs):
@@ -25,13 +32,16 @@ class RLPolicyGradientSolver(Solver):
         ----------
         model : ModelBase
             A model that supports policy gradient training (see above).
-        env : gym.Environment
-            A `gym` Environment, e.g. Pong-v0.
+        env : gym.Environment or list
+            A `gym` Environment, e.g. Pong-v0, or a list of copies of it. Episodes of all
+            copies are run together, batching their observations into one forward pass per
+            timestep.
 
         Other Parameters
         ----------------
         num_episodes : int, optional
-            Number of episodes to train for.
+            Number of episodes to train for. With several environments, each episode runs
+            one game in every environment.
         update_every : int, optional
             Update model parameters every `update_every` episodes.
         save_every : int, optional
@@ -42,68 +52,90 @@ class RLPolicyGradientSolver(Solver):
             Loads a parameter file at this location, resuming model training with those parameters.
         render : boolean, optional
             Render the game environment when `True`.
+        num_workers : int, optional
+            Number of worker processes that step the environments. With 0 (the default), they
+            are stepped in the training process.
         """
         self.model = model
-        self.env = env
+        self.envs = env if isinstance(env, (list, tuple)) else [env]
+        self.env = self.envs[0]
         self.num_episodes = kwargs.pop('num_episodes', 100000)
         self.update_every = kwargs.pop('update_every', 10)
         self.save_every = kwargs.pop('save_every', 10)
         self.save_dir = kwargs.pop('save_dir', './')
         self.resume_from = kwargs.pop('resume_from', None)
         self.render = kwargs.pop('render', False)
+        self.num_workers = kwargs.pop('num_workers', 0)
 
         self.running_reward = None
         self.episode_reward = 0
+        self.vec_env = None
+        self.rollouts = None
 
         super(RLPolicyGradientSolver, self).__init__(model, None, None, **kwargs)
 
     def run_episode(self):
-        """Run an episode using the current model to generate training data.
+        """Run an episode in every environment using the current model to generate training data.
 
-        Specifically, this involves repeatedly getting an observation from the environment,
-        performing a forward pass using the single observation to get a distribution over actions
-        (in binary case a probability of a single action), and choosing an action.
-        Finally, rewards are discounted when the episode completes.
+        Specifically, this involves repeatedly getting the observations of all environments whose
+        episode has not finished, performing a single forward pass on them to get distributions over
+        actions (in binary case a probability of a single action), and choosing an action for each.
+        Trajectories are written into preallocated buffers, and rewards are discounted per
+        environment when all episodes complete.
 
         Returns
         -------
         (xs, ys, rs) : tuple
             The N x input_size observations, N x 1 action labels, and N x 1 discounted rewards
-            obtained from running the episode's N steps.
+            obtained from running the episodes' N steps in total.
         """
-        observation = self.env.reset()
-        self.model.preprocessor.reset()
-        self.episode_reward = 0
+        if self.vec_env is None:
+            preprocessors = [copy.deepcopy(self.model.preprocessor) for _ in self.envs]
+            self.vec_env = VecEnv(self.envs, preprocessors, self.num_workers)
+        num_envs = len(self.envs)
+        observations = self.vec_env.reset()
+        if self.rollouts is None:
+            self.rollouts = RolloutBuffer(num_envs, observations.shape[1])
+        self.rollouts.reset()
+        episode_rewards = numpy.zeros(num_envs)
+        active = numpy.ones(num_envs, dtype=bool)
 
-        xs, ys, rs = [], [], []
-        done = False
         game_number = 1
         game_start = time.time()
-        while not done:
+        while active.any():
             if self.render:
-                self.env.render()
-            x = self.model.preprocessor.preprocess(observation)
-            p = self.model.forward(x)
-            a, y = self.model.choose_action(p.asnumpy().ravel()[0])
-            observation, r, done, info = self.env.step(a)
-
-            xs.append(x.asnumpy().ravel())
-            ys.append(y)
-            rs.append(r)
-            self.episode_reward += r
-            if self._game_complete(r):
-                game_time = time.time() - game_start
-                if self.verbose:
-                    print('game %d complete (%.2fs), reward: %f' % (game_number, game_time, r))
-                game_number += 1
-                game_start = time.time()
-
-        # Episode finished.
-        self.running_reward = self.episode_reward if self.running_reward is None else (
-            0.99*self.running_reward + 0.01*self.episode_reward)
-        xs = np.vstack(xs)
-        ys = np.vstack(ys)
-        rs = np.expand_dims(self.model.discount_rewards(rs), axis=1)
+                self.vec_env.render()
+            # One forward pass and one copy back to the host per timestep.
+            ps = self.model.forward(observations).asnumpy().ravel()
+            actions, ys = zip(*[self.model.choose_action(p) for p in ps])
+            next_observations, rs, dones = self.vec_env.step(actions, active)
+
+            self.rollouts.append(observations, ys, rs, active)
+            episode_rewards += rs
+            for r in rs[active]:
+                if self._game_complete(r):
+                    game_time = time.time() - game_start
+                    if self.verbose:
+                        print('game %d complete (%.2fs), reward: %f' % (game_number, game_time, r))
+                    game_number += 1
+                    game_start = time.time()
+            active &= ~dones
+            observations[active] = next_observations[active]
+
+        # Episodes finished.
+        for episode_reward in episode_rewards:
+            self.running_reward = episode_reward if self.running_reward is None else (
+                0.99*self.running_reward + 0.01*episode_reward)
+        self.episode_reward = episode_rewards.mean()
+        xs, ys, rs = [], [], []
+        for i in range(num_envs):
+            env_xs, env_ys, env_rs = self.rollouts.trajectory(i)
+            xs.append(env_xs)
+            ys.append(env_ys)
+            rs.append(self.model.discount_rewards(env_rs))
+        xs = np.array(numpy.concatenate(xs))
+        ys = np.array(numpy.concatenate(ys)[:, numpy.newaxis])
+        rs = np.expand_dims(np.concatenate(rs), axis=1)
         return xs, ys, rs
 
     def _game_complete(self, reward):
@@ -180,5 +212,10 @@ class RLPolicyGradientSolver(Solver):
                 if self.verbose:
                     print('Wrote parameter file %s' % file_name)
 
+        # Stop the environment workers.
+        if self.vec_env is not None:
+            self.vec_env.close()
+            self.vec_env = None
+
     def _init_grad_buffer(self):
         return {k: np.zeros_like(v) for k, v in self.model.params.items()}
@@ -0,0 +1,202 @@
+"""Stepping several copies of an environment at once, optionally in worker processes."""
+
+import multiprocessing
+
+import numpy
+
+
+def _as_row(x):
+    """Flatten a preprocessed observation (a minpy or NumPy array) into a NumPy row."""
+    if hasattr(x, 'asnumpy'):
+        x = x.asnumpy()
+    return numpy.asarray(x, dtype=numpy.float32).ravel()
+
+
+class _LocalEnvs(object):
+    """Environments stepped in the calling process."""
+
+    def __init__(self, envs, preprocessors):
+        self.envs = envs
+        self.preprocessors = preprocessors
+
+    def reset(self):
+        rows = []
+        for env, preprocessor in zip(self.envs, self.preprocessors):
+            preprocessor.reset()
+            rows.append(_as_row(preprocessor.preprocess(env.reset())))
+        return rows
+
+    def step(self, actions, active):
+        results = []
+        for env, preprocessor, a, is_active in zip(self.envs, self.preprocessors, actions, active):
+            if not is_active:
+                results.append(None)
+                continue
+            observation, r, done, _ = env.step(a)
+            results.append((_as_row(preprocessor.preprocess(observation)), r, done))
+        return results
+
+    def render(self):
+        self.envs[0].render()
+
+    def close(self):
+        pass
+
+
+def _worker_loop(conn, envs, preprocessors):
+    local = _LocalEnvs(envs, preprocessors)
+    while True:
+        command, arg = conn.recv()
+        if command == 'reset':
+            conn.send(local.reset())
+        elif command == 'step':
+            conn.send(local.step(*arg))
+        else:
+            conn.close()
+            return
+
+
+class _RemoteEnvs(object):
+    """Environments stepped by a worker process."""
+
+    def __init__(self, context, envs, preprocessors):
+        self.conn, child_conn = context.Pipe()
+        # Environments are inherited by the forked worker, so they need not be picklable.
+        self.process = context.Process(target=_worker_loop,
+                                       args=(child_conn, envs, preprocessors))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+        self.num_envs = len(envs)
+
+    def reset(self):
+        self.conn.send(('reset', None))
+
+    def step(self, actions, active):
+        self.conn.send(('step', (actions, active)))
+
+    def result(self):
+        return self.conn.recv()
+
+    def close(self):
+        self.conn.send(('close', None))
+        self.process.join()
+
+
+class VecEnv(object):
+    """Steps K environments together and returns their preprocessed observations as one batch.
+
+    Parameters
+    ----------
+    envs : list
+        Environment copies, e.g. made by `gym.make`.
+    preprocessors : list
+        One preprocessor per environment, with `.reset()` and `.preprocess(observation)`.
+    num_workers : int, optional
+        Number of worker processes to step the environments in. With 0 (the default), the
+        environments are stepped in the calling process.
+    """
+
+    def __init__(self, envs, preprocessors, num_workers=0):
+        self.num_envs = len(envs)
+        self.envs = envs
+        if num_workers > 0:
+            context = multiprocessing
+            if hasattr(multiprocessing, 'get_context'):
+                context = multiprocessing.get_context('fork')
+            bounds = numpy.linspace(0, self.num_envs, min(num_workers, self.num_envs) + 1)
+            bounds = [int(round(b)) for b in bounds]
+            self._groups = [_RemoteEnvs(context, envs[lo:hi], preprocessors[lo:hi])
+                            for lo, hi in zip(bounds[:-1], bounds[1:])]
+            self._local = None
+        else:
+            self._groups = None
+            self._local = _LocalEnvs(envs, preprocessors)
+
+    def reset(self):
+        """Reset all environments and return their observations as a K x input_size array."""
+        if self._local is not None:
+            return numpy.vstack(self._local.reset())
+        for group in self._groups:
+            group.reset()
+        return numpy.vstack([row for group in self._groups for row in group.result()])
+
+    def step(self, actions, active):
+        """Step the environments marked as `active` with the given actions.
+
+        Returns
+        -------
+        (observations, rewards, dones) : tuple
+            K x input_size observations, and K rewards and done flags. Entries of inactive
+            environments are left as zero (observations and rewards) and True (dones).
+        """
+        if self._local is not None:
+            results = self._local.step(actions, active)
+        else:
+            start = 0
+            for group in self._groups:
+                end = start + group.num_envs
+                group.step(actions[start:end], active[start:end])
+                start = end
+            results = [res for group in self._groups for res in group.result()]
+        observations = None
+        rewards = numpy.zeros(self.num_envs)
+        dones = numpy.ones(self.num_envs, dtype=bool)
+        for i, res in enumerate(results):
+            if res is None:
+                continue
+            if observations is None:
+                observations = numpy.zeros((self.num_envs, res[0].size), dtype=numpy.float32)
+            observations[i], rewards[i], dones[i] = res
+        return observations, rewards, dones
+
+    def render(self):
+        """Render the first environment, if it is stepped in the calling process."""
+        if self._local is not None:
+            self._local.render()
+
+    def close(self):
+        """Stop the worker processes."""
+        if self._groups is not None:
+            for group in self._groups:
+                group.close()
+            self._groups = None
+
+
+class RolloutBuffer(object):
+    """Preallocated T x K buffers for the trajectories of K environments.
+
+    The buffers are reused by later episodes and only reallocated (to twice the length)
+    when an episode runs longer than any before.
+    """
+
+    def __init__(self, num_envs, input_size, capacity=1024):
+        self.num_envs = num_envs
+        self.xs = numpy.zeros((capacity, num_envs, input_size), dtype=numpy.float32)
+        self.ys = numpy.zeros((capacity, num_envs), dtype=numpy.float32)
+        self.rs = numpy.zeros((capacity, num_envs), dtype=numpy.float32)
+        self.lengths = numpy.zeros(num_envs, dtype=int)
+        self.t = 0
+
+    def reset(self):
+        self.lengths[:] = 0
+        self.t = 0
+
+    def append(self, xs, ys, rs, active):
+        """Write one timestep. Only entries of `active` environments are kept."""
+        if self.t == self.xs.shape[0]:
+            for name in ('xs', 'ys', 'rs'):
+                old = getattr(self, name)
+                new = numpy.zeros((2 * old.shape[0],) + old.shape[1:], dtype=old.dtype)
+                new[:old.shape[0]] = old
+                setattr(self, name, new)
+        self.xs[self.t] = xs
+        self.ys[self.t] = ys
+        self.rs[self.t] = rs
+        self.lengths[active] = self.t + 1
+        self.t += 1
+
+    def trajectory(self, i):
+        """Return the observations, labels and rewards of environment `i`."""
+        length = self.lengths[i]
+        return self.xs[:length, i], self.ys[:length, i], self.rs[:length, i]
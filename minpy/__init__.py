@@ -5,14 +5,14 @@
 from __future__ import absolute_import
 
 import re
-import mxnet as mx
 
+from .backend import mxnet as mx
 from .dispatch import policy
-from .dispatch.policy import PreferMXNetPolicy
+from .dispatch.policy import PreferMXNetPolicy, OnlyNumPyPolicy
 
 # Global config
 Config = {'modules': [], }
-Config['default_policy'] = PreferMXNetPolicy()
+Config['default_policy'] = PreferMXNetPolicy() if mx is not None else OnlyNumPyPolicy()
 
 # Import minpy.numpy package to do some initialization.
 from . import numpy  # pylint: disable= wrong-import-position
@@ -27,6 +27,7 @@ def set_global_policy(plc):
         The policy to set.
     """
     Config['default_policy'] = policy.create(plc)
+    Config['default_policy'].invalidate_dispatch_cache()
     for mod in Config['modules']:
         mod.generate_attrs(Config['default_policy'])
 
@@ -48,6 +49,7 @@ def check_mxnet_version():
             break
     assert succ, "Unsupported MXNet version: %s; minimum version required: 0.9.2" % mx.__version__
 
-check_mxnet_version()
+if mx is not None:
+    check_mxnet_version()
 
 wrap_policy = policy.wrap_policy
@@ -6,23 +6,227 @@
 from __future__ import absolute_import
 from __future__ import print_function
 
+import os
+import sys
 import itertools
 import collections
 
-import mxnet
 import numpy
 
 from .array_variants import ArrayType
 from .array_variants import array_types
 from .array_variants import number_types
+from .backend import mxnet
 from .context import current_context
 from .utils import log
 
 # pylint: disable= invalid-name
 _logger = log.get_logger(__name__)
+_package_dir = os.path.dirname(os.path.abspath(__file__))
+_write_through = False
+# Trace being recorded, see `minpy.trace`.
+_active_trace = None
+_zero_copy = (mxnet is not None and hasattr(numpy, 'from_dlpack') and
+              hasattr(mxnet.ndarray, 'from_dlpack') and
+              hasattr(mxnet.ndarray.NDArray, 'to_dlpack_for_read'))
 
 # pylint: enable= invalid-name
 
+TransferRecord = collections.namedtuple(
+    'TransferRecord', ['direction', 'nbytes', 'shape', 'op', 'site'])
+
+
+class TransferLedger(object):
+    """Ledger of data copies between NumPy and MXNet storage of arrays.
+
+    Recording is disabled by default. When enabled, every synchronization
+    performed by :class:`Array` is appended as a :class:`TransferRecord` which
+    holds the copy direction, the number of bytes, the array shape, the name of
+    the primitive that triggered the copy (if any) and the first call site
+    outside of MinPy.
+    """
+
+    def __init__(self):
+        self._enabled = False
+        self._records = []
+
+    @property
+    def enabled(self):
+        """Return whether transfers are being recorded."""
+        return self._enabled
+
+    @property
+    def records(self):
+        """Return the list of recorded transfers."""
+        return self._records
+
+    @property
+    def total_bytes(self):
+        """Return the total number of bytes copied."""
+        return sum(rec.nbytes for rec in self._records)
+
+    def start(self):
+        """Start recording transfers."""
+        self._enabled = True
+
+    def stop(self):
+        """Stop recording transfers."""
+        self._enabled = False
+
+    def reset(self):
+        """Drop all recorded transfers."""
+        self._records = []
+
+    def record(self, direction, nbytes, shape):
+        """Record one transfer, attributing it to the current primitive and call site.
+
+        Parameters
+        ----------
+        direction : str
+            Either ``'mxnet->numpy'`` or ``'numpy->mxnet'``.
+        nbytes : int
+            Number of bytes copied.
+        shape : tuple
+            Shape of the copied array.
+        """
+        op = None
+        site = None
+        frame = sys._getframe(1)
+        while frame is not None and (op is None or site is None):
+            code = frame.f_code
+            if op is None and code.co_name == 'call':
+                prim = frame.f_locals.get('self')
+                if hasattr(prim, 'typestr'):
+                    op = prim.__name__
+            if site is None and not code.co_filename.startswith(_package_dir):
+                site = '{}:{}'.format(code.co_filename, frame.f_lineno)
+            frame = frame.f_back
+        self._records.append(TransferRecord(direction, nbytes, shape, op, site))
+
+    def totals(self):
+        """Return transfer totals per primitive.
+
+        Returns
+        -------
+        dict
+            A dictionary mapping primitive name (None for copies made outside
+            of any primitive) to a tuple of (number of copies, bytes copied).
+        """
+        ret = {}
+        for rec in self._records:
+            count, nbytes = ret.get(rec.op, (0, 0))
+            ret[rec.op] = (count + 1, nbytes + rec.nbytes)
+        return ret
+
+    def show(self):
+        """Print transfer statistics per primitive and direction."""
+        per_op = collections.defaultdict(lambda: [0, 0])
+        for rec in self._records:
+            entry = per_op[(rec.op, rec.direction)]
+            entry[0] += 1
+            entry[1] += rec.nbytes
+        print('--------Transfer Statistics Start--------')
+        for (op, direction), (count, nbytes) in sorted(
+                per_op.items(), key=lambda kv: -kv[1][1]):
+            print(' {} ({}) : {} copies, {} bytes'.format(
+                op if op is not None else '<no op>', direction, count, nbytes))
+        print('Total: {} copies, {} bytes'.format(
+            len(self._records), self.total_bytes))
+        print('--------Transfer Statistics End--------')
+
+# pylint: disable= invalid-name
+transfer_ledger = TransferLedger()
+# pylint: enable= invalid-name
+
+
+def set_write_through(enabled):
+    """Set whether indexed assignments keep both copies of an array valid.
+
+    By default, :meth:`Array.__setitem__` writes into the NumPy copy and
+    invalidates the MXNet copy, so the next MXNet access copies the whole
+    array again. With write-through enabled, assignments with an integer or
+    a contiguous slice index on an array whose copies are both valid are
+    applied to both copies, and only the assigned rows are transferred.
+
+    Parameters
+    ----------
+    enabled : bool
+        Whether to enable write-through assignments.
+    """
+    global _write_through  # pylint: disable= global-statement, invalid-name
+    _write_through = enabled
+
+
+def set_zero_copy(enabled):
+    """Set whether CPU arrays share memory between their NumPy and MXNet copies.
+
+    Zero-copy synchronization uses DLPack and is enabled by default when both
+    NumPy and MXNet support it. It only applies to CPU arrays with C-contiguous
+    layout; MXNet copies of NumPy data are only shared for ``float32`` arrays,
+    since conversion to MXNet otherwise casts to ``float32``. NumPy views of
+    MXNet data are read-only, and are replaced by a private copy the first time
+    they are accessed mutably.
+
+    Parameters
+    ----------
+    enabled : bool
+        Whether to enable zero-copy synchronization.
+
+    Returns
+    -------
+    bool
+        Whether zero-copy synchronization is actually in effect.
+    """
+    global _zero_copy  # pylint: disable= global-statement, invalid-name
+    _zero_copy = (enabled and mxnet is not None and hasattr(numpy, 'from_dlpack') and
+                  hasattr(mxnet.ndarray, 'from_dlpack') and
+                  hasattr(mxnet.ndarray.NDArray, 'to_dlpack_for_read'))
+    return _zero_copy
+
+
+class _DLPackCapsule(object):
+    """Expose a DLPack capsule of a CPU tensor through the ``__dlpack__`` protocol."""
+    # pylint: disable= too-few-public-methods
+    __slots__ = ['_capsule']
+
+    def __init__(self, capsule):
+        self._capsule = capsule
+
+    def __dlpack__(self, stream=None, **kwargs):
+        return self._capsule
+
+    def __dlpack_device__(self): # pylint: disable= no-self-use
+        # (kDLCPU, device id)
+        return (1, 0)
+
+
+def _mxnet_to_numpy_view(mxarray):
+    """Return a read-only NumPy view of a CPU MXNet array, or None if not possible."""
+    if not _zero_copy or mxarray.context.device_type != 'cpu':
+        return None
+    try:
+        mxarray.wait_to_read()
+        return numpy.from_dlpack(_DLPackCapsule(mxarray.to_dlpack_for_read()))
+    except (BufferError, TypeError, ValueError, RuntimeError, mxnet.base.MXNetError):
+        return None
+
+
+def _wait_to_write(mxarray):
+    """Wait until all pending operations on an MXNet array have finished."""
+    mxnet.base.check_call(mxnet.base._LIB.MXNDArrayWaitToWrite(mxarray.handle))
+
+
+def _numpy_to_mxnet_view(nparray, ctx):
+    """Return an MXNet array sharing memory with a NumPy array, or None if not possible."""
+    if (not _zero_copy or ctx.device_type != 'cpu' or nparray.dtype != numpy.float32 or
+            nparray.size == 0 or not nparray.flags.c_contiguous or
+            not nparray.flags.aligned or not nparray.flags.writeable):
+        return None
+    try:
+        return mxnet.ndarray.from_dlpack(nparray.__dlpack__())
+    except (BufferError, TypeError, ValueError, RuntimeError, mxnet.base.MXNetError):
+        return None
+
 class Value(object):
     # pylint: disable= no-self-use
     """Class for all possible values in MinPy.
@@ -254,17 +458,43 @@ class Number(Value, float):
     def __repr__(self):
         return repr(self._val)
 
+    def _on_read(self):
+        """Notify the active trace that the value is read outside of primitives."""
+        if _active_trace is not None:
+            _active_trace.on_read(self)
+
+    # Python reads the value of a float subclass through these, e.g. for control flow.
+    def __float__(self):
+        self._on_read()
+        return float(self._val)
+
+    def __int__(self):
+        self._on_read()
+        return int(self._val)
+
+    def __bool__(self):
+        self._on_read()
+        return bool(self._val)
+
+    __nonzero__ = __bool__
+
+    def __round__(self, *args):
+        self._on_read()
+        return round(self._val, *args)
+
     def get_data(self, dtype):
         """Get data of given type. Directly return the underlying value here."""
         return self._val
 
     def asnumpy(self):
         """ Get data in numpy compatible type """
+        self._on_read()
         return self._val
 
     @property
     def val(self):
         """ return the underlying value """
+        self._on_read()
         return self._val
 
 class Array(Value):
@@ -276,7 +506,7 @@ class Array(Value):
     2. Redirect normal member functions to correct member functions of
     underlying array object.
     """
-    __slots__ = ['_data', '_latest_version', '_dtype']
+    __slots__ = ['_data', '_latest_version', '_dtype', '_shared']
     __array_priority__ = 100.0  # Highest priority when compute with numpy.ndarray.
 
     def __init__(self, data, atype, context=None):
@@ -284,6 +514,8 @@ class Array(Value):
         self._data = {atype: data}
         self._latest_version = atype
         self._dtype = data.dtype
+        # Whether NumPy and MXNet copies share the same memory.
+        self._shared = False
 
     def __str__(self):
         return str(self.get_data(ArrayType.NUMPY))
@@ -298,15 +530,20 @@ class Array(Value):
     @property
     def ndim(self):
         """ Number of array dimensions """
-        # TODO(Yihe): add ndim in MXNet ndarray
-        # return self._get_latest_data().ndim
-        return self.get_data(ArrayType.NUMPY).ndim
+        return len(self.shape)
 
     def has_type(self, atype):
         """ Return whether array data of given type exists in the underlying storage.
         """
         return atype in self._data.keys()
 
+    def has_valid_data(self, atype):
+        """ Return whether array data of given type exists and is up to date, i.e. it
+        could be read without synchronization.
+        """
+        return atype in self._data and (self._latest_version is None or
+                                        self._latest_version == atype)
+
     def reshape(self, *args, **kwargs):
         """Function for reshape this array.
 
@@ -373,22 +610,71 @@ class Array(Value):
         return Value._ns.argmax(self, axis)
 
     def _synchronize_data(self):
-        """Synchronize the data of different array types. """
+        """Synchronize the data of different array types.
+
+        On CPU, the copies share memory whenever possible instead of being copied.
+        """
         if self._latest_version == ArrayType.MXNET:
-            _logger.info(
-                'Copy from MXNet array to NumPy array for Array "{}" of shape {}.'
-                .format(id(self), self.shape))
             mxarray = self._data[ArrayType.MXNET]
-            self._data[ArrayType.NUMPY] = mxarray.asnumpy()
+            nparray = _mxnet_to_numpy_view(mxarray)
+            self._shared = nparray is not None
+            if not self._shared:
+                _logger.info(
+                    'Copy from MXNet array to NumPy array for Array "{}" of shape {}.'
+                    .format(id(self), self.shape))
+                nparray = mxarray.asnumpy()
+            self._data[ArrayType.NUMPY] = nparray
+            if transfer_ledger.enabled:
+                transfer_ledger.record('mxnet->numpy', 0 if self._shared else self.nbytes,
+                                       self.shape)
         elif self._latest_version == ArrayType.NUMPY:
-            _logger.info(
-                'Copy from NumPy array to MXNet array for Array "{}" of shape {}.'
-                .format(id(self), self.shape))
             nparray = self._data[ArrayType.NUMPY]
-            self._data[ArrayType.MXNET] = mxnet.ndarray.array(
-                nparray, ctx=self._context.as_mxnet_context())
+            ctx = self._context.as_mxnet_context()
+            mxarray = _numpy_to_mxnet_view(nparray, ctx)
+            self._shared = mxarray is not None
+            if not self._shared:
+                _logger.info(
+                    'Copy from NumPy array to MXNet array for Array "{}" of shape {}.'
+                    .format(id(self), self.shape))
+                mxarray = mxnet.ndarray.array(nparray, ctx=ctx)
+            self._data[ArrayType.MXNET] = mxarray
+            if transfer_ledger.enabled:
+                transfer_ledger.record('numpy->mxnet', 0 if self._shared else self.nbytes,
+                                       self.shape)
         self._latest_version = None
 
+    def release_data(self, dtype):
+        """Drop data of given type, so that its memory could be taken over by others.
+
+        Data of the other type is made valid (and private if it shared memory) first.
+        """
+        if dtype not in self._data:
+            return
+        other = ArrayType.NUMPY if dtype == ArrayType.MXNET else ArrayType.MXNET
+        if not self.has_valid_data(other) or self._shared:
+            data = self._data[dtype]
+            if other == ArrayType.NUMPY:
+                self._data[other] = data.asnumpy()
+            else:
+                self._data[other] = mxnet.ndarray.array(
+                    data, ctx=self._context.as_mxnet_context())
+            if transfer_ledger.enabled:
+                direction = 'mxnet->numpy' if dtype == ArrayType.MXNET else 'numpy->mxnet'
+                transfer_ledger.record(direction, self.nbytes, self.shape)
+        del self._data[dtype]
+        self._latest_version = other
+        self._shared = False
+
+    def adopt_data(self, data):
+        """Make an MXNet array the only data of this array.
+
+        `data` should hold the values of this array. It is owned by the array from then
+        on: updates through `get_data_mutable(ArrayType.MXNET)` are written into it.
+        """
+        self._data = {ArrayType.MXNET: data}
+        self._latest_version = ArrayType.MXNET
+        self._shared = False
+
     def get_data(self, dtype):
         """Get array data of given type."""
         if self._latest_version is not None and self._latest_version != dtype:
@@ -399,6 +685,13 @@ class Array(Value):
         """Get exclusive access to array data of given type."""
         if self._latest_version is not None and self._latest_version != dtype:
             self._synchronize_data()
+        if self._shared and dtype == ArrayType.NUMPY:
+            # Wait for pending MXNet operations on the shared memory.
+            _wait_to_write(self._data[ArrayType.MXNET])
+            nparray = self._data[ArrayType.NUMPY]
+            if not nparray.flags.writeable:
+                self._data[ArrayType.NUMPY] = numpy.array(nparray)
+                self._shared = False
         self._latest_version = dtype
         return self._data[dtype]
 
@@ -422,6 +715,8 @@ class Array(Value):
 
         This will return a copied array of numpy.ndarray type
         """
+        if _active_trace is not None:
+            _active_trace.on_read(self)
         return numpy.array(self.get_data(ArrayType.NUMPY))
 
     @property
@@ -448,12 +743,30 @@ class Array(Value):
         Currently `mxnet.ndarray` does not support full indexing, so there is an implicit
         conversion to NumPy array. Also note that this operation breaks gradient chain.
         """
+        if _active_trace is not None:
+            _active_trace.on_write(self)
         np_index = None
         np_val = wrap(val).get_data(ArrayType.NUMPY)
         if isinstance(index, tuple):
             np_index = tuple(_make_numpy_index(i) for i in index)
         else:
             np_index = _make_numpy_index(index) # pylint: disable=redefined-variable-type
+        if (_write_through and self._latest_version is None and
+                self.has_type(ArrayType.MXNET) and len(self.shape) > 0):
+            np_array = self._data[ArrayType.NUMPY]
+            if self._shared and np_array.flags.writeable:
+                # Both copies live in the same memory.
+                _wait_to_write(self._data[ArrayType.MXNET])
+                np_array.__setitem__(np_index, np_val)
+                return
+            mx_index = _make_mxnet_index(np_index, self.shape[0])
+            if mx_index is not None and not self._shared:
+                np_array.__setitem__(np_index, np_val)
+                rows = np_array[mx_index]
+                self._data[ArrayType.MXNET][mx_index] = rows
+                if transfer_ledger.enabled:
+                    transfer_ledger.record('numpy->mxnet', rows.nbytes, rows.shape)
+                return
         np_array = self.get_data_mutable(ArrayType.NUMPY)
         np_array.__setitem__(np_index, np_val)
 
@@ -477,14 +790,19 @@ class Array(Value):
         """Get number of elements in the array."""
         return self._get_latest_data().size
 
+    @property
+    def nbytes(self):
+        """Get number of bytes of the array data."""
+        return self.size * numpy.dtype(self._dtype).itemsize
+
     def wait_to_read(self):
         """Wait until the internal data has been calculated.
 
-        If the array only contains numpy data, it will simply return. Otherwise,
+        If the array only contains valid numpy data, it will simply return. Otherwise,
         it will wait until the mxnet data is finished.
         """
-        if self.has_type(ArrayType.MXNET):
-            self.get_data(ArrayType.MXNET).wait_to_read()
+        if self.has_valid_data(ArrayType.MXNET):
+            self._data[ArrayType.MXNET].wait_to_read()
 
 def _make_numpy_index(raw_index):
     """Create index that could be passed to numpy's indexing functions."""
@@ -496,6 +814,21 @@ def _make_numpy_index(raw_index):
     else:
         return np_index
 
+def _make_mxnet_index(np_index, length):
+    """Convert index into a contiguous slice on the first axis, which is the only
+    kind of indexing supported by MXNet assignment. Return None if not possible.
+    """
+    if isinstance(np_index, bool) or not isinstance(np_index, (int, slice)):
+        return None
+    if isinstance(np_index, int):
+        if np_index < 0:
+            np_index += length
+        return slice(np_index, np_index + 1)
+    start, stop, step = np_index.indices(length)
+    if step != 1 or start >= stop:
+        return None
+    return slice(start, stop)
+
 def _make_wrapper_types():
     """Create dictionary from underlying data type to its wrapper type.
 
@@ -525,10 +858,10 @@ def wrap(data):
         return None
     if isinstance(data, Value):
         return data
-    elif isinstance(data, array_types['mxnet']):
-        return Array(data, ArrayType.MXNET)
     elif isinstance(data, array_types['numpy']):
         return Array(data, ArrayType.NUMPY)
+    elif mxnet is not None and isinstance(data, array_types['mxnet']):
+        return Array(data, ArrayType.MXNET)
     else:
         dtype = type(data)
         return _wrapper_types[dtype](data)
@@ -5,8 +5,8 @@
 from __future__ import absolute_import
 from __future__ import print_function
 
+from minpy import backend
 from minpy.array_variants import numpy
-from minpy.array_variants import mxnet
 from minpy.utils import common
 
 class ArrayType(object):
@@ -15,7 +15,14 @@ class ArrayType(object):
     NUMPY = 0
     MXNET = 1
 
-variants = {'numpy': ArrayType.NUMPY, 'mxnet': ArrayType.MXNET}
-array_types = {'numpy': numpy.array_type, 'mxnet': mxnet.array_type}
+variants = {'numpy': ArrayType.NUMPY}
+array_types = {'numpy': numpy.array_type}
 variants_repr = {ArrayType.NUMPY: 'NumPy', ArrayType.MXNET: 'MXNet'}
-number_types = {'native': [int, float], 'numpy': numpy.number_type, 'mxnet': mxnet.number_type}
+number_types = {'native': [int, float], 'numpy': numpy.number_type}
+
+# MXNet variant is not loaded in NumPy-only mode.
+if backend.mxnet is not None:
+    from minpy.array_variants import mxnet  # pylint: disable= wrong-import-position
+    variants['mxnet'] = ArrayType.MXNET
+    array_types['mxnet'] = mxnet.array_type
+    number_types['mxnet'] = mxnet.number_type
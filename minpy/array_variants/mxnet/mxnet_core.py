@@ -7,6 +7,7 @@ from __future__ import absolute_import
 import operator
 import mxnet as mx
 from mxnet.ndarray import NDArray
+from . import mxnet_rnn
 from . import mxnet_wrapper
 
 
@@ -103,6 +104,7 @@ def register_primitives(reg, prim_wrapper):
     # Additional primitives due to naming issues in MXNet.
     reg.register('reshape', prim_wrapper(NDArray.reshape))
     reg.register('softmax_output', prim_wrapper(_softmax_output))
+    mxnet_rnn.register_primitives(reg, prim_wrapper)
 
 
 def def_grads(prims):
@@ -168,3 +170,4 @@ def def_grads(prims):
     prims('expand_dims').def_grad(
         lambda ans, x, axis: lambda g: NDArray.reshape(g, x.shape))
     prims('softmax_output').def_grad(_softmax_output_grad)
+    mxnet_rnn.def_grads(prims)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=no-member, invalid-name, too-many-arguments, too-many-locals
+"""Fused recurrent layers for mxnet implementation.
+
+Same algorithms as the numpy implementation in `numpy_rnn`.
+"""
+from __future__ import absolute_import
+from __future__ import division
+
+import mxnet as mx
+
+
+def _cut(t, bptt):
+    """Return whether gradients stop at the beginning of step `t` (truncated BPTT)."""
+    return bptt is not None and t % bptt == 0
+
+
+def _split(a, H, num):
+    """Split the last axis of a (N, num * H) array into `num` arrays."""
+    return [mx.nd.slice_axis(a, axis=1, begin=k * H, end=(k + 1) * H) for k in range(num)]
+
+
+def _time_major_product(x, w):
+    """Product of a (N, T, D) array and a (D, K) matrix, as a (T, N, K) array."""
+    N, T, D = x.shape
+    x = mx.nd.transpose(x, axes=(1, 0, 2)).reshape((T * N, D))
+    return mx.nd.dot(x, w).reshape((T, N, w.shape[1]))
+
+
+def _lstm_step(x, prev_h, prev_c, Wx, Wh, b):
+    """LSTM step. Returns next hidden and cell states, and the activations of the
+    i, f, o and g gates of shape (N, 4H)."""
+    H = prev_h.shape[1]
+    a = mx.nd.broadcast_add(mx.nd.dot(x, Wx) + mx.nd.dot(prev_h, Wh), b.reshape((1, 4 * H)))
+    ifo = mx.nd.sigmoid(mx.nd.slice_axis(a, axis=1, begin=0, end=3 * H))
+    g = mx.nd.tanh(mx.nd.slice_axis(a, axis=1, begin=3 * H, end=4 * H))
+    i, f, o = _split(ifo, H, 3)
+    next_c = f * prev_c + i * g
+    next_h = o * mx.nd.tanh(next_c)
+    return next_h, next_c, mx.nd.concat(ifo, g, dim=1)
+
+
+def _lstm_step_grad(ans, x, prev_h, prev_c, Wx, Wh, b):
+    """Gradient of all arguments of `_lstm_step`."""
+    # pylint: disable=unused-argument
+    _, next_c, gates = ans
+    def grad(g):  # pylint: disable=missing-docstring
+        dh, dc, _ = g
+        H = prev_h.shape[1]
+        i, f, o, gg = _split(gates, H, 4)
+        tanh_c = mx.nd.tanh(next_c)
+        dc = dc + dh * o * (1 - mx.nd.square(tanh_c))
+        da = mx.nd.concat(dc * gg * i * (1 - i), dc * prev_c * f * (1 - f),
+                          dh * tanh_c * o * (1 - o), dc * i * (1 - mx.nd.square(gg)), dim=1)
+        return [mx.nd.dot(da, Wx, transpose_b=True), mx.nd.dot(da, Wh, transpose_b=True),
+                dc * f, mx.nd.dot(x, da, transpose_a=True),
+                mx.nd.dot(prev_h, da, transpose_a=True), mx.nd.sum(da, axis=0)]
+    return grad
+
+
+def _gru_step(x, prev_h, Wx, Wh, b, Wxh, Whh, bh):
+    """GRU step. Returns the next hidden state, and the activations of the r and z
+    gates and of the candidate state, of shape (N, 3H)."""
+    H = prev_h.shape[1]
+    rz = mx.nd.sigmoid(mx.nd.broadcast_add(mx.nd.dot(x, Wx) + mx.nd.dot(prev_h, Wh),
+                                           b.reshape((1, 2 * H))))
+    r, z = _split(rz, H, 2)
+    h_m = mx.nd.tanh(mx.nd.broadcast_add(mx.nd.dot(x, Wxh) + mx.nd.dot(r * prev_h, Whh),
+                                         bh.reshape((1, H))))
+    next_h = z * prev_h + (1 - z) * h_m
+    return next_h, mx.nd.concat(rz, h_m, dim=1)
+
+
+def _gru_step_grad(ans, x, prev_h, Wx, Wh, b, Wxh, Whh, bh):
+    """Gradient of all arguments of `_gru_step`."""
+    # pylint: disable=unused-argument
+    gates = ans[1]
+    def grad(g):  # pylint: disable=missing-docstring
+        dh = g[0]
+        H = prev_h.shape[1]
+        r, z, h_m = _split(gates, H, 3)
+        dm = dh * (1 - z) * (1 - mx.nd.square(h_m))
+        r_h = r * prev_h
+        dr_h = mx.nd.dot(dm, Whh, transpose_b=True)
+        da = mx.nd.concat(dr_h * prev_h * r * (1 - r), dh * (prev_h - h_m) * z * (1 - z),
+                          dim=1)
+        dx = mx.nd.dot(da, Wx, transpose_b=True) + mx.nd.dot(dm, Wxh, transpose_b=True)
+        dprev_h = dh * z + dr_h * r + mx.nd.dot(da, Wh, transpose_b=True)
+        return [dx, dprev_h, mx.nd.dot(x, da, transpose_a=True),
+                mx.nd.dot(prev_h, da, transpose_a=True), mx.nd.sum(da, axis=0),
+                mx.nd.dot(x, dm, transpose_a=True), mx.nd.dot(r_h, dm, transpose_a=True),
+                mx.nd.sum(dm, axis=0)]
+    return grad
+
+
+def _rnn_temporal(x, h0, Wx, Wh, b, bptt=None):
+    """Vanilla RNN over a sequence. Returns hidden states of shape (N, T, H)."""
+    # pylint: disable=unused-argument
+    N, T, _ = x.shape
+    H = h0.shape[1]
+    xw = mx.nd.broadcast_add(_time_major_product(x, Wx), b.reshape((1, 1, H)))
+    h = mx.nd.empty((T, N, H), ctx=x.context, dtype=xw.dtype)
+    prev_h = h0
+    for t in range(T):
+        prev_h = mx.nd.tanh(xw[t] + mx.nd.dot(prev_h, Wh))
+        h[t] = prev_h
+    return mx.nd.transpose(h, axes=(1, 0, 2))
+
+
+def _rnn_temporal_grad(ans, x, h0, Wx, Wh, b, bptt=None):
+    """Gradient of all arguments of `_rnn_temporal`."""
+    # pylint: disable=unused-argument
+    def grad(g):  # pylint: disable=missing-docstring
+        N, T, D = x.shape
+        H = h0.shape[1]
+        h = mx.nd.transpose(ans, axes=(1, 0, 2))
+        g = mx.nd.transpose(g, axes=(1, 0, 2))
+        da = mx.nd.empty((T, N, H), ctx=x.context, dtype=h.dtype)
+        dh_next = mx.nd.zeros((N, H), ctx=x.context, dtype=h.dtype)
+        for t in range(T - 1, -1, -1):
+            da_t = (g[t] + dh_next) * (1 - mx.nd.square(h[t]))
+            da[t] = da_t
+            if t > 0 and _cut(t, bptt):
+                dh_next = mx.nd.zeros((N, H), ctx=x.context, dtype=h.dtype)
+            else:
+                dh_next = mx.nd.dot(da_t, Wh, transpose_b=True)
+        prev_h = mx.nd.concat(h0.reshape((1, N, H)), h[:T - 1], dim=0).reshape((T * N, H))
+        x_flat = mx.nd.transpose(x, axes=(1, 0, 2)).reshape((T * N, D))
+        da_flat = da.reshape((T * N, H))
+        dx = mx.nd.transpose(mx.nd.dot(da_flat, Wx, transpose_b=True).reshape((T, N, D)),
+                             axes=(1, 0, 2))
+        return [dx, dh_next, mx.nd.dot(x_flat, da_flat, transpose_a=True),
+                mx.nd.dot(prev_h, da_flat, transpose_a=True), mx.nd.sum(da_flat, axis=0)]
+    return grad
+
+
+def _lstm_temporal(x, h0, Wx, Wh, b, bptt=None):
+    """LSTM over a sequence with zero initial cell state. Returns hidden states of
+    shape (N, T, H)."""
+    # pylint: disable=unused-argument
+    N, T, _ = x.shape
+    H = h0.shape[1]
+    xw = mx.nd.broadcast_add(_time_major_product(x, Wx), b.reshape((1, 1, 4 * H)))
+    h = mx.nd.empty((T, N, H), ctx=x.context, dtype=xw.dtype)
+    prev_h = h0
+    c = mx.nd.zeros((N, H), ctx=x.context, dtype=xw.dtype)
+    for t in range(T):
+        a = xw[t] + mx.nd.dot(prev_h, Wh)
+        i, f, o, g = _split(a, H, 4)
+        c = mx.nd.sigmoid(f) * c + mx.nd.sigmoid(i) * mx.nd.tanh(g)
+        prev_h = mx.nd.sigmoid(o) * mx.nd.tanh(c)
+        h[t] = prev_h
+    return mx.nd.transpose(h, axes=(1, 0, 2))
+
+
+def _lstm_temporal_grad(ans, x, h0, Wx, Wh, b, bptt=None):
+    """Gradient of all arguments of `_lstm_temporal`."""
+    # pylint: disable=unused-argument
+    def grad(g):  # pylint: disable=missing-docstring
+        N, T, D = x.shape
+        H = h0.shape[1]
+        ctx = x.context
+        h = mx.nd.transpose(ans, axes=(1, 0, 2))
+        g = mx.nd.transpose(g, axes=(1, 0, 2))
+        x_flat = mx.nd.transpose(x, axes=(1, 0, 2)).reshape((T * N, D))
+        prev_h = mx.nd.concat(h0.reshape((1, N, H)), h[:T - 1], dim=0).reshape((T * N, H))
+        # Gates are recomputed from the hidden states in two batched products.
+        a = (mx.nd.dot(x_flat, Wx) + mx.nd.dot(prev_h, Wh)).reshape((T, N, 4 * H))
+        a = mx.nd.broadcast_add(a, b.reshape((1, 1, 4 * H)))
+        i, f, o, gg = [mx.nd.slice_axis(a, axis=2, begin=k * H, end=(k + 1) * H)
+                       for k in range(4)]
+        i, f, o, gg = mx.nd.sigmoid(i), mx.nd.sigmoid(f), mx.nd.sigmoid(o), mx.nd.tanh(gg)
+        c = mx.nd.empty((T, N, H), ctx=ctx, dtype=h.dtype)
+        prev_c = mx.nd.zeros((N, H), ctx=ctx, dtype=h.dtype)
+        for t in range(T):
+            prev_c = f[t] * prev_c + i[t] * gg[t]
+            c[t] = prev_c
+        tanh_c = mx.nd.tanh(c)
+
+        da = mx.nd.empty((T, N, 4 * H), ctx=ctx, dtype=h.dtype)
+        dh_next = mx.nd.zeros((N, H), ctx=ctx, dtype=h.dtype)
+        dc_next = mx.nd.zeros((N, H), ctx=ctx, dtype=h.dtype)
+        for t in range(T - 1, -1, -1):
+            i_t, f_t, o_t, g_t = i[t], f[t], o[t], gg[t]
+            dh = g[t] + dh_next
+            dc = dc_next + dh * o_t * (1 - mx.nd.square(tanh_c[t]))
+            df = dc * c[t - 1] * f_t * (1 - f_t) if t > 0 else mx.nd.zeros_like(dc)
+            da_t = mx.nd.concat(dc * g_t * i_t * (1 - i_t), df,
+                                dh * tanh_c[t] * o_t * (1 - o_t),
+                                dc * i_t * (1 - mx.nd.square(g_t)), dim=1)
+            da[t] = da_t
+            if t > 0 and _cut(t, bptt):
+                dh_next = mx.nd.zeros((N, H), ctx=ctx, dtype=h.dtype)
+                dc_next = mx.nd.zeros((N, H), ctx=ctx, dtype=h.dtype)
+            else:
+                dh_next = mx.nd.dot(da_t, Wh, transpose_b=True)
+                dc_next = dc * f_t
+        da_flat = da.reshape((T * N, 4 * H))
+        dx = mx.nd.transpose(mx.nd.dot(da_flat, Wx, transpose_b=True).reshape((T, N, D)),
+                             axes=(1, 0, 2))
+        return [dx, dh_next, mx.nd.dot(x_flat, da_flat, transpose_a=True),
+                mx.nd.dot(prev_h, da_flat, transpose_a=True), mx.nd.sum(da_flat, axis=0)]
+    return grad
+
+
+def register_primitives(reg, prim_wrapper):
+    """Register fused recurrent primitives."""
+    reg.register('lstm_step', prim_wrapper(_lstm_step))
+    reg.register('gru_step', prim_wrapper(_gru_step))
+    reg.register('rnn_temporal', prim_wrapper(_rnn_temporal))
+    reg.register('lstm_temporal', prim_wrapper(_lstm_temporal))
+
+
+def def_grads(prims):
+    """Define gradient functions of fused recurrent primitives."""
+    prims('lstm_step').def_multiple_grad(_lstm_step_grad, (0, 1, 2, 3, 4, 5))
+    prims('gru_step').def_multiple_grad(_gru_step_grad, (0, 1, 2, 3, 4, 5, 6, 7))
+    prims('rnn_temporal').def_multiple_grad(_rnn_temporal_grad, (0, 1, 2, 3, 4))
+    prims('lstm_temporal').def_multiple_grad(_lstm_temporal_grad, (0, 1, 2, 3, 4))
@@ -2,11 +2,12 @@
 # -*- coding: utf-8 -*-
 # pylint: disable=cell-var-from-loop
 """Wrapper for MXNet namespace."""
+import functools
 import inspect
 
 
 def wrap_namespace(nspace, reg, prim_wrapper):
-    """Register all functions in a given namespace in the primitive registry.
+    """Register all functions in a given namespace in the primitive registry, lazily.
 
     :param nspace: Namespace from which functions are to be registered.
     :param reg: Primitive registry.
@@ -14,5 +15,5 @@ def wrap_namespace(nspace, reg, prim_wrapper):
     """
     for name, obj in nspace.items():
         if inspect.isroutine(obj):
-            prim = prim_wrapper(obj)
-            reg.register(name, prim)
+            # Primitives are created on first use.
+            reg.register_lazy(name, functools.partial(prim_wrapper, obj))
@@ -9,6 +9,7 @@ import operator
 
 import numpy as np
 
+from minpy.array_variants.numpy import numpy_rnn
 from minpy.array_variants.numpy import numpy_wrapper
 
 def _identity(x):
@@ -216,6 +217,7 @@ def register_primitives(reg, prim_wrapper):
     reg.register('sigmoid', prim_wrapper(_sigmoid))
     reg.register('onehot_encode', prim_wrapper(_onehot_encode))
     reg.register('softmax_output', prim_wrapper(_softmax_output))
+    numpy_rnn.register_primitives(reg, prim_wrapper)
 
 
 def def_grads(prims):
@@ -302,3 +304,4 @@ def def_grads(prims):
         lambda ans, x, axis: lambda g: np.reshape(g, x.shape))
     prims('sigmoid').def_grad(lambda ans, x: lambda g: g * ans * (1 - ans))
     prims('softmax_output').def_grad(_softmax_output_grad)
+    numpy_rnn.def_grads(prims)
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=invalid-name, too-many-arguments, too-many-locals
+"""Fused recurrent layers for numpy implementation.
+
+Single steps of LSTM and GRU are one primitive each. Besides the next states they
+return their gate activations, which the gradient function reuses.
+
+For whole sequences, forward writes hidden states into one preallocated buffer, and the
+gradient of all arguments is computed by a single reverse loop over time. Both work on
+time-major buffers so that each step reads and writes contiguous memory.
+"""
+from __future__ import absolute_import
+from __future__ import division
+
+import numpy as np
+
+
+def _sigmoid(x):
+    """Logistic sigmoid."""
+    return 0.5 * (np.tanh(0.5 * x) + 1)
+
+
+def _cut(t, bptt):
+    """Return whether gradients stop at the beginning of step `t` (truncated BPTT)."""
+    return bptt is not None and t % bptt == 0
+
+
+def _rnn_temporal(x, h0, Wx, Wh, b, bptt=None):
+    """Vanilla RNN over a sequence. Returns hidden states of shape (N, T, H)."""
+    # pylint: disable=unused-argument
+    N, T, _ = x.shape
+    H = h0.shape[1]
+    # Input projections of all steps in one product.
+    xw = np.dot(x.transpose(1, 0, 2).reshape(T * N, -1), Wx).reshape(T, N, H) + b
+    h = np.empty((T, N, H), dtype=xw.dtype)
+    prev_h = h0
+    for t in range(T):
+        prev_h = h[t] = np.tanh(xw[t] + np.dot(prev_h, Wh))
+    return h.transpose(1, 0, 2)
+
+
+def _rnn_temporal_grad(ans, x, h0, Wx, Wh, b, bptt=None):
+    """Gradient of all arguments of `_rnn_temporal`."""
+    # pylint: disable=unused-argument
+    def grad(g):  # pylint: disable=missing-docstring
+        N, T, D = x.shape
+        H = h0.shape[1]
+        h = ans.transpose(1, 0, 2)
+        g = g.transpose(1, 0, 2)
+        da = np.empty((T, N, H), dtype=h.dtype)
+        dh_next = np.zeros((N, H), dtype=h.dtype)
+        for t in range(T - 1, -1, -1):
+            da[t] = (g[t] + dh_next) * (1 - h[t]**2)
+            if t > 0 and _cut(t, bptt):
+                dh_next[...] = 0
+            else:
+                dh_next = np.dot(da[t], Wh.T)
+        prev_h = np.concatenate([h0[np.newaxis], h[:-1]]).reshape(T * N, H)
+        x_flat = x.transpose(1, 0, 2).reshape(T * N, D)
+        da_flat = da.reshape(T * N, H)
+        dx = np.dot(da_flat, Wx.T).reshape(T, N, D).transpose(1, 0, 2)
+        return [dx, dh_next, np.dot(x_flat.T, da_flat), np.dot(prev_h.T, da_flat),
+                da_flat.sum(axis=0)]
+    return grad
+
+
+def _lstm_gates(x, prev_h, Wx, Wh, b):
+    """Gate activations of all steps given the hidden states they were computed from."""
+    T, N, D = x.shape
+    H = Wh.shape[0]
+    a = (np.dot(x.reshape(T * N, D), Wx) + np.dot(prev_h.reshape(T * N, H), Wh) +
+         b).reshape(T, N, 4 * H)
+    return (_sigmoid(a[:, :, :3 * H]), np.tanh(a[:, :, 3 * H:]))
+
+
+def _lstm_step(x, prev_h, prev_c, Wx, Wh, b):
+    """LSTM step. Returns next hidden and cell states, and the activations of the
+    i, f, o and g gates of shape (N, 4H)."""
+    H = prev_h.shape[1]
+    a = np.dot(x, Wx) + np.dot(prev_h, Wh) + b
+    a[:, :3 * H] = _sigmoid(a[:, :3 * H])
+    a[:, 3 * H:] = np.tanh(a[:, 3 * H:])
+    next_c = a[:, H:2 * H] * prev_c + a[:, :H] * a[:, 3 * H:]
+    next_h = a[:, 2 * H:3 * H] * np.tanh(next_c)
+    return next_h, next_c, a
+
+
+def _lstm_step_grad(ans, x, prev_h, prev_c, Wx, Wh, b):
+    """Gradient of all arguments of `_lstm_step`."""
+    # pylint: disable=unused-argument
+    _, next_c, gates = ans
+    def grad(g):  # pylint: disable=missing-docstring
+        dh, dc, _ = g
+        H = prev_h.shape[1]
+        i, f, o, gg = (gates[:, :H], gates[:, H:2 * H], gates[:, 2 * H:3 * H],
+                       gates[:, 3 * H:])
+        tanh_c = np.tanh(next_c)
+        dc = dc + dh * o * (1 - tanh_c**2)
+        da = np.concatenate([dc * gg * i * (1 - i), dc * prev_c * f * (1 - f),
+                             dh * tanh_c * o * (1 - o), dc * i * (1 - gg**2)], axis=1)
+        return [np.dot(da, Wx.T), np.dot(da, Wh.T), dc * f, np.dot(x.T, da),
+                np.dot(prev_h.T, da), da.sum(axis=0)]
+    return grad
+
+
+def _gru_step(x, prev_h, Wx, Wh, b, Wxh, Whh, bh):
+    """GRU step. Returns the next hidden state, and the activations of the r and z
+    gates and of the candidate state, of shape (N, 3H)."""
+    H = prev_h.shape[1]
+    gates = np.empty((x.shape[0], 3 * H), dtype=np.result_type(x, prev_h, Wx))
+    gates[:, :2 * H] = _sigmoid(np.dot(x, Wx) + np.dot(prev_h, Wh) + b)
+    gates[:, 2 * H:] = np.tanh(np.dot(x, Wxh) + np.dot(gates[:, :H] * prev_h, Whh) + bh)
+    z = gates[:, H:2 * H]
+    next_h = z * prev_h + (1 - z) * gates[:, 2 * H:]
+    return next_h, gates
+
+
+def _gru_step_grad(ans, x, prev_h, Wx, Wh, b, Wxh, Whh, bh):
+    """Gradient of all arguments of `_gru_step`."""
+    # pylint: disable=unused-argument
+    gates = ans[1]
+    def grad(g):  # pylint: disable=missing-docstring
+        dh = g[0]
+        H = prev_h.shape[1]
+        r, z, h_m = gates[:, :H], gates[:, H:2 * H], gates[:, 2 * H:]
+        dm = dh * (1 - z) * (1 - h_m**2)
+        r_h = r * prev_h
+        dr_h = np.dot(dm, Whh.T)
+        da = np.concatenate([dr_h * prev_h * r * (1 - r),
+                             dh * (prev_h - h_m) * z * (1 - z)], axis=1)
+        dx = np.dot(da, Wx.T) + np.dot(dm, Wxh.T)
+        dprev_h = dh * z + dr_h * r + np.dot(da, Wh.T)
+        return [dx, dprev_h, np.dot(x.T, da), np.dot(prev_h.T, da), da.sum(axis=0),
+                np.dot(x.T, dm), np.dot(r_h.T, dm), dm.sum(axis=0)]
+    return grad
+
+
+def _lstm_temporal(x, h0, Wx, Wh, b, bptt=None):
+    """LSTM over a sequence with zero initial cell state. Returns hidden states of
+    shape (N, T, H)."""
+    # pylint: disable=unused-argument
+    N, T, _ = x.shape
+    H = h0.shape[1]
+    xw = np.dot(x.transpose(1, 0, 2).reshape(T * N, -1), Wx).reshape(T, N, 4 * H) + b
+    h = np.empty((T, N, H), dtype=xw.dtype)
+    prev_h = h0
+    c = np.zeros((N, H), dtype=xw.dtype)
+    for t in range(T):
+        a = xw[t] + np.dot(prev_h, Wh)
+        ifo = _sigmoid(a[:, :3 * H])
+        c = ifo[:, H:2 * H] * c + ifo[:, :H] * np.tanh(a[:, 3 * H:])
+        prev_h = h[t] = ifo[:, 2 * H:] * np.tanh(c)
+    return h.transpose(1, 0, 2)
+
+
+def _lstm_temporal_grad(ans, x, h0, Wx, Wh, b, bptt=None):
+    """Gradient of all arguments of `_lstm_temporal`."""
+    # pylint: disable=unused-argument
+    def grad(g):  # pylint: disable=missing-docstring
+        N, T, D = x.shape
+        H = h0.shape[1]
+        h = ans.transpose(1, 0, 2)
+        g = g.transpose(1, 0, 2)
+        x_tm = x.transpose(1, 0, 2)
+        prev_h = np.concatenate([h0[np.newaxis], h[:-1]])
+        # Gates are recomputed from the hidden states in two batched products.
+        ifo, gg = _lstm_gates(x_tm, prev_h, Wx, Wh, b)
+        i, f, o = ifo[:, :, :H], ifo[:, :, H:2 * H], ifo[:, :, 2 * H:]
+        c = np.empty((T, N, H), dtype=h.dtype)
+        prev_c = np.zeros((N, H), dtype=h.dtype)
+        for t in range(T):
+            prev_c = c[t] = f[t] * prev_c + i[t] * gg[t]
+        tanh_c = np.tanh(c)
+
+        da = np.empty((T, N, 4 * H), dtype=h.dtype)
+        dh_next = np.zeros((N, H), dtype=h.dtype)
+        dc_next = np.zeros((N, H), dtype=h.dtype)
+        for t in range(T - 1, -1, -1):
+            dh = g[t] + dh_next
+            dc = dc_next + dh * o[t] * (1 - tanh_c[t]**2)
+            prev_c = c[t - 1] if t > 0 else 0
+            da[t, :, :H] = dc * gg[t] * i[t] * (1 - i[t])
+            da[t, :, H:2 * H] = dc * prev_c * f[t] * (1 - f[t])
+            da[t, :, 2 * H:3 * H] = dh * tanh_c[t] * o[t] * (1 - o[t])
+            da[t, :, 3 * H:] = dc * i[t] * (1 - gg[t]**2)
+            if t > 0 and _cut(t, bptt):
+                dh_next[...] = 0
+                dc_next[...] = 0
+            else:
+                dh_next = np.dot(da[t], Wh.T)
+                dc_next = dc * f[t]
+        da_flat = da.reshape(T * N, 4 * H)
+        dx = np.dot(da_flat, Wx.T).reshape(T, N, D).transpose(1, 0, 2)
+        return [dx, dh_next, np.dot(x_tm.reshape(T * N, D).T, da_flat),
+                np.dot(prev_h.reshape(T * N, H).T, da_flat), da_flat.sum(axis=0)]
+    return grad
+
+
+def register_primitives(reg, prim_wrapper):
+    """Register fused recurrent primitives."""
+    reg.register('lstm_step', prim_wrapper(_lstm_step))
+    reg.register('gru_step', prim_wrapper(_gru_step))
+    reg.register('rnn_temporal', prim_wrapper(_rnn_temporal))
+    reg.register('lstm_temporal', prim_wrapper(_lstm_temporal))
+
+
+def def_grads(prims):
+    """Define gradient functions of fused recurrent primitives."""
+    prims('lstm_step').def_multiple_grad(_lstm_step_grad, (0, 1, 2, 3, 4, 5))
+    prims('gru_step').def_multiple_grad(_gru_step_grad, (0, 1, 2, 3, 4, 5, 6, 7))
+    prims('rnn_temporal').def_multiple_grad(_rnn_temporal_grad, (0, 1, 2, 3, 4))
+    prims('lstm_temporal').def_multiple_grad(_lstm_temporal_grad, (0, 1, 2, 3, 4))
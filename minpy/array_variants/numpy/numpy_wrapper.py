@@ -4,12 +4,13 @@
 from __future__ import absolute_import
 from __future__ import print_function
 
+import functools
 import inspect
 import numpy as np
 
 
 def wrap_namespace(nspace, reg, prim_wrapper):
-    """Register all functions in a given namespace in the primitive registry.
+    """Register all functions in a given namespace in the primitive registry, lazily.
 
     :param nspace: Namespace from which functions are to be registered.
     :param reg: Primitive registry.
@@ -17,5 +18,5 @@ def wrap_namespace(nspace, reg, prim_wrapper):
     """
     for name, obj in nspace.items():
         if isinstance(obj, np.ufunc) or inspect.isroutine(obj):
-            prim = prim_wrapper(obj)
-            reg.register(name, prim)
+            # Primitives are created on first use.
+            reg.register_lazy(name, functools.partial(prim_wrapper, obj))
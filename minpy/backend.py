@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable= invalid-name
+"""Loading of array backends.
+
+MXNet is loaded unless NumPy-only mode is selected before minpy is imported, by setting the
+environment variable ``MINPY_POLICY=only_numpy``. In NumPy-only mode, MXNet and the MXNet
+primitives are never imported, the default policy is ``only_numpy``, and features built on
+MXNet raise :class:`BackendError`.
+
+Modules of minpy use ``from .backend import mxnet``, which is None in NumPy-only mode.
+"""
+from __future__ import absolute_import
+
+import importlib
+import os
+
+ENV_POLICY = 'MINPY_POLICY'
+
+
+class BackendError(RuntimeError):
+    """Error class for features unavailable with the loaded backends."""
+    pass
+
+
+def _numpy_only():
+    """Return whether NumPy-only mode is selected."""
+    return os.environ.get(ENV_POLICY, '').strip().lower() == 'only_numpy'
+
+
+numpy_only = _numpy_only()
+mxnet = None if numpy_only else importlib.import_module('mxnet')
+
+
+def require_mxnet(feature):
+    """Return the MXNet module, or raise if it is not loaded.
+
+    Parameters
+    ----------
+    feature : str
+        Name of the feature requiring MXNet, for the error message.
+
+    Raises
+    ------
+    BackendError
+        In NumPy-only mode.
+    """
+    if mxnet is None:
+        raise BackendError('{} requires MXNet, which is not loaded since {}=only_numpy'.format(
+            feature, ENV_POLICY))
+    return mxnet
@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable= protected-access
+"""Compile imperative minpy functions into MXNet executors.
+
+The function is traced once per input signature (see :mod:`minpy.trace`). If every
+primitive on the path to the returned array has an MXNet symbol equivalent, the trace is
+turned into one `mxnet.symbol` graph, bound once with `simple_bind`, and later calls run
+forward and backward as a single executor call. Otherwise the function falls back to
+replaying its trace.
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+import collections
+import functools
+import numbers
+import operator
+
+import numpy
+
+from . import array
+from . import core
+from . import trace
+from .array_variants import ArrayType
+from .backend import mxnet, require_mxnet
+from .context import current_context
+from .utils import log
+
+_logger = log.get_logger(__name__)  # pylint: disable= invalid-name
+
+
+class UnsupportedOpError(ValueError):
+    """Error of a traced call without MXNet symbol equivalent."""
+    pass
+
+
+def _is_symbol(obj):
+    """Return whether the object is an MXNet symbol."""
+    return isinstance(obj, mxnet.sym.Symbol)
+
+
+def _binary(broadcast_op, scalar_op):
+    """Convert a binary operator. Scalar operands use the operator overloads of symbols."""
+    def convert(lhs, rhs):  # pylint: disable= missing-docstring
+        if _is_symbol(lhs) and _is_symbol(rhs):
+            return broadcast_op(lhs, rhs)
+        if not _is_symbol(lhs) and not _is_symbol(rhs):
+            raise UnsupportedOpError('no array operand')
+        return scalar_op(lhs, rhs)
+    return convert
+
+
+def _reduce(sym_op):
+    """Convert a reduction."""
+    def convert(x, axis=None, keepdims=False):  # pylint: disable= missing-docstring
+        if axis is None:
+            return sym_op(x)
+        return sym_op(x, axis=axis, keepdims=keepdims)
+    return convert
+
+
+def _dot(lhs, rhs):
+    """Convert matrix product. Only operands that are both symbols are supported."""
+    if not _is_symbol(lhs) or not _is_symbol(rhs):
+        raise UnsupportedOpError('dot with scalar')
+    return mxnet.sym.dot(lhs, rhs)
+
+
+def _transpose(x, axes=None):
+    """Convert transpose."""
+    if axes is None:
+        return mxnet.sym.transpose(x)
+    return mxnet.sym.transpose(x, axes=tuple(axes))
+
+
+def _make_converters():
+    """Return dictionary from primitive names to their conversions into symbols."""
+    return {
+        'add': _binary(mxnet.sym.broadcast_add, operator.add),
+        'subtract': _binary(mxnet.sym.broadcast_sub, operator.sub),
+        'multiply': _binary(mxnet.sym.broadcast_mul, operator.mul),
+        'divide': _binary(mxnet.sym.broadcast_div, operator.truediv),
+        'true_divide': _binary(mxnet.sym.broadcast_div, operator.truediv),
+        'power': _binary(mxnet.sym.broadcast_power, operator.pow),
+        'maximum': _binary(mxnet.sym.broadcast_maximum, mxnet.sym.maximum),
+        'minimum': _binary(mxnet.sym.broadcast_minimum, mxnet.sym.minimum),
+        'negative': operator.neg,
+        'dot': _dot,
+        'transpose': _transpose,
+        'tanh': mxnet.sym.tanh,
+        'exp': mxnet.sym.exp,
+        'log': mxnet.sym.log,
+        'sqrt': mxnet.sym.sqrt,
+        'square': mxnet.sym.square,
+        'abs': mxnet.sym.abs,
+        'sin': mxnet.sym.sin,
+        'cos': mxnet.sym.cos,
+        'sum': _reduce(mxnet.sym.sum),
+        'max': _reduce(mxnet.sym.max),
+        'min': _reduce(mxnet.sym.min),
+    }
+
+# Built on first compile, since MXNet is not loaded in NumPy-only mode.
+_converters = None  # pylint: disable= invalid-name
+
+# Primitives that only change the shape. They are converted to reshape to the traced shape.
+_reshapes = set(['reshape', 'expand_dims', 'squeeze', 'ravel'])  # pylint: disable= invalid-name
+
+
+def _input_name(index):
+    """Return name of the symbol variable of an input."""
+    return 'input%d' % index
+
+
+def _convert_const(val):
+    """Convert constant argument of a primitive."""
+    if isinstance(val, numpy.generic):
+        val = val.item()
+    if val is None or isinstance(val, (numbers.Number, tuple)):
+        return val
+    raise UnsupportedOpError('constant argument of type %s' % type(val).__name__)
+
+
+def compile_trace(recorded, inputs):
+    """Convert a trace into an MXNet symbol.
+
+    Parameters
+    ----------
+    recorded : trace.Trace
+        A replayable trace.
+    inputs : tuple
+        Inputs the trace was recorded on.
+
+    Returns
+    -------
+    mxnet.symbol.Symbol
+        Symbol computing the traced result. Its variables are named by :func:`_input_name`.
+
+    Raises
+    ------
+    UnsupportedOpError
+        The result depends on a call that could not be converted.
+    """
+    # pylint: disable= too-many-locals, too-many-branches, global-statement
+    global _converters
+    if _converters is None:
+        _converters = _make_converters()
+    registry = array.Value._ns.__registry__
+    variables = {}
+    values = []
+
+    def resolve(ref):
+        """Return symbol or constant of a reference."""
+        kind, val = ref
+        if kind == trace.INPUT:
+            if not isinstance(inputs[val], array.Array):
+                raise UnsupportedOpError('non-array input')
+            if val not in variables:
+                variables[val] = mxnet.sym.Variable(_input_name(val))
+            return variables[val]
+        elif kind == trace.VALUE:
+            if isinstance(values[val], UnsupportedOpError):
+                raise values[val]
+            return values[val]
+        elif kind == trace.LIST:
+            raise UnsupportedOpError('list argument')
+        return _convert_const(val)
+
+    for call in recorded.calls:
+        num_results = 1 if call.num_results is None else call.num_results
+        prim = call.prim
+        name = registry.name_of(prim) or prim.__name__
+        try:
+            if prim._mutate_args or prim._mutate_kw:
+                # Later uses of mutated values could not be expressed by the graph.
+                for ref in ([call.args[i] for i in prim._mutate_args] +
+                            [ref for key, ref in call.kwargs if key in prim._mutate_kw]):
+                    if ref[0] == trace.INPUT:
+                        raise UnsupportedOpError('input mutated by "%s"' % name)
+                    if ref[0] == trace.VALUE:
+                        values[ref[1]] = UnsupportedOpError(
+                            'value mutated by "%s"' % name)
+                raise UnsupportedOpError('"%s" mutates its arguments' % name)
+            if num_results != 1:
+                raise UnsupportedOpError('"%s" has multiple results' % name)
+            args = [resolve(ref) for ref in call.args]
+            kwargs = {key: resolve(ref) for key, ref in call.kwargs}
+            if name in _reshapes:
+                shape = recorded.shapes[len(values)]
+                sym = mxnet.sym.reshape(args[0], shape=shape)
+            elif name in _converters:
+                sym = _converters[name](*args, **kwargs)
+            else:
+                raise UnsupportedOpError('no MXNet symbol for "%s"' % name)
+        except (UnsupportedOpError, TypeError) as err:
+            sym = UnsupportedOpError(str(err))
+        values.extend([sym] * num_results)
+
+    if recorded.result[0] != trace.VALUE:
+        raise UnsupportedOpError('result is not computed by a single primitive')
+    result = resolve(recorded.result)
+    _check_shapes(recorded, values, inputs)
+    return result
+
+
+def _check_shapes(recorded, values, inputs):
+    """Make sure converted symbols compute arrays of the traced shapes."""
+    slots = [i for i, sym in enumerate(values) if _is_symbol(sym)]
+    group = mxnet.sym.Group([values[i] for i in slots])
+    shapes = {_input_name(i): inp.shape for i, inp in enumerate(inputs)
+              if isinstance(inp, array.Array)}
+    shapes = {name: shapes[name] for name in group.list_arguments()}
+    try:
+        _, out_shapes, _ = group.infer_shape(**shapes)
+    except mxnet.base.MXNetError as err:
+        raise UnsupportedOpError('shape inference failed: %s' % err)
+    for slot, out_shape in zip(slots, out_shapes):
+        expected = recorded.shapes[slot]
+        if expected is None or expected == ():
+            expected = (1, )
+        if tuple(out_shape) != tuple(expected):
+            raise UnsupportedOpError('shape %s differs from traced shape %s' %
+                                     (tuple(out_shape), tuple(expected)))
+
+
+class CompiledFunction(object):
+    """Forward and backward of a traced function as one bound MXNet executor.
+
+    Parameters
+    ----------
+    symbol : mxnet.symbol.Symbol
+        Symbol returned by :func:`compile_trace`.
+    inputs : tuple
+        Inputs the function was traced on.
+    argnums : list
+        Indices of inputs to compute gradients for.
+    scalar_result : bool
+        Whether the traced function returns a number instead of an array.
+    """
+    # pylint: disable= too-few-public-methods
+
+    def __init__(self, symbol, inputs, argnums, scalar_result):
+        ctx = current_context().as_mxnet_context()
+        arg_names = symbol.list_arguments()
+        self._bound = [(i, _input_name(i)) for i in range(len(inputs))
+                       if _input_name(i) in arg_names]
+        shapes = {name: inputs[i].shape for i, name in self._bound}
+        types = {name: inputs[i].dtype for i, name in self._bound}
+        grad_req = {name: 'write' if i in argnums else 'null'
+                    for i, name in self._bound}
+        with core._binding(tuple(grad_req.values())):
+            self._executor = symbol.simple_bind(
+                ctx, grad_req=grad_req, type_dict=types, **shapes)
+        output = self._executor.outputs[0]
+        self._head_grad = mxnet.nd.ones(output.shape, ctx, dtype=output.dtype)
+        self._argnums = argnums
+        self._scalar_result = scalar_result
+        self._ctx = ctx
+
+    def __call__(self, inputs):
+        executor = self._executor
+        for i, name in self._bound:
+            executor.arg_dict[name][:] = inputs[i].get_data(ArrayType.MXNET)
+        executor.forward(is_train=True)
+        executor.backward(out_grads=[self._head_grad])
+        # Buffers of the executor are overwritten by the next call.
+        grad_vals = []
+        for i in self._argnums:
+            name = _input_name(i)
+            if name in executor.grad_dict:
+                grad_vals.append(array.wrap(executor.grad_dict[name].copy()))
+            else:
+                grad_vals.append(array.wrap(mxnet.nd.zeros(
+                    inputs[i].shape, self._ctx, dtype=inputs[i].dtype)))
+        if self._scalar_result:
+            result = array.wrap(executor.outputs[0].asnumpy()[0])
+        else:
+            result = array.wrap(executor.outputs[0].copy())
+        grad_vals = tuple(grad_vals)
+        if len(grad_vals) == 1:
+            grad_vals = grad_vals[0]
+        return grad_vals, result
+
+
+def grad_and_loss(func, argnum=0):
+    """Return function that computes both gradient and loss value with a compiled executor.
+
+    Behaves like :func:`minpy.core.grad_and_loss`. The first call of each input signature
+    runs `func` as usual while tracing it, and tries to compile the trace. Later calls of
+    that signature run the compiled executor, or replay the trace if it could not be
+    compiled.
+
+    Parameters
+    ----------
+    func
+        The forward (loss) function.
+    argnum
+        The index of argument to calculate gradient for.
+
+    Returns
+    -------
+    function
+        A function that would compute both the gradient of the specified argument and loss
+        value. Its `compiled` attribute maps signatures to :class:`CompiledFunction`, or to
+        None if the signature could not be compiled. Like the cache of traces, it keeps
+        the most recently used signatures only.
+
+    Raises
+    ------
+    BackendError
+        In NumPy-only mode.
+    """
+    require_mxnet('compile')
+    replayed = core.grad_and_loss(func, argnum, replay=True)
+    argnums = [argnum] if isinstance(argnum, int) else list(argnum)
+    capacity = replayed.trace_cache._capacity
+    compiled = collections.OrderedDict()
+
+    @functools.wraps(func)
+    def wrapped(*args):
+        """Wrapped function."""
+        arrays = tuple(array.wrap(a) for a in args)
+        sig = trace.signature(arrays)
+        if sig in compiled:
+            compiled_func = compiled.pop(sig)
+            compiled[sig] = compiled_func
+            if compiled_func is not None:
+                return compiled_func(arrays)
+        grad_vals, result = replayed(*arrays)
+        if sig is not None and sig not in compiled:
+            compiled[sig] = _compile(replayed.trace_cache.get(sig), arrays,
+                                     argnums, result)
+            while len(compiled) > capacity:
+                compiled.popitem(last=False)
+        return grad_vals, result
+
+    wrapped.compiled = compiled
+    wrapped.trace_cache = replayed.trace_cache
+    return wrapped
+
+
+def _compile(recorded, inputs, argnums, result):
+    """Compile trace of the given inputs, or return None if it is not possible."""
+    if recorded is None or not isinstance(result, array.Value):
+        return None
+    try:
+        symbol = compile_trace(recorded, inputs)
+    except UnsupportedOpError as err:
+        _logger.info('Could not compile trace of %d calls: %s.', len(recorded), err)
+        return None
+    _logger.info('Compiled trace of %d calls.', len(recorded))
+    return CompiledFunction(symbol, inputs, argnums, isinstance(result, array.Number))
@@ -4,8 +4,7 @@
 """Context management API of minpy."""
 from __future__ import absolute_import
 
-import mxnet
-
+from .backend import mxnet, require_mxnet
 from .utils import log
 
 # pylint: disable= invalid-name
@@ -52,8 +51,9 @@ class Context(object):
         else:
             self.device_typeid = Context.devstr2type[device_type]
             self.device_id = device_id
-        self._mxnet_context = mxnet.Context(self.devtype2str[self.device_typeid],
-                                            self.device_id)
+        # Without MXNet, a context only records the device.
+        self._mxnet_context = None if mxnet is None else mxnet.Context(
+            self.devtype2str[self.device_typeid], self.device_id)
         self._old_ctx = None
 
     @property
@@ -79,6 +79,8 @@ class Context(object):
 
     def as_mxnet_context(self):
         """Get MXNet context."""
+        if self._mxnet_context is None:
+            require_mxnet('MXNet context')
         _logger.debug('Getting MXNet context with typeid "{}" and id "{}"'.
                       format(self.device_typeid, self.device_id))
         return self._mxnet_context
@@ -5,19 +5,28 @@
 from __future__ import absolute_import
 from __future__ import print_function
 
+import collections
+import contextlib
 import functools
+import os
+import threading
+import weakref
+
+import numpy
 
 from .array_variants import ArrayType
+from .backend import mxnet, require_mxnet
 from .context import current_context
 from .primitive import Primitive
 from .utils import log
 from . import tape
+from . import trace
 from . import array
 
 _logger = log.get_logger(__name__)
 
 
-def grad_and_loss(func, argnum=0):
+def grad_and_loss(func, argnum=0, replay=False):
     """Return function that computes both gradient and loss value.
 
     Parameters
@@ -26,12 +35,21 @@ def grad_and_loss(func, argnum=0):
         The forward (loss) function.
     argnum
         The index of argument to calculate gradient for.
+    replay : bool
+        If True, trace the primitives called by `func` on the first call of each input
+        signature (shapes and dtypes of array arguments, values of other arguments) and
+        replay the trace on later calls instead of running `func` again. `func` should
+        only use its array arguments through MinPy operations and compute the same graph
+        for the same signature. Functions that could not be traced silently run as
+        usual. See :mod:`minpy.trace`.
 
     Returns
     -------
     function
         A function that would compute both the gradient of the specified argument and loss value.
+        If `replay` is True, the cache of traces is available as its `trace_cache` attribute.
     """
+    traces = trace.TraceCache() if replay else None
 
     @functools.wraps(func)
     def wrapped(*args):
@@ -42,7 +60,10 @@ def grad_and_loss(func, argnum=0):
             current_tape.start_recording()
             for i in argnums:
                 arrays[i].mark_for_bp(current_tape)
-            result = func(*arrays)
+            if traces is not None:
+                result = traces(func, arrays, current_tape)
+            else:
+                result = func(*arrays)
             current_tape.stop_recording()
             # Wrap result value.
             # TODO(minjie): Also wait for result value to be finished. This prevents
@@ -63,10 +84,11 @@ def grad_and_loss(func, argnum=0):
                 grad_vals = grad_vals[0]
         return grad_vals, result
 
+    wrapped.trace_cache = traces
     return wrapped
 
 
-def grad(func, argnum=0):
+def grad(func, argnum=0, replay=False):
     """Return function that contains gradient calculation.
 
     Parameters
@@ -75,12 +97,14 @@ def grad(func, argnum=0):
         The forward (loss) function.
     argnum
         The index of argument to calculate gradient for.
+    replay : bool
+        Whether to replay traces of `func`, see :func:`grad_and_loss`.
 
     Returns
     -------
     A function that would compute the gradient of the specified argument.
     """
-    grad_with_loss_func = grad_and_loss(func, argnum)
+    grad_with_loss_func = grad_and_loss(func, argnum, replay)
     # pylint: disable= missing-docstring
     @functools.wraps(grad_with_loss_func)
     def wrapped(*args):
@@ -95,10 +119,90 @@ class MXNetSymbolError(ValueError):
     pass
 
 
+ExecutorCacheInfo = collections.namedtuple(
+    'ExecutorCacheInfo', ['hits', 'misses', 'evictions', 'size'])
+
+
+class _CachedExecutor(object):
+    """Executor bound by `Function`, together with its primitive and lease.
+
+    Executors created by reshaping another one share memory with it and belong to
+    the same family. Only one executor of a family could be in use at a time: it is
+    leased from the forward until its gradient function has run, or until a new tape
+    is created.
+    """
+    # pylint: disable= too-few-public-methods
+    __slots__ = ['executor', 'family', 'prim', 'aux_states']
+
+    def __init__(self, executor, family):
+        self.executor = executor
+        # One element list holding the timestamp of the tape that leases the family.
+        self.family = family
+        self.prim = None
+        self.aux_states = None
+
+    def is_free(self):
+        """Return whether the executor could be used."""
+        lease = self.family[0]
+        return lease is None or lease != tape.Tape.timestamp
+
+    def lease(self):
+        """Lease the executor until its gradient function is called."""
+        self.family[0] = tape.Tape.timestamp
+
+    def release(self):
+        """Release the executor."""
+        self.family[0] = None
+
+
+_SUBGRAPH_BACKEND = 'MXNET_SUBGRAPH_BACKEND'
+# Held while executors are bound, since the subgraph backend is process-wide state.
+_bind_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _binding(grad_req):
+    """Context of binding executors with the given grad_req.
+
+    Executors needing no gradient are bound for inference, where the subgraph backend of
+    MXNet (e.g. MKLDNN) may cache parameters as constants. It is disabled for them, since
+    parameters change between calls. MXNet only reads the backend from the environment,
+    so binds of all threads are serialized while it is changed.
+    """
+    with _bind_lock:
+        if 'write' in grad_req:
+            yield
+            return
+        previous = os.environ.get(_SUBGRAPH_BACKEND)
+        os.environ[_SUBGRAPH_BACKEND] = 'NONE'
+        try:
+            yield
+        finally:
+            if previous is None:
+                del os.environ[_SUBGRAPH_BACKEND]
+            else:
+                os.environ[_SUBGRAPH_BACKEND] = previous
+
+
+class _BoundArg(object):
+    """Storage of an argument bound directly to all executors of `Function`."""
+    # pylint: disable= too-few-public-methods
+    __slots__ = ['data', 'owner', 'lease', 'source_id']
+
+    def __init__(self, data):
+        self.data = data
+        # Weak reference to the value holding `data` as its MXNet data, if any.
+        self.owner = None
+        # Timestamp of the tape using the storage, and id of the value it was used with.
+        self.lease = None
+        self.source_id = None
+
+
 class Function(object):
     """Container for MXNet symbol"""
 
-    def __init__(self, symbol, input_shapes=None, name='mxnet_symbol'):
+    def __init__(self, symbol, input_shapes=None, name='mxnet_symbol', cache_size=32,
+                 bind_params=None):
         """Construct a differentiable function from MXNet symbol.
 
         There is a known issue with current implementation. If SoftmaxLoss symbol is used, the
@@ -106,16 +210,39 @@ class Function(object):
         is provided during backward, the backward will "magically" run well since the required
         information has already been provided.
 
+        Bound executors are cached by context, input shapes and the arguments that need
+        gradients, and reused by later calls. Executors for new input shapes share the memory
+        of parameters with cached ones.
+
         :param symbol: Target symbol as function output.
         :param input_shapes: A dictionary of input names to input shapes, used for shape inference.
+        :param cache_size: Maximal number of cached executors. Least recently used ones are
+            evicted.
+        :param bind_params: Names of arguments and auxiliary states (usually model parameters)
+            bound directly as executor arrays instead of being copied in on every call. The
+            values passed for them take over the executor arrays as their MXNet data, so
+            updating them in place updates the executors as well.
         :return: A function that could be called (and differentiated) as normal primitive.
         """
+        require_mxnet('Function')
         self._symbol = symbol
         self._is_train = True
         self._input_shapes = input_shapes
         if input_shapes is not None:
             self._infer_shape(input_shapes)
         self._sym_name = name
+        self._arg_names = symbol.list_arguments()
+        self._aux_state_names = symbol.list_auxiliary_states()
+        self._cache_size = cache_size
+        # (context, input shapes, grad_req) -> list of cached executors.
+        self._executors = collections.OrderedDict()
+        self._num_executors = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._bind_names = tuple(bind_params) if bind_params is not None else ()
+        # Name -> _BoundArg, shared by all executors bound directly.
+        self._bound_args = {}
 
     @property
     def is_train(self):
@@ -145,62 +272,208 @@ class Function(object):
         for i, aux_name in enumerate(self._symbol.list_auxiliary_states()):
             self._aux_shapes[aux_name] = aux_shapes[i]
 
-    def _create_prim(self, global_dict):
+    def cache_info(self):
+        """Return statistics of the executor cache.
+
+        Returns
+        -------
+        ExecutorCacheInfo
+            Number of calls reusing an executor, number of calls binding a new one,
+            number of evicted executors, and number of cached executors.
+        """
+        return ExecutorCacheInfo(self._hits, self._misses, self._evictions,
+                                 self._num_executors)
+
+    def clear_cache(self):
+        """Drop all cached executors."""
+        self._executors.clear()
+        self._num_executors = 0
+
+    def _bind(self, dev, shapes, grad_req, direct):
+        """Bind a new executor, sharing memory with a free one of the same grad_req if any."""
+        with _binding(grad_req):
+            if direct:
+                return _CachedExecutor(self._bind_direct(dev, shapes, grad_req), [None])
+            for (other_dev, _, other_grad_req, other_direct), pool in self._executors.items():
+                if other_dev != dev or other_grad_req != grad_req or other_direct:
+                    continue
+                for other in pool:
+                    if other.is_free():
+                        executor = other.executor.reshape(
+                            partial_shaping=True, allow_up_sizing=True, **dict(shapes))
+                        return _CachedExecutor(executor, other.family)
+            executor = self._symbol.simple_bind(
+                dev, grad_req=dict(zip(self._arg_names, grad_req)), **dict(shapes))
+            return _CachedExecutor(executor, [None])
+
+    def _bind_direct(self, dev, shapes, grad_req):
+        """Bind a new executor on the storage of directly bound arguments."""
+        arg_shapes, _, aux_shapes = self._symbol.infer_shape(**dict(shapes))
+        args = [self._bound_args[name].data if name in self._bound_args
+                else mxnet.nd.zeros(shape, dev)
+                for name, shape in zip(self._arg_names, arg_shapes)]
+        args_grad = [mxnet.nd.zeros(shape, dev) if req == 'write' else None
+                     for shape, req in zip(arg_shapes, grad_req)]
+        aux_states = [self._bound_args[name].data if name in self._bound_args
+                      else mxnet.nd.zeros(shape, dev)
+                      for name, shape in zip(self._aux_state_names, aux_shapes)]
+        return self._symbol.bind(dev, args, args_grad=args_grad, grad_req=list(grad_req),
+                                 aux_states=aux_states)
+
+    def _prepare_bound_args(self, kwargs, need_bp):
+        """Prepare storage of directly bound arguments for this call.
+
+        The storage of each argument is private to the function and becomes the MXNet data
+        of the value passed for it. A value passed in place of the previous one is copied
+        in, after the previous one is given its own copy. Return False if the storage could
+        not be used, e.g. the arguments are not float32 MXNet arrays on the current context,
+        or the storage is used with other values in the same forward.
+        """
+        if len(self._bind_names) == 0:
+            return False
+        dev = current_context().as_mxnet_context()
+        prepared = []
+        for name in self._bind_names:
+            value = kwargs.get(name)
+            if not isinstance(value, array.Array):
+                return False
+            raw = value.get_data(ArrayType.MXNET)
+            if raw.context != dev or raw.dtype != numpy.float32:
+                return False
+            bound = self._bound_args.get(name)
+            if bound is not None and (bound.lease == tape.Tape.timestamp and
+                                      bound.source_id != value.id):
+                return False
+            prepared.append((name, value, raw, bound))
+        for name, value, raw, bound in prepared:
+            if bound is None or bound.data.shape != raw.shape or bound.data.context != dev:
+                # The storage is private, it never aliases memory of other values.
+                # Executors bound to the previous storage could not be used anymore.
+                bound = _BoundArg(mxnet.nd.empty(raw.shape, dev, dtype=raw.dtype))
+                self._bound_args[name] = bound
+                self.clear_cache()
+            if raw is not bound.data:
+                # The storage will be overwritten, detach it from its previous owner.
+                owner = bound.owner() if bound.owner is not None else None
+                if (owner is not None and owner is not value and
+                        owner._data.get(ArrayType.MXNET) is bound.data):
+                    owner.release_data(ArrayType.MXNET)
+                # The value takes over the storage, so that its updates in place reach the
+                # executors without a copy.
+                raw.copyto(bound.data)
+                value.adopt_data(bound.data)
+                bound.owner = weakref.ref(value)
+            elif name in self._aux_state_names:
+                # Auxiliary states are updated by the executor behind the value.
+                value.get_data_mutable(ArrayType.MXNET)
+            bound.source_id = value.id
+            if need_bp:
+                bound.lease = tape.Tape.timestamp
+        return True
+
+    def _acquire(self, shapes, grad_req, direct):
+        """Return a free executor for the given input shapes and grad_req."""
         dev = current_context().as_mxnet_context()
-        executor = self._symbol.simple_bind(dev, 'write', **self._input_shapes)
-        arg_names = self._symbol.list_arguments()
-        aux_state_names = self._symbol.list_auxiliary_states()
+        key = (dev, shapes, grad_req, direct)
+        pool = self._executors.pop(key, None)
+        if pool is None:
+            pool = []
+        # Keep the most recently used key at the end.
+        self._executors[key] = pool
+        for cached in pool:
+            if cached.is_free():
+                self._hits += 1
+                return cached
+        self._misses += 1
+        cached = self._bind(dev, shapes, grad_req, direct)
+        cached.prim = self._create_prim(cached)
+        pool.append(cached)
+        self._num_executors += 1
+        while self._num_executors > self._cache_size:
+            # Evicted executors stay alive as long as their gradient functions do.
+            oldest_key = next(iter(self._executors))
+            oldest_pool = self._executors[oldest_key]
+            oldest_pool.pop(0)
+            if len(oldest_pool) == 0:
+                del self._executors[oldest_key]
+            self._num_executors -= 1
+            self._evictions += 1
+        return cached
+
+    def _create_prim(self, cached):
+        executor = cached.executor
+        num_args = len(self._arg_names)
 
         # pylint: disable= missing-docstring
         # Define raw forward function.
         def func(*args):
-            # Set Data & Parameters
-            for arg, executor_arg in zip(args[:len(arg_names)], executor.arg_arrays):
-                if arg is not None:
+            # Set Data & Parameters. Directly bound arguments need no copy.
+            for arg, executor_arg in zip(args[:num_args], executor.arg_arrays):
+                if arg is not None and arg is not executor_arg:
                     arg.copyto(executor_arg)
 
-            for aux, executor_aux in zip(args[len(arg_names):], executor.aux_arrays):
-                if aux is not None:
+            for aux, executor_aux in zip(args[num_args:], executor.aux_arrays):
+                if aux is not None and aux is not executor_aux:
                     aux.copyto(executor_aux)
 
-            # Forward computation.
+            # Forward computation. Outputs are copied since the executor is reused.
             executor.forward(is_train=self._is_train)
-            return tuple(executor.outputs) if len(executor.outputs) > 1 else executor.outputs[0]
+            outputs = [output.copy() for output in executor.outputs]
+            return tuple(outputs) if len(outputs) > 1 else outputs[0]
         # Set function name to be the given symbol name.
         func.__name__ = self._sym_name
 
         # Define gradient function generator.
         def grad_wrapper(ans, *args): # pylint: disable= unused-argument
+            aux_states = cached.aux_states
             def grad_func(g):
                 executor.backward(out_grads=g)
 
-                for aux, executor_aux in zip(global_dict['aux_states'], executor.aux_arrays):
-                    if aux is not None:
+                for aux, executor_aux in zip(aux_states, executor.aux_arrays):
+                    if aux is not None and not (
+                            isinstance(aux, array.Array) and
+                            aux._data.get(ArrayType.MXNET) is executor_aux):
                         aux[:] = executor_aux
 
-                ret = executor.grad_arrays
-                ret += [0] * len(aux_state_names)
+                ret = [(grad.copy() if grad is not None else None)
+                       for grad in executor.grad_arrays]
+                ret += [0] * len(self._aux_state_names)
+                cached.release()
                 return ret
 
             return grad_func
 
         # Create primitives.
         prim = Primitive(func, ArrayType.MXNET)
-        prim.def_multiple_grad(grad_wrapper, tuple(range(len(arg_names) + len(aux_state_names))))
+        prim.def_multiple_grad(
+            grad_wrapper, tuple(range(num_args + len(self._aux_state_names))))
         return prim
         # pylint: enable= missing-docstring
 
     def __call__(self, **kwargs):
         if self._input_shapes is None:
-            self._infer_shape({kv[0]: kv[1].shape for kv in kwargs.items()})
+            self._input_shapes = {name: value.shape for name, value in kwargs.items()}
+            self._infer_shape(self._input_shapes)
         # Remove arguments that are not defined in symbol's argument
         # list.
         ordered_args = [(kwargs[name] if name in kwargs else None)
-                        for name in self._symbol.list_arguments()]
+                        for name in self._arg_names]
         ordered_aux_states = [(kwargs[name] if name in kwargs else None)
-                        for name in self._symbol.list_auxiliary_states()]
-        prim = self._create_prim({'aux_states' : ordered_aux_states})
-        return prim.call(args=ordered_args + ordered_aux_states, kwargs={})
+                              for name in self._aux_state_names]
+        shapes = tuple((name, tuple(arg.shape)) for name, arg in zip(
+            self._arg_names + self._aux_state_names, ordered_args + ordered_aux_states)
+                       if arg is not None)
+        current_tape = tape.global_tape()
+        grad_req = tuple(
+            'write' if isinstance(arg, array.Value) and arg.is_marked_for_bp(current_tape)
+            else 'null' for arg in ordered_args)
+        need_bp = 'write' in grad_req
+        direct = self._prepare_bound_args(kwargs, need_bp)
+        cached = self._acquire(shapes, grad_req, direct)
+        if need_bp:
+            cached.lease()
+        cached.aux_states = ordered_aux_states
+        return cached.prim.call(args=ordered_args + ordered_aux_states, kwargs={})
 
     # pylint: disable= missing-docstring
     def get_params(self):
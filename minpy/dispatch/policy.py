@@ -5,14 +5,18 @@ from __future__ import absolute_import
 from __future__ import print_function
 
 import functools
+import itertools
+import time
 from collections import defaultdict
 import minpy
+from .. import array
 from .. import tape
 from ..array_variants import ArrayType
 from ..utils import log
-from .rule import Blacklist
+from .rule import AutoTuneRules, Blacklist
 
 _logger = log.get_logger(__name__)  # pylint: disable=invalid-name
+_timer = getattr(time, 'perf_counter', time.time)  # pylint: disable=invalid-name
 
 
 class PrimitivePolicyError(ValueError):
@@ -34,12 +38,21 @@ class PrimitivePolicyError(ValueError):
 
 
 class Policy(object):
-    """Policy interface."""
+    """Policy interface.
+
+    Policies whose choice depends on the arguments of each call set `resolve_per_call`, so
+    that modules dispatch every call through :meth:`resolve_call`.
+    """
+    resolve_per_call = False
 
     def __init__(self):
         self._mxnet_op_stat = defaultdict(int)
         self._numpy_op_stat = defaultdict(int)
         self._old_policy = None
+        # Cache of dispatch decisions keyed by call signature.
+        self._dispatch_cache = {}
+        self._dispatch_cache_hits = 0
+        self._dispatch_cache_misses = 0
 
     def decide(self, candidates):
         """Primitive decision policy interface.
@@ -76,18 +89,40 @@ class Policy(object):
         -------
         Result from appropriate function call.
         """
-        available = Policy._available_prims(name, reg, args, kwargs)
-        preference = self.decide(available)
-        if preference == ArrayType.MXNET:
+        key = Policy._dispatch_key(name, reg, args, kwargs)
+        prim = self._dispatch_cache.get(key)
+        if prim is None:
+            self._dispatch_cache_misses += 1
+            available = reg.iter_available_types(name, key[2], key[3])
+            preference = self.decide(available)
+            if preference is None:
+                raise PrimitivePolicyError(name, self.name)
+            prim = reg.get(name, preference)
+            self._dispatch_cache[key] = prim
+            _logger.debug('Found primitive "%s" with type %s.', name,
+                          prim.typestr)
+        else:
+            self._dispatch_cache_hits += 1
+        if prim.type == ArrayType.MXNET:
             self._mxnet_op_stat[name] += 1
-        elif preference == ArrayType.NUMPY:
+        else:
             self._numpy_op_stat[name] += 1
-        elif preference is None:
-            raise PrimitivePolicyError(name, self.name)
-        prim = reg.get(name, preference)
-        _logger.debug('Found primitive "%s" with type %s.', name, prim.typestr)
         return prim.call(args, kwargs)
 
+    def invalidate_dispatch_cache(self):
+        """Drop all cached dispatch decisions.
+
+        It should be called whenever the outcome of :meth:`decide` for a known
+        signature may change, e.g. after rules or registries are modified.
+        """
+        self._dispatch_cache.clear()
+
+    @property
+    def dispatch_cache_stat(self):
+        """Return a tuple of (hits, misses, size) of the dispatch cache."""
+        return (self._dispatch_cache_hits, self._dispatch_cache_misses,
+                len(self._dispatch_cache))
+
     def show_op_stat(self):
         """Print policy dispatch statistics."""
         mxnet_op_cnt = 0
@@ -107,6 +142,10 @@ class Policy(object):
             print('Total Dispatch Proportion: {:.1%} in MXNet, {:.1%} in NumPy'.format(
                 float(mxnet_op_cnt) / total_cnt,
                 float(numpy_op_cnt) / total_cnt))
+        hits, misses, size = self.dispatch_cache_stat
+        if hits + misses > 0:
+            print('Dispatch cache: {} hits, {} misses, {} entries'.format(
+                hits, misses, size))
         print('--------Op Dispatch Statistics End--------')
 
     @property
@@ -129,6 +168,32 @@ class Policy(object):
         available = reg.iter_available_types(name, bp_args, bp_kwargs)
         return available
 
+    @staticmethod
+    def _dispatch_key(name, reg, args, kwargs):
+        """Return the signature of a call used as dispatch cache key.
+
+        The key consists of the registry namespace, the function name, the
+        indices of positional and keyword arguments that need back propagation,
+        and the types of all arguments.
+        """
+        current_tape = tape.global_tape()
+        bp_args = []
+        arg_types = []
+        for i, arg in enumerate(args):
+            arg_types.append(type(arg))
+            if (hasattr(arg, 'is_marked_for_bp') and
+                    arg.is_marked_for_bp(current_tape)):
+                bp_args.append(i)
+        bp_kwargs = []
+        for k in sorted(kwargs):
+            arg = kwargs[k]
+            arg_types.append((k, type(arg)))
+            if (hasattr(arg, 'is_marked_for_bp') and
+                    arg.is_marked_for_bp(current_tape)):
+                bp_kwargs.append(k)
+        return (reg.nspace, name, tuple(bp_args), tuple(bp_kwargs),
+                tuple(arg_types))
+
 
 class AutoBlacklistPolicy(Policy):
     """Automatically dispatch ops to MXNet impl by provided config.
@@ -145,14 +210,19 @@ class AutoBlacklistPolicy(Policy):
         scratch.
     loc : str
         Path to rule configuration file.
+    save_config_atexit : bool
+        Whether to save rules at exit. Defaults to `gen_rule`.
     """
 
     # pylint: disable=abstract-method
+    resolve_per_call = True
 
-    def __init__(self, gen_rule=False, append_rule=True, loc=None):
+    def __init__(self, gen_rule=False, append_rule=True, loc=None, save_config_atexit=None):
         super(AutoBlacklistPolicy, self).__init__()
         self._gen_rule = gen_rule
-        self._rules = Blacklist(loc=loc, save_config_atexit=gen_rule)
+        if save_config_atexit is None:
+            save_config_atexit = gen_rule
+        self._rules = Blacklist(loc=loc, save_config_atexit=save_config_atexit)
         if gen_rule and not append_rule:
             self._rules.reset_rules()
 
@@ -217,6 +287,225 @@ class AutoBlacklistPolicy(Policy):
         return self._rules.query(nspace, name)
 
 
+class AutoTunePolicy(Policy):
+    """Dispatch each op to the implementation measured to be faster.
+
+    During warm-up, calls with the same op name and argument signature (dtypes and shape
+    buckets of arrays) alternate between the available implementations and are timed.
+    The conversion of inputs whose data is not valid in the type of the implementation is
+    timed separately. After `warmup` calls of each implementation, the one with the lower
+    median computation time plus largest conversion time is used for that signature from
+    then on, and its measured speedup is kept with the decision. Decisions are saved to
+    `.minpy_autotune.conf` at exit, alongside `.minpy_rules.conf`, and loaded by later runs.
+
+    Note: different instances of the rule class act as a single singleton.
+
+    Parameters
+    ----------
+    warmup : int
+        Number of timed calls of each implementation before deciding.
+    tune : bool
+        If False, only use loaded decisions and prefer MXNet for signatures not tuned.
+        Otherwise, tune new signatures and save decisions at exit.
+    loc : str
+        Path to decision configuration file.
+    """
+    # pylint: disable=abstract-method
+    resolve_per_call = True
+
+    def __init__(self, warmup=3, tune=True, loc=None):
+        super(AutoTunePolicy, self).__init__()
+        self._warmup = warmup
+        self._tune = tune
+        self._rules = AutoTuneRules(loc=loc, save_config_atexit=tune)
+        # (nspace, name, signature) -> implementation type -> lists of computation and
+        # conversion times of warm-up calls.
+        self._timings = {}
+
+    def resolve_call(self, name, reg, args, kwargs):
+        available = Policy._available_prims(name, reg, args, kwargs)
+        possible_impl = set(x.type for x in available)
+        if len(possible_impl) == 0:
+            raise PrimitivePolicyError(name, self.name)
+        if len(possible_impl) == 1:
+            impl_type = possible_impl.pop()
+        else:
+            key = self._rules.rule_key(args, kwargs)
+            impl_type = self._rules.lookup(name, reg.nspace, key)
+            if impl_type not in possible_impl:
+                if self._tune:
+                    return self._timed_call(name, reg, key, possible_impl, args, kwargs)
+                impl_type = ArrayType.MXNET
+        return self._call(name, reg, impl_type, args, kwargs)
+
+    def _call(self, name, reg, impl_type, args, kwargs):
+        # pylint: disable=too-many-arguments
+        """Call the primitive of the given type."""
+        if impl_type == ArrayType.MXNET:
+            self._mxnet_op_stat[name] += 1
+        else:
+            self._numpy_op_stat[name] += 1
+        return reg.get(name, impl_type).call(args, kwargs)
+
+    def _timed_call(self, name, reg, key, possible_impl, args, kwargs):
+        # pylint: disable=too-many-arguments, too-many-locals
+        """Time a warm-up call with the implementation measured least so far."""
+        timings = self._timings.setdefault((reg.nspace, name, key),
+                                           {t: ([], []) for t in possible_impl})
+        impl_type = min(timings, key=lambda t: (len(timings[t][0]), t))
+        inputs = [arg for arg in itertools.chain(args, kwargs.values())
+                  if isinstance(arg, array.Array)]
+        # Pending computation of inputs is not part of the call.
+        for arg in inputs:
+            arg.wait_to_read()
+        try:
+            start = _timer()
+            for arg in inputs:
+                if not arg.has_valid_data(impl_type):
+                    arg.get_data(impl_type)
+            converted = _timer()
+            result = self._call(name, reg, impl_type, args, kwargs)
+            for res in result if isinstance(result, tuple) else (result,):
+                if isinstance(res, array.Array):
+                    res.wait_to_read()
+            end = _timer()
+        except Exception:  # pylint: disable=broad-except
+            if impl_type != ArrayType.MXNET or ArrayType.NUMPY not in timings:
+                raise
+            _logger.info('Error occurs. Use primitive %s with NumPy implementation', name)
+            del self._timings[(reg.nspace, name, key)]
+            self._rules.add_choice(name, reg.nspace, ArrayType.NUMPY, key)
+            return self._call(name, reg, ArrayType.NUMPY, args, kwargs)
+        computations, conversions = timings[impl_type]
+        computations.append(end - converted)
+        conversions.append(converted - start)
+        if all(len(t[0]) >= self._warmup for t in timings.values()):
+            # Inputs are only converted on the calls that find them where they were
+            # produced, so the largest conversion time is counted with the median
+            # computation time.
+            costs = {t: sorted(comp)[len(comp) // 2] + max(conv)
+                     for t, (comp, conv) in timings.items()}
+            best = min(costs, key=costs.get)
+            speedup = max(costs.values()) / costs[best] if costs[best] > 0 else None
+            del self._timings[(reg.nspace, name, key)]
+            self._rules.add_choice(name, reg.nspace, best, key, speedup)
+        return result
+
+    def save_rules(self):
+        """Save decisions by rule's setting"""
+        self._rules.save_rules_config()
+
+
+class TransferAwarePolicy(Policy):
+    """Dispatch each op to the implementation that needs the least data synchronization.
+
+    Candidates are scored by the bytes of array arguments whose data is not valid in the
+    type of the candidate, i.e. would be copied between NumPy and MXNet before the call.
+    The candidate with the fewest bytes is used, MXNet on ties, so chains of ops stay where
+    their data lives.
+
+    Ops known to be much faster in one implementation are run with it regardless of
+    transfers. They are the ops pinned by `faster`, and the signatures measured by
+    :class:`AutoTunePolicy` (in this run or saved to `.minpy_autotune.conf` by earlier
+    ones) to be at least `min_speedup` times faster in one implementation.
+
+    Parameters
+    ----------
+    faster : dict
+        Op name to the implementation type (`ArrayType`) used regardless of transfers.
+    min_speedup : float
+        Measured speedup from which the faster implementation is used regardless of
+        transfers. None to ignore measured decisions.
+    loc : str
+        Path to the decision configuration file of :class:`AutoTunePolicy`.
+    """
+    # pylint: disable=abstract-method
+    resolve_per_call = True
+
+    def __init__(self, faster=None, min_speedup=2.0, loc=None):
+        super(TransferAwarePolicy, self).__init__()
+        self._faster = dict(faster) if faster else {}
+        self._min_speedup = min_speedup
+        self._tuned = None
+        if min_speedup is not None:
+            # Keep the file of a running auto-tuning policy, as rule instances share it.
+            self._tuned = AutoTuneRules(
+                loc=AutoTuneRules._loc if loc is None else loc)  # pylint: disable=protected-access
+        self.reset_transfer_stat()
+
+    @staticmethod
+    def _transfer_bytes(impl_type, args, kwargs):
+        """Return the number of arrays and bytes to synchronize to call the given type."""
+        count = 0
+        nbytes = 0
+        for arg in itertools.chain(args, kwargs.values()):
+            if isinstance(arg, array.Array) and not arg.has_valid_data(impl_type):
+                count += 1
+                nbytes += arg.nbytes
+        return count, nbytes
+
+    def _much_faster(self, name, reg, possible_impl, args, kwargs):
+        """Return the implementation type known to be much faster, or None."""
+        # pylint: disable=too-many-arguments
+        impl_type = self._faster.get(name)
+        if impl_type in possible_impl:
+            return impl_type
+        if self._tuned is None or len(possible_impl) < 2:
+            return None
+        choice = self._tuned.tuned(name, reg.nspace, self._tuned.rule_key(args, kwargs))
+        if choice is None:
+            return None
+        impl_type, speedup = choice
+        if impl_type in possible_impl and speedup is not None and \
+                speedup >= self._min_speedup:
+            return impl_type
+        return None
+
+    def resolve_call(self, name, reg, args, kwargs):
+        available = Policy._available_prims(name, reg, args, kwargs)
+        possible_impl = set(x.type for x in available)
+        if len(possible_impl) == 0:
+            raise PrimitivePolicyError(name, self.name)
+        transfers = {t: self._transfer_bytes(t, args, kwargs) for t in possible_impl}
+        impl_type = self._much_faster(name, reg, possible_impl, args, kwargs)
+        if impl_type is None:
+            # MXNet wins ties.
+            impl_type = min(possible_impl,
+                            key=lambda t: (transfers[t][1], t != ArrayType.MXNET))
+        count, nbytes = transfers[impl_type]
+        self._transfers += count
+        self._transfer_bytes_total += nbytes
+        other_count, other_bytes = max(transfers.values(), key=lambda c: c[1])
+        self._avoided_transfers += other_count - count
+        self._avoided_bytes += other_bytes - nbytes
+        if impl_type == ArrayType.MXNET:
+            self._mxnet_op_stat[name] += 1
+        else:
+            self._numpy_op_stat[name] += 1
+        return reg.get(name, impl_type).call(args, kwargs)
+
+    @property
+    def transfer_stat(self):
+        """Return a tuple of (transfers, bytes transferred, transfers avoided, bytes avoided).
+
+        Avoided transfers are counted against the candidate with the most bytes to
+        synchronize on each call.
+        """
+        return (self._transfers, self._transfer_bytes_total, self._avoided_transfers,
+                self._avoided_bytes)
+
+    def reset_transfer_stat(self):
+        """Reset transfer counters."""
+        self._transfers = 0
+        self._transfer_bytes_total = 0
+        self._avoided_transfers = 0
+        self._avoided_bytes = 0
+
+    def show_op_stat(self):
+        super(TransferAwarePolicy, self).show_op_stat()
+        print('Transfers: {} ({} bytes), avoided: {} ({} bytes)'.format(*self.transfer_stat))
+
+
 class PreferMXNetPolicy(Policy):
     """ Prefer using MXNet functions. Return None if no required function. """
 
@@ -297,5 +586,9 @@ def create(plc):
         return OnlyNumPyPolicy()
     elif plc == 'only_mxnet':
         return OnlyMXNetPolicy()
+    elif plc == 'auto_tune':
+        return AutoTunePolicy()
+    elif plc == 'transfer_aware':
+        return TransferAwarePolicy()
     else:
         raise TypeError('Unknown policy name %s' % plc)
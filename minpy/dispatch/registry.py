@@ -11,14 +11,43 @@ class PrimitiveRegistryError(ValueError):
     pass
 
 
+class _GradDefinitions(object):
+    """Gradient definitions of a primitive that is not created yet.
+
+    Calls of the `def_*` methods of :class:`minpy.primitive.Primitive` are recorded and
+    replayed on the primitive once it is created.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, method):
+        if not method.startswith('def_'):
+            raise AttributeError(method)
+
+        def record(*args, **kwargs):  # pylint: disable= missing-docstring
+            self.calls.append((method, args, kwargs))
+            return self
+        return record
+
+
 class Registry(object):
     """ Registry for primitives. Primitives with the same name but with different implementation
     type will be registered in the same entry.
+
+    Primitives could also be registered lazily by a factory. The factories of a name are
+    called, and gradient definitions are attached, the first time the name is looked up.
     """
 
     def __init__(self, namespace):
         self._reg = {}
         self._ns = namespace
+        # Name -> factories of primitives not created yet.
+        self._lazy = {}
+        # (Name, type) -> gradient definitions of primitives not created yet.
+        self._grad_defs = {}
+        # Created primitive -> name it is registered under.
+        self._names = {}
 
     @property
     def nspace(self):
@@ -40,6 +69,8 @@ class Registry(object):
         PrimitiveRegistryError
             Type already registered under the same name.
         """
+        # Earlier registrations take precedence, including lazy ones.
+        self._materialize(name)
         if name not in self._reg:
             self._reg[name] = {}
         if prim.type in self._reg[name]:
@@ -49,21 +80,99 @@ class Registry(object):
             _logger.debug('Function "%s" registered with type %s', name,
                           prim.typestr)
             self._reg[name][prim.type] = prim
+            self._names.setdefault(prim, name)
+            grad_defs = self._grad_defs.pop((name, prim.type), None)
+            if grad_defs is not None:
+                for method, args, kwargs in grad_defs.calls:
+                    getattr(prim, method)(*args, **kwargs)
+
+    def register_lazy(self, name, factory):
+        """Register a primitive to be created on first lookup of the name.
+
+        Parameters
+        ----------
+        name : str
+            Name of the primitive.
+        factory
+            Function without arguments returning the primitive.
+        """
+        self._lazy.setdefault(name, []).append(factory)
+
+    def _materialize(self, name):
+        """Create the lazily registered primitives of the name."""
+        factories = self._lazy.pop(name, None)
+        if factories is not None:
+            for factory in factories:
+                self.register(name, factory())
+
+    def grad_definitions(self, name, ptype):
+        """Return the object to define gradients of a primitive on.
+
+        It is the primitive itself if it has been created, otherwise a recorder of the
+        definitions, which are attached to the primitive when it is created.
+
+        Parameters
+        ----------
+        name : str
+            Name of the primitive.
+        ptype : ArrayType
+            Implementation type of the primitive.
+        """
+        if name in self._reg and ptype in self._reg[name]:
+            return self._reg[name][ptype]
+        return self._grad_defs.setdefault((name, ptype), _GradDefinitions())
 
     def has_name(self, name):
         """Return whether the given name has been registered"""
-        return name in self._reg
+        return name in self._reg or name in self._lazy
+
+    def names(self):
+        """Return all registered names."""
+        return set(self._reg) | set(self._lazy)
+
+    def name_of(self, prim):
+        """Return the name a primitive is registered under, or None if it is not registered.
+
+        Lazily registered primitives are not created by the lookup.
+        """
+        return self._names.get(prim)
 
     def exists(self, name, ptype):
         """Return whether primitive exists under the given name and the given implementation type.
         """
+        self._materialize(name)
         return name in self._reg and ptype in self._reg[name]
 
     def get(self, name, ptype):
         """Get the primitive registered under the given name and the given implementation type.
         """
+        self._materialize(name)
         return self._reg[name][ptype]
 
+    def get_all(self, name):
+        """Get primitives of all implementation types registered under the given name.
+
+        Returns
+        -------
+        dict
+            Implementation type to primitive.
+        """
+        self._materialize(name)
+        return self._reg[name]
+
+    def iter_primitives(self):
+        """Iterate over all registered primitives.
+
+        Returns
+        -------
+        Pairs of primitive name and primitive.
+        """
+        for name in list(self._lazy):
+            self._materialize(name)
+        for name, prims in self._reg.items():
+            for prim in prims.values():
+                yield name, prim
+
     def iter_available_types(self, name, bp_args, bp_kwargs):
         """Find primitives of the given name that have gradients defined for the arguments.
 
@@ -81,6 +190,7 @@ class Registry(object):
         Primitives that satisfy the requirements above.
         """
         # Just a redundant check. name must lay in self._reg by mocking.py.
+        self._materialize(name)
         if name not in self._reg:
             return iter([])
         else:
@@ -3,6 +3,7 @@ from __future__ import absolute_import
 from __future__ import print_function
 
 import os
+import sys
 import atexit
 import yaml
 import numpy
@@ -13,6 +14,11 @@ from minpy.utils import log
 
 _logger = log.get_logger(__name__)  # pylint: disable=invalid-name
 
+try:
+    _intern = intern  # pylint: disable=invalid-name
+except NameError:
+    _intern = sys.intern  # pylint: disable=invalid-name
+
 # TODO: integrate this part into normal routine when MXNet fixes exception in
 # Python.
 # Currently MXNet doesn't throw exception raised in mshadow to Python. Avoid
@@ -26,6 +32,10 @@ MXNET_TYPE_COMPATIBLE_OPS = {
 MXNET_BLACKLIST_OPS = {'array'}
 
 
+# Signatures of arrays by number of dimensions.
+_ARRAY_DIM_SIGNATURES = tuple(_intern('array_dim' + str(i)) for i in range(33))
+
+
 class RuleError(ValueError):
     """Error in rule processing"""
     pass
@@ -206,9 +216,8 @@ class Blacklist(Rules):
             else:
                 return True
 
-        if nspace in self._hash and name in self._hash[nspace] and (
-                self._hash[nspace][name] is None or self._get_arg_rule_key(
-                    args, kwargs) in self._hash[nspace][name]):
+        blocked = self._hash.get((nspace, name), False)
+        if blocked is None or (blocked and self._get_arg_rule_key(args, kwargs) in blocked):
             _logger.debug('Rule applies: block by auto-generated rule on %s.',
                           name)
             return False
@@ -231,43 +240,72 @@ class Blacklist(Rules):
 
         self._rules.setdefault(nspace, {})
         self._rules[nspace].setdefault(name, [])
-        self._hash.setdefault(nspace, {})
-        self._hash[nspace].setdefault(name, set())
-        if self._get_arg_rule_key(args,
-                                  kwargs) not in self._hash[nspace][name]:
+        blocked = self._hash.setdefault((nspace, name), set())
+        key = self._get_arg_rule_key(args, kwargs)
+        if blocked is not None and key not in blocked:
             entry = {'args': type_seq(args)}
             if len(kwargs) > 0:
                 entry['kwargs'] = list(kwargs.keys())
             self._rules[nspace][name].append(entry)
-            key = self._get_arg_rule_key(args, kwargs)
-            self._hash[nspace][name].add(key)
+            blocked.add(key)
             _logger.info('New rule %s added.', key)
 
+    @classmethod
+    def merge_rules(cls, rules):
+        """Merge rules, e.g. generated by another process, into current rules.
+
+        Parameters
+        ----------
+        rules : dict
+            Rules in the format of the configuration file.
+        """
+        for nspace, ns_rules in rules.items():
+            for name, entries in ns_rules.items():
+                current = cls._rules.setdefault(nspace, {})
+                if entries is None or current.get(name, []) is None:
+                    current[name] = None
+                    continue
+                current.setdefault(name, [])
+                keys = set(cls._entry_key(elm) for elm in current[name])
+                for elm in entries:
+                    if cls._entry_key(elm) not in keys:
+                        keys.add(cls._entry_key(elm))
+                        current[name].append(elm)
+        cls._build_hash()
+
     @classmethod
     def _build_hash(cls):
+        # Index (namespace, name) -> set of blocked argument signatures, or None if the
+        # name is blocked entirely. Signatures are tuples of interned strings, so that
+        # looking them up does not format strings.
         cls._hash = {}
         for nspace, ns_rules in cls._rules.items():
-            cls._hash[nspace] = {}
-            for key, rules in ns_rules.items():
-                cls._hash[nspace][key] = set()
-                for elm in rules:
-                    cls._hash[nspace][key].add('-'.join(elm[
-                        'args']) + '+' + '-'.join(
-                            sorted(elm.get('kwargs', []))))
+            for name, rules in ns_rules.items():
+                cls._hash[(nspace, name)] = None if rules is None else set(
+                    cls._entry_key(elm) for elm in rules)
+
+    @staticmethod
+    def _entry_key(entry):
+        """Return the signature of a rule entry."""
+        return (tuple(_intern(x) for x in entry['args']),
+                tuple(_intern(x) for x in sorted(entry.get('kwargs', []))))
 
     @staticmethod
     def _get_type_signiture(var):
         if isinstance(var, Array):
-            return 'array_dim' + str(var.ndim)
+            ndim = var.ndim
+            try:
+                return _ARRAY_DIM_SIGNATURES[ndim]
+            except IndexError:
+                return 'array_dim' + str(ndim)
         elif isinstance(var, Number):
-            return type(var.val).__name__
+            return type(var.get_data(ArrayType.NUMPY)).__name__
         else:
             return type(var).__name__
 
     def _get_arg_rule_key(self, args, kwargs):
-        arg_key = [self._get_type_signiture(x) for x in args]
-        kwarg_key = sorted(kwargs.keys())
-        return '-'.join(arg_key) + '+' + '-'.join(kwarg_key)
+        signature = self._get_type_signiture
+        return (tuple([signature(x) for x in args]), tuple(sorted(kwargs)) if kwargs else ())
 
     @classmethod
     def query(cls, nspace, name):
@@ -302,3 +340,136 @@ class Blacklist(Rules):
                 tablefmt='grid')
             return 'Total: {} blacklist rules for primitive [{}]:\n'.format(
                 len(rule_list), name) + table
+
+
+class AutoTuneRules(Rules):
+    """Tuned implementation choices for auto-tuning policy.
+
+    Choices are kept per namespace, primitive name and argument signature. Arrays in the
+    signature are described by dtype and shape bucket, i.e. every dimension rounded up to a
+    power of two, so that one choice covers arrays of similar size. With each choice, the
+    measured speedup over the other implementation is kept if known.
+
+    Signatures are tuples at dispatch time. They are only formatted into the strings of
+    the configuration file once per signature.
+    """
+    _conf_file = '.minpy_autotune.conf'
+    _impl_names = {ArrayType.NUMPY: 'numpy', ArrayType.MXNET: 'mxnet'}
+    # Signature tuple -> signature string.
+    _key_strings = {}
+
+    @classmethod
+    def _build_hash(cls):
+        # (nspace, name, signature string) -> (implementation type, speedup or None).
+        names_impl = {v: k for k, v in cls._impl_names.items()}
+        cls._hash = {}
+        for nspace, ns_rules in cls._rules.items():
+            for name, choices in ns_rules.items():
+                for key, choice in choices.items():
+                    if isinstance(choice, dict):
+                        impl, speedup = choice.get('impl'), choice.get('speedup')
+                    else:
+                        impl, speedup = choice, None
+                    if impl in names_impl:
+                        cls._hash[(nspace, name, key)] = (names_impl[impl], speedup)
+
+    @staticmethod
+    def _bucket(dim):
+        """Round a dimension up to a power of two."""
+        return 1 << (int(dim) - 1).bit_length() if dim > 1 else int(dim)
+
+    @classmethod
+    def _get_type_signiture(cls, var):
+        if isinstance(var, Array):
+            bucket = cls._bucket
+            return (numpy.dtype(var.dtype), tuple([bucket(d) for d in var.shape]))
+        elif isinstance(var, Number):
+            return type(var.get_data(ArrayType.NUMPY))
+        else:
+            return type(var)
+
+    def rule_key(self, args, kwargs):
+        """Return the signature of the arguments that choices are kept for."""
+        signature = self._get_type_signiture
+        return (tuple([signature(x) for x in args]), tuple(sorted(kwargs)) if kwargs else ())
+
+    @classmethod
+    def _key_string(cls, key):
+        """Return the string of a signature used in the configuration file."""
+        string = cls._key_strings.get(key)
+        if string is None:
+            arg_key = []
+            for sig in key[0]:
+                if isinstance(sig, tuple):
+                    arg_key.append('{}[{}]'.format(sig[0].name,
+                                                   'x'.join(str(d) for d in sig[1])))
+                else:
+                    arg_key.append(sig.__name__)
+            string = '-'.join(arg_key) + '+' + '-'.join(key[1])
+            cls._key_strings[key] = string
+        return string
+
+    def tuned(self, name, nspace, key):
+        """Return the tuned choice for a signature, or None if not tuned yet.
+
+        Parameters
+        ----------
+        name : str
+            The dispatch name.
+        nspace : str
+            The namespace the dispatch name belongs to.
+        key : tuple
+            Signature of the arguments returned by :meth:`rule_key`.
+
+        Returns
+        -------
+        tuple
+            Implementation type and its speedup over the other one (None if unknown).
+        """
+        return self._hash.get((nspace, name, self._key_string(key)))
+
+    def lookup(self, name, nspace, key):
+        """Return the tuned implementation type for a signature, or None if not tuned yet.
+
+        Parameters are the same as of :meth:`tuned`.
+        """
+        choice = self.tuned(name, nspace, key)
+        return None if choice is None else choice[0]
+
+    def allow(self, name, nspace, impl_type, args, kwargs):
+        # pylint: disable=too-many-arguments
+        choice = self.lookup(name, nspace, self.rule_key(args, kwargs))
+        return choice is None or choice == impl_type
+
+    def add(self, name, nspace, impl_type, args, kwargs):
+        # pylint: disable=too-many-arguments
+        self.add_choice(name, nspace, impl_type, self.rule_key(args, kwargs))
+
+    def add_choice(self, name, nspace, impl_type, key, speedup=None):
+        """Record the implementation type chosen for a signature.
+
+        Parameters
+        ----------
+        name : str
+            The dispatch name.
+        nspace : str
+            The namespace the dispatch name belongs to.
+        impl_type : ArrayType
+            The chosen type of implementation.
+        key : tuple
+            Signature of the arguments returned by :meth:`rule_key`.
+        speedup : float
+            Measured speedup of the chosen implementation over the other one.
+        """
+        # pylint: disable=too-many-arguments
+        if impl_type not in self._impl_names:
+            raise RuleError('Unknown implementation type {}.'.format(impl_type))
+        string = self._key_string(key)
+        choice = self._impl_names[impl_type]
+        if speedup is not None:
+            speedup = float(speedup)
+            choice = {'impl': choice, 'speedup': speedup}
+        self._rules.setdefault(nspace, {}).setdefault(name, {})[string] = choice
+        self._hash[(nspace, name, string)] = (impl_type, speedup)
+        _logger.info('Use %s implementation of %s for %s.',
+                     self._impl_names[impl_type], name, string)
@@ -3,13 +3,24 @@ from __future__ import division
 from __future__ import absolute_import
 from collections import OrderedDict
 
+import copy
+import json
+import multiprocessing
+import os
 import sys
 import inspect
-import mxnet.io
+import threading
+import time
+import traceback
+import six
 import six.moves.cPickle as pickle # pylint: disable=import-error, no-name-in-module
+from six.moves import queue # pylint: disable=import-error
 import numpy as np
 
 from .. import array
+from ..array_variants import ArrayType
+from ..backend import mxnet
+from ..context import current_context
 
 class DataBatch(object): # pylint: disable=too-few-public-methods
     """Default object for holding a mini-batch of data and related information."""
@@ -104,6 +115,13 @@ class DataIter(object):
         pass
 
 
+def _load_npy(data):
+    """Memory-map data given as path of a `.npy` file."""
+    if isinstance(data, six.string_types):
+        return np.load(data, mmap_mode='r')
+    return data
+
+
 def _init_data(data, allow_empty, default_name):
     # pylint: disable=invalid-name, redefined-variable-type
     """Convert data into canonical form."""
@@ -111,16 +129,19 @@ def _init_data(data, allow_empty, default_name):
     if data is None:
         data = []
 
-    if isinstance(data, (np.ndarray, array.Array)):
+    if isinstance(data, (np.ndarray, array.Array) + six.string_types):
         data = [data]
     if isinstance(data, list):
         if not allow_empty:
             assert len(data) > 0
+        data = [_load_npy(d) for d in data]
         if len(data) == 1:
             data = OrderedDict([(default_name, data[0])])
         else:
             data = OrderedDict([('_%d_%s' % (i, default_name), d)
                                 for i, d in enumerate(data)])
+    if isinstance(data, dict):
+        data = OrderedDict([(k, _load_npy(v)) for k, v in data.items()])
     if not isinstance(data, dict):
         raise TypeError(
             "Input must be NDArray, numpy.ndarray, MinPy Array, or "
@@ -133,13 +154,42 @@ def _init_data(data, allow_empty, default_name):
     return list(data.items())
 
 
+class _BatchedDataIter(DataIter):
+    """Base of data iterators that produce whole batches in `next`.
+
+    `iter_next` and the getters of the current batch are implemented on top of `next`.
+    """
+    _current_batch = None
+
+    def iter_next(self):
+        try:
+            self._current_batch = self.next()
+        except StopIteration:
+            self._current_batch = None
+            return False
+        return True
+
+    def getdata(self):
+        return self._current_batch.data
+
+    def getlabel(self):
+        return self._current_batch.label
+
+    def getindex(self):
+        return self._current_batch.index
+
+    def getpad(self):
+        return self._current_batch.pad
+
+
 class NDArrayIter(DataIter):
     # pylint: disable=too-many-instance-attributes, no-member
     """NDArrayIter object in minpy. Taking numpy array to get dataiter.
     Parameters
     ----------
     data: numpy.ndarray, a list of them, or a dict of string to them.
-        NDArrayIter supports single or multiple data and label.
+        NDArrayIter supports single or multiple data and label. Path of a `.npy` file
+        is memory-mapped.
     label: numpy.ndarray, a list of them, or a dict of them.
         Same as data, but is not fed to the model during testing.
     batch_size: int
@@ -148,6 +198,11 @@ class NDArrayIter(DataIter):
         Whether to shuffle the data
     last_batch_handle: 'pad', 'discard' or 'roll_over'
         How to handle the last batch
+    shuffle_mode: 'copy' or 'index'
+        With 'copy', data is shuffled once by copying it in a random order. With
+        'index', data is left untouched and each batch gathers its rows through a
+        permutation of indices, which is drawn again on every reset. Use 'index' for
+        memory-mapped data or data that should not be duplicated in memory.
     Note
     ----
     This iterator will pad, discard or roll over the last batch if
@@ -160,7 +215,8 @@ class NDArrayIter(DataIter):
                  label=None,
                  batch_size=1,
                  shuffle=False,
-                 last_batch_handle='pad'):
+                 last_batch_handle='pad',
+                 shuffle_mode='copy'):
         # pylint: disable=W0201, too-many-arguments
 
         super(NDArrayIter, self).__init__()
@@ -168,9 +224,21 @@ class NDArrayIter(DataIter):
         self.data = _init_data(data, allow_empty=False, default_name='data')
         self.label = _init_data(
             label, allow_empty=True, default_name='softmax_label')
+        if shuffle_mode not in ('copy', 'index'):
+            raise ValueError('shuffle_mode "%s" is not supported.' % shuffle_mode)
+        self.shuffle = shuffle
+        self.shuffle_mode = shuffle_mode
+        # Rows of the sources in the order of iteration, or None for the stored order.
+        self._index = None
 
-        # shuffle data
-        if shuffle:
+        if shuffle_mode == 'index':
+            # Rows are gathered with NumPy.
+            self.data = [(k, v.asnumpy() if isinstance(v, array.Array) else v)
+                         for k, v in self.data]
+            self.label = [(k, v.asnumpy() if isinstance(v, array.Array) else v)
+                          for k, v in self.label]
+        elif shuffle:
+            # shuffle data
             idx = np.arange(self.data[0][1].shape[0])
             np.random.shuffle(idx)
             self.data = [(k, v[idx]) for k, v in self.data]
@@ -192,7 +260,9 @@ class NDArrayIter(DataIter):
                 label_dict[k] = label_dict[k][:new_n]
             self.data = list(data_dict.items())
             self.label = list(label_dict.items())
-        self.num_data = self.data_list[0].shape[0]
+        self.num_data = self.data[0][1].shape[0]
+        if shuffle_mode == 'index' and shuffle:
+            self._index = np.random.permutation(self.num_data)
         assert self.num_data >= batch_size, \
             "batch_size need to be smaller than data size."
         self.cursor = -batch_size
@@ -220,6 +290,8 @@ class NDArrayIter(DataIter):
             self.cursor = -self.batch_size + (self.cursor % self.num_data) % self.batch_size
         else:
             self.cursor = -self.batch_size
+        if self.shuffle and self.shuffle_mode == 'index':
+            self._index = np.random.permutation(self.num_data)
 
     def iter_next(self):
         self.cursor += self.batch_size
@@ -239,6 +311,8 @@ class NDArrayIter(DataIter):
         # pylint: disable=line-too-long
         """Load data from underlying arrays, internal use only"""
         assert (self.cursor < self.num_data), "DataIter needs reset."
+        if self.shuffle_mode == 'index':
+            return self._gather(data_source)
         if self.cursor + self.batch_size <= self.num_data:
             if isinstance(data_source[0][1], array.Array):
                 return [x[1][self.cursor:self.cursor + self.batch_size] for x in data_source]
@@ -258,6 +332,28 @@ class NDArrayIter(DataIter):
                 raise TypeError("Invalid data type, only numpy.ndarray and minpy.array.Array are allowed.")
 
 
+    def _batch_rows(self):
+        """Return indices of rows of the current batch, internal use only"""
+        end = self.cursor + self.batch_size
+        if self._index is None:
+            return np.arange(self.cursor, end) % self.num_data
+        # Sorted rows are read sequentially from memory-mapped files. The order of rows
+        # within a batch does not matter, as long as all sources use the same one and
+        # padding rows stay at the end.
+        rows = np.sort(self._index[self.cursor:end])
+        if end > self.num_data:
+            rows = np.concatenate((rows, np.sort(self._index[:end - self.num_data])))
+        return rows
+
+    def _gather(self, data_source):
+        """Gather rows of the current batch from untouched sources, internal use only"""
+        end = self.cursor + self.batch_size
+        if self._index is None and end <= self.num_data:
+            return [array.wrap(np.ascontiguousarray(x[1][self.cursor:end]))
+                    for x in data_source]
+        rows = self._batch_rows()
+        return [array.wrap(np.take(x[1], rows, axis=0)) for x in data_source]
+
     def getdata(self):
         return self._getdata(self.data)
 
@@ -276,6 +372,17 @@ class NDArrayIter(DataIter):
 
     def getsubiter(self, num_samples):
         """Create a sub dataiter which samples part of the data in the dataset"""
+        if self.shuffle_mode == 'index':
+            # Share the sources and only sample indices.
+            subiter = copy.copy(self)
+            subiter.shuffle = False
+            subiter._index = np.random.choice( # pylint: disable=protected-access
+                self.num_data, num_samples, replace=False)
+            subiter.num_data = num_samples
+            subiter.num_iterations_per_epoch = num_samples / self.batch_size
+            subiter.last_batch_handle = 'pad'
+            subiter.hard_reset()
+            return subiter
         idx = np.arange(self.data[0][1].shape[0])
         np.random.shuffle(idx)
         mask = idx[0:num_samples]
@@ -288,6 +395,416 @@ class NDArrayIter(DataIter):
         return self.num_iterations_per_epoch
 
 
+def _to_context(data, ctx):
+    """Convert data of a batch into an MXNet-backed array on the given context."""
+    if isinstance(data, array.Array):
+        if data.context == ctx and data.has_valid_data(ArrayType.MXNET):
+            return data
+        data = data.get_data(ArrayType.NUMPY)
+    if not isinstance(data, np.ndarray):
+        return data
+    result = array.Array(data, ArrayType.NUMPY, ctx)
+    # Wait for the copy here, so that it is not paid by the training thread.
+    result.get_data(ArrayType.MXNET).wait_to_read()
+    return result
+
+
+class PrefetchingIter(_BatchedDataIter):
+    # pylint: disable=too-many-instance-attributes
+    """Assemble batches of another iterator on a background thread.
+
+    Slicing, padding and conversion of batches into MXNet arrays of the target context
+    run ahead of the training loop, keeping at most `depth` batches in flight. The
+    wrapped iterator should hold NumPy data, so that assembling batches does not call
+    MinPy primitives outside of the training thread.
+
+    Parameters
+    ----------
+    base_iter: DataIter
+        The iterator to prefetch from, e.g. an NDArrayIter.
+    depth: int
+        Maximal number of assembled batches waiting to be consumed.
+    ctx: minpy.context.Context
+        Context of the produced arrays. The current context by default.
+
+    Attributes
+    ----------
+    wait_time: float
+        Seconds the consumer waited for batches since the last reset.
+    epoch_wait_times: list
+        Wait time of each finished pass over the data, appended on reset.
+    """
+
+    _end = object()
+
+    def __init__(self, base_iter, depth=2, ctx=None):
+        super(PrefetchingIter, self).__init__()
+        assert depth > 0, "depth need to be positive."
+        self.base_iter = base_iter
+        self.batch_size = base_iter.batch_size
+        self.depth = depth
+        self.ctx = current_context() if ctx is None else ctx
+        self.wait_time = 0.0
+        self.epoch_wait_times = []
+        self._num_batches = 0
+        self._queue = None
+        self._stop = None
+        self._thread = None
+        self._exhausted = False
+
+    @property
+    def provide_data(self):
+        """The name and shape of data provided by this iterator"""
+        return self.base_iter.provide_data
+
+    @property
+    def provide_label(self):
+        """The name and shape of label provided by this iterator"""
+        return self.base_iter.provide_label
+
+    @property
+    def num_data(self):
+        """Number of samples of the wrapped iterator"""
+        return self.base_iter.num_data
+
+    def _produce(self, batches, stop):
+        """Body of the background thread."""
+        try:
+            for batch in self.base_iter:
+                item = DataBatch(
+                    data=[_to_context(d, self.ctx) for d in batch.data],
+                    label=[_to_context(l, self.ctx) for l in batch.label],
+                    pad=batch.pad,
+                    index=batch.index)
+                if not self._put(batches, stop, item):
+                    return
+        except Exception as err: # pylint: disable=broad-except
+            self._put(batches, stop, err)
+            return
+        self._put(batches, stop, self._end)
+
+    @staticmethod
+    def _put(batches, stop, item):
+        """Put item into the queue unless the producer is stopped."""
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.05)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _start(self):
+        self._queue = queue.Queue(maxsize=self.depth)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._produce, args=(self._queue, self._stop))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _shutdown(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._queue = None
+
+    def reset(self):
+        self._shutdown()
+        if self._num_batches > 0:
+            self.epoch_wait_times.append(self.wait_time)
+        self.wait_time = 0.0
+        self._num_batches = 0
+        self._exhausted = False
+        self.base_iter.reset()
+
+    def next(self):
+        if self._exhausted:
+            raise StopIteration
+        if self._thread is None:
+            self._start()
+        start = time.time()
+        item = self._queue.get()
+        self.wait_time += time.time() - start
+        if item is self._end:
+            self._exhausted = True
+            self._shutdown()
+            raise StopIteration
+        if isinstance(item, Exception):
+            self._exhausted = True
+            self._shutdown()
+            raise item
+        self._num_batches += 1
+        return item
+
+    def getsubiter(self, num_samples):
+        """Create a sub dataiter which samples part of the data in the dataset"""
+        return self.base_iter.getsubiter(num_samples)
+
+    def getnumiterations(self):
+        """Get how many iterations per epoch"""
+        return self.base_iter.getnumiterations()
+
+
+def _worker_loop(sources, transform, buffers, tasks, results):
+    """Body of a data loading process of MultiProcessIter."""
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        batch_idx, slot, seed, epoch, rows = task
+        try:
+            for i, row in enumerate(rows):
+                # Transforms of a sample are reproducible whatever process runs them.
+                rng = np.random.RandomState([seed, epoch, row])
+                for (is_data, source), out in zip(sources, buffers[slot]):
+                    sample = source[row]
+                    if is_data and transform is not None:
+                        sample = transform(sample, rng)
+                    out[i] = sample
+            results.put((batch_idx, slot, None))
+        except Exception: # pylint: disable=broad-except
+            results.put((batch_idx, slot, traceback.format_exc()))
+
+
+def _shared_buffer(context, shape, dtype):
+    """Allocate NumPy array in shared memory, which is inherited by forked processes."""
+    dtype = np.dtype(dtype)
+    raw = context.RawArray('b', int(np.prod(shape)) * dtype.itemsize)
+    return np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+
+class MultiProcessIter(_BatchedDataIter):
+    # pylint: disable=too-many-instance-attributes
+    """Produce batches with a pool of worker processes.
+
+    Each worker gathers the samples of a batch, applies `transform` to every data
+    sample, and writes the results into a batch buffer in shared memory, so batches are
+    not pickled between processes. Batches are returned in order, and the transform of
+    each sample is seeded by `seed`, the epoch and the sample index, so the produced data
+    does not depend on the number of workers or their scheduling.
+
+    Workers are forked, so sources and `transform` need not be picklable. Workers should
+    not use MXNet or MinPy primitives.
+
+    Parameters
+    ----------
+    data: numpy.ndarray, a list of them, or a dict of string to them.
+        Same as NDArrayIter.
+    label: numpy.ndarray, a list of them, or a dict of them.
+        Same as NDArrayIter. Labels are not transformed.
+    batch_size: int
+        Batch Size
+    transform: callable
+        Function of a data sample and a `numpy.random.RandomState`, returning the
+        transformed sample. The transformed shape of all samples should be the same.
+    num_workers: int
+        Number of worker processes.
+    shuffle: bool
+        Whether to shuffle the data, again on every reset.
+    seed: int
+        Seed of shuffling and transforms.
+    last_batch_handle: 'pad' or 'discard'
+        How to handle the last batch
+    depth: int
+        Number of batches in flight per worker.
+    """
+
+    def __init__(self,
+                 data,
+                 label=None,
+                 batch_size=1,
+                 transform=None,
+                 num_workers=2,
+                 shuffle=False,
+                 seed=0,
+                 last_batch_handle='pad',
+                 depth=2):
+        # pylint: disable=too-many-arguments
+        super(MultiProcessIter, self).__init__()
+        if last_batch_handle not in ('pad', 'discard'):
+            raise ValueError(
+                'last_batch_handle "%s" is not supported.' % last_batch_handle)
+        self.data = [(k, v.asnumpy() if isinstance(v, array.Array) else v)
+                     for k, v in _init_data(data, allow_empty=False, default_name='data')]
+        self.label = [(k, v.asnumpy() if isinstance(v, array.Array) else v)
+                      for k, v in _init_data(
+                          label, allow_empty=True, default_name='softmax_label')]
+        self.batch_size = batch_size
+        self.transform = transform
+        self.num_workers = num_workers
+        self.shuffle = shuffle
+        self.seed = seed
+        self.last_batch_handle = last_batch_handle
+        self.depth = depth
+        self.epoch = 0
+        self._rows = np.arange(self.data[0][1].shape[0])
+        self.num_data = len(self._rows)
+        assert self.num_data >= batch_size, \
+            "batch_size need to be smaller than data size."
+        # Transformed shapes are inferred from the first sample.
+        self._sample_shapes = []
+        for _, source in self.data:
+            sample = source[0]
+            if transform is not None:
+                sample = np.asarray(transform(sample, np.random.RandomState(seed)))
+            self._sample_shapes.append((sample.shape, sample.dtype))
+        for _, source in self.label:
+            self._sample_shapes.append((source.shape[1:], source.dtype))
+        self._workers = None
+        self._reset_epoch()
+
+    @property
+    def provide_data(self):
+        """The name and shape of data provided by this iterator"""
+        return [(k, (self.batch_size, ) + shape)
+                for (k, _), (shape, _) in zip(self.data, self._sample_shapes)]
+
+    @property
+    def provide_label(self):
+        """The name and shape of label provided by this iterator"""
+        return [(k, (self.batch_size, ) + v.shape[1:]) for k, v in self.label]
+
+    def _reset_epoch(self):
+        self._order = self._rows
+        if self.shuffle:
+            rng = np.random.RandomState([self.seed, self.epoch])
+            self._order = self._rows[rng.permutation(len(self._rows))]
+        if self.last_batch_handle == 'discard':
+            self._num_batches = self.num_data // self.batch_size
+        else:
+            self._num_batches = (self.num_data + self.batch_size - 1) // self.batch_size
+        self._next_submit = 0
+        self._next_yield = 0
+        self._ready = {}
+
+    def _start(self):
+        if sys.platform == 'win32':
+            raise RuntimeError('MultiProcessIter needs to fork worker processes.')
+        context = multiprocessing
+        if hasattr(multiprocessing, 'get_context'):
+            context = multiprocessing.get_context('fork')
+        num_slots = self.num_workers * self.depth
+        self._buffers = [[_shared_buffer(context, (self.batch_size, ) + shape, dtype)
+                          for shape, dtype in self._sample_shapes]
+                         for _ in range(num_slots)]
+        self._free_slots = list(range(num_slots))
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        sources = [(True, v) for _, v in self.data] + [(False, v) for _, v in self.label]
+        self._workers = []
+        for _ in range(self.num_workers):
+            worker = context.Process(
+                target=_worker_loop,
+                args=(sources, self.transform, self._buffers, self._tasks, self._results))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def _batch_rows(self, batch_idx):
+        """Return indices of samples of a batch, padded by samples from the beginning."""
+        start = batch_idx * self.batch_size
+        rows = self._order[start:start + self.batch_size]
+        if len(rows) < self.batch_size:
+            rows = np.concatenate((rows, self._order[:self.batch_size - len(rows)]))
+        return rows
+
+    def _submit(self):
+        while self._free_slots and self._next_submit < self._num_batches:
+            slot = self._free_slots.pop()
+            self._tasks.put((self._next_submit, slot, self.seed, self.epoch,
+                             self._batch_rows(self._next_submit)))
+            self._next_submit += 1
+
+    def _receive(self):
+        """Wait for the result of a batch."""
+        while True:
+            try:
+                batch_idx, slot, error = self._results.get(timeout=1.0)
+                break
+            except queue.Empty:
+                if not all(worker.is_alive() for worker in self._workers):
+                    self.close()
+                    raise RuntimeError('A data loading process exited unexpectedly.')
+        if error is not None:
+            raise RuntimeError('Data loading process failed:\n' + error)
+        self._ready[batch_idx] = slot
+
+    def next(self):
+        if self._next_yield >= self._num_batches:
+            raise StopIteration
+        if self._workers is None:
+            self._start()
+        self._submit()
+        while self._next_yield not in self._ready:
+            self._receive()
+        slot = self._ready.pop(self._next_yield)
+        # Copy out of the shared buffer, which is reused by the next batches.
+        arrays = [array.wrap(np.array(buf)) for buf in self._buffers[slot]]
+        self._free_slots.append(slot)
+        num_data = len(self.data)
+        pad = 0
+        if self._next_yield == self._num_batches - 1:
+            pad = self._num_batches * self.batch_size - self.num_data
+            pad = max(pad, 0)
+        batch = DataBatch(data=arrays[:num_data], label=arrays[num_data:],
+                          pad=pad, index=self._next_yield)
+        self._next_yield += 1
+        self._submit()
+        return batch
+
+    def reset(self):
+        # Wait for batches in flight, their buffers are reused.
+        if self._workers is not None:
+            while len(self._ready) < self._next_submit - self._next_yield:
+                self._receive()
+            self._free_slots.extend(self._ready.values())
+        self.epoch += 1
+        self._reset_epoch()
+
+    def close(self):
+        """Stop the worker processes."""
+        if self._workers is None:
+            return
+        for _ in self._workers:
+            self._tasks.put(None)
+        for worker in self._workers:
+            worker.join(timeout=5.0)
+            if worker.is_alive():
+                worker.terminate()
+        self._workers = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception: # pylint: disable=broad-except
+            pass
+
+    def getsubiter(self, num_samples):
+        """Create a sub dataiter which samples part of the data in the dataset
+
+        The samples are gathered and transformed in this process, so no worker pool is
+        started for the sub dataiter.
+        """
+        rng = np.random.RandomState([self.seed, self.epoch, num_samples])
+        rows = rng.choice(self._rows, num_samples, replace=False)
+        data = []
+        for _, source in self.data:
+            samples = source[rows]
+            if self.transform is not None:
+                samples = np.stack([
+                    self.transform(sample, np.random.RandomState([self.seed, self.epoch, row]))
+                    for row, sample in zip(rows, samples)])
+            data.append(samples)
+        label = [v[rows] for _, v in self.label]
+        return NDArrayIter(data, label, self.batch_size, True)
+
+    def getnumiterations(self):
+        """Get how many iterations per epoch"""
+        return self.num_data / self.batch_size
+
+
 def save_data_labels(data_vec, label_vec, file_name):
     """ Handy utility to save data
 
@@ -315,6 +832,253 @@ def load_data_labels(file_name):
         return data_vec, label_vec
 
 
+CHUNKED_INDEX_FILE = 'index.json'
+CHUNKED_FORMAT_VERSION = 1
+
+
+def save_chunked(data_vec, label_vec, directory, shard_size=4096):
+    """ Save data in the chunked format read by ChunkedDataIter
+
+    Samples are stored in shard files of `shard_size` records each. Every shard holds the
+    data block followed by the label block, both C-ordered. The index file lists the
+    dtype and per-sample shape of both fields and the byte offsets of the blocks.
+
+    :param data_vec: data vector
+    :param label_vec: corresponding label vector
+    :param directory: directory to save to, created if it does not exist
+    :param shard_size: number of samples per shard
+    """
+    data_vec = np.asarray(data_vec)
+    label_vec = np.asarray(label_vec)
+    assert data_vec.shape[0] == label_vec.shape[0], \
+        "data and labels need to have the same number of samples."
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fields = [('data', data_vec), ('labels', label_vec)]
+    shards = []
+    for start in range(0, data_vec.shape[0], shard_size):
+        stop = min(start + shard_size, data_vec.shape[0])
+        file_name = 'shard-%05d.bin' % len(shards)
+        offsets = []
+        with open(os.path.join(directory, file_name), 'wb') as shard_file:
+            for _, vec in fields:
+                offsets.append(shard_file.tell())
+                shard_file.write(np.ascontiguousarray(vec[start:stop]).tobytes())
+        shards.append({'file': file_name, 'num_samples': stop - start, 'offsets': offsets})
+    index = {
+        'version': CHUNKED_FORMAT_VERSION,
+        'num_samples': int(data_vec.shape[0]),
+        'shard_size': shard_size,
+        'fields': [{'name': name, 'dtype': vec.dtype.str, 'shape': list(vec.shape[1:])}
+                   for name, vec in fields],
+        'shards': shards,
+    }
+    with open(os.path.join(directory, CHUNKED_INDEX_FILE), 'w') as index_file:
+        json.dump(index, index_file, indent=1)
+
+
+def convert_pickle_to_chunked(file_name, directory, shard_size=4096):
+    """ Convert data saved by save_data_labels into the chunked format
+
+    :param file_name: pickle file written by save_data_labels
+    :param directory: directory to save the chunked dataset to
+    :param shard_size: number of samples per shard
+    """
+    data_vec, label_vec = load_data_labels(file_name)
+    save_chunked(data_vec, label_vec, directory, shard_size)
+
+
+class ChunkedDataIter(_BatchedDataIter):
+    # pylint: disable=too-many-instance-attributes
+    """Stream batches of a dataset saved by save_chunked.
+
+    Only the shards needed by the current batches are read, either memory-mapped or
+    read sequentially into memory. With shuffling, shards are visited in random order
+    and samples are shuffled within buffers of `buffer_size` samples spanning
+    consecutive shards. The order of an epoch is determined by `seed` and the epoch, so
+    iteration can be resumed from a batch cursor with `seek`.
+
+    Parameters
+    ----------
+    directory: str
+        Directory of the dataset.
+    batch_size: int
+        Batch Size
+    shuffle: bool
+        Whether to shuffle the data, again on every reset.
+    buffer_size: int
+        Number of samples to shuffle within, rounded up to whole shards. The shard
+        size by default.
+    seed: int
+        Seed of shuffling.
+    last_batch_handle: 'pad' or 'discard'
+        How to handle the last batch
+    use_mmap: bool
+        Whether to memory-map shards instead of reading them.
+    """
+
+    def __init__(self,
+                 directory,
+                 batch_size=1,
+                 shuffle=False,
+                 buffer_size=None,
+                 seed=0,
+                 last_batch_handle='pad',
+                 use_mmap=True):
+        # pylint: disable=too-many-arguments
+        super(ChunkedDataIter, self).__init__()
+        if last_batch_handle not in ('pad', 'discard'):
+            raise ValueError(
+                'last_batch_handle "%s" is not supported.' % last_batch_handle)
+        with open(os.path.join(directory, CHUNKED_INDEX_FILE)) as index_file:
+            index = json.load(index_file)
+        if index['version'] != CHUNKED_FORMAT_VERSION:
+            raise ValueError('Unsupported chunked format version %s.' % index['version'])
+        self.directory = directory
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.buffer_size = index['shard_size'] if buffer_size is None else buffer_size
+        self.seed = seed
+        self.last_batch_handle = last_batch_handle
+        self.use_mmap = use_mmap
+        self.num_data = index['num_samples']
+        assert self.num_data >= batch_size, \
+            "batch_size need to be smaller than data size."
+        self._fields = [(field['name'], np.dtype(field['dtype']), tuple(field['shape']))
+                        for field in index['fields']]
+        self._shards = index['shards']
+        self._shard_starts = np.cumsum([0] + [shard['num_samples']
+                                              for shard in self._shards])
+        # Shard index -> list of field arrays, in order of use.
+        self._loaded = OrderedDict()
+        self._shards_per_window = max(-(-self.buffer_size // index['shard_size']), 1)
+        self._max_loaded = 2 * self._shards_per_window + 1
+        self.epoch = 0
+        self.cursor = 0
+        self._plan = None
+
+    @property
+    def provide_data(self):
+        """The name and shape of data provided by this iterator"""
+        _, _, shape = self._fields[0]
+        return [('data', (self.batch_size, ) + shape)]
+
+    @property
+    def provide_label(self):
+        """The name and shape of label provided by this iterator"""
+        _, _, shape = self._fields[1]
+        return [('softmax_label', (self.batch_size, ) + shape)]
+
+    def _make_plan(self):
+        """Return sample indices of all batches of the current epoch."""
+        rng = np.random.RandomState([self.seed, self.epoch])
+        shard_order = np.arange(len(self._shards))
+        if self.shuffle:
+            shard_order = rng.permutation(len(self._shards))
+        # Samples are shuffled within windows of consecutive shards, so that a batch
+        # needs at most the shards of two windows.
+        window = self._shards_per_window if self.shuffle else 1
+        stream = []
+        for start in range(0, len(shard_order), window):
+            rows = np.concatenate([
+                np.arange(self._shard_starts[shard], self._shard_starts[shard + 1])
+                for shard in shard_order[start:start + window]])
+            if self.shuffle:
+                rows = rng.permutation(rows)
+            stream.append(rows)
+        stream = np.concatenate(stream)
+        num_batches = len(stream) // self.batch_size
+        if self.last_batch_handle == 'pad' and len(stream) % self.batch_size != 0:
+            pad = self.batch_size - len(stream) % self.batch_size
+            stream = np.concatenate((stream, stream[:pad]))
+            num_batches += 1
+        return stream[:num_batches * self.batch_size].reshape(num_batches, self.batch_size)
+
+    def _load_shard(self, shard):
+        """Return arrays of fields of a shard."""
+        arrays = self._loaded.pop(shard, None)
+        if arrays is None:
+            info = self._shards[shard]
+            path = os.path.join(self.directory, info['file'])
+            num = info['num_samples']
+            if self.use_mmap:
+                raw = np.memmap(path, dtype=np.uint8, mode='r').view(np.ndarray)
+            else:
+                raw = np.fromfile(path, dtype=np.uint8)
+            arrays = []
+            for (_, dtype, shape), offset in zip(self._fields, info['offsets']):
+                nbytes = num * int(np.prod(shape)) * dtype.itemsize
+                arrays.append(raw[offset:offset + nbytes].view(dtype).reshape((num, ) + shape))
+        self._loaded[shard] = arrays
+        # Mapped shards are evicted too, each holds an open file.
+        while len(self._loaded) > self._max_loaded:
+            self._loaded.popitem(last=False)
+        return arrays
+
+    def _gather(self, rows):
+        """Read samples of given indices, in the same order."""
+        outs = [np.empty((len(rows), ) + shape, dtype=dtype)
+                for _, dtype, shape in self._fields]
+        shards = np.searchsorted(self._shard_starts, rows, side='right') - 1
+        for shard in np.unique(shards):
+            mask = shards == shard
+            local = rows[mask] - self._shard_starts[shard]
+            # Sorted reads are sequential within the shard.
+            order = np.argsort(local)
+            positions = np.nonzero(mask)[0][order]
+            for out, arr in zip(outs, self._load_shard(shard)):
+                out[positions] = arr[local[order]]
+        return outs
+
+    def seek(self, cursor, epoch=None):
+        """Resume iteration at the given batch of the given epoch.
+
+        Parameters
+        ----------
+        cursor: int
+            Index of the next batch to return.
+        epoch: int
+            Epoch to resume, the current one by default.
+        """
+        if epoch is not None and epoch != self.epoch:
+            self.epoch = epoch
+            self._plan = None
+        self.cursor = cursor
+
+    def reset(self):
+        self.epoch += 1
+        self.cursor = 0
+        self._plan = None
+
+    def hard_reset(self):
+        """Restart the current epoch"""
+        self.cursor = 0
+
+    def next(self):
+        if self._plan is None:
+            self._plan = self._make_plan()
+        if self.cursor >= len(self._plan):
+            raise StopIteration
+        data, label = self._gather(self._plan[self.cursor])
+        pad = 0
+        if self.cursor == len(self._plan) - 1:
+            pad = max(len(self._plan) * self.batch_size - self.num_data, 0)
+        batch = DataBatch(data=[array.wrap(data)], label=[array.wrap(label)],
+                          pad=pad, index=self.cursor)
+        self.cursor += 1
+        return batch
+
+    def getsubiter(self, num_samples):
+        """Create a sub dataiter which samples part of the data in the dataset"""
+        rows = np.sort(np.random.choice(self.num_data, num_samples, replace=False))
+        data, label = self._gather(rows)
+        return NDArrayIter(data, label, self.batch_size, True)
+
+    def getnumiterations(self):
+        """Get how many iterations per epoch"""
+        return self.num_data / self.batch_size
+
+
 def _import_mxnetio():
     module_obj = sys.modules[__name__]
     member_dict = dict((cls[0], cls[1])
@@ -331,4 +1095,5 @@ def _import_mxnetio():
             setattr(module_obj, fun[0], fun[1])
 
 # Import mxnet python io into minpy namespace
-_import_mxnetio()
+if mxnet is not None:
+    _import_mxnetio()
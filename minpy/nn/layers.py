@@ -276,31 +276,29 @@ def rnn_step(x, prev_h, Wx, Wh, b):
     return next_h
 
 
-def rnn_temporal(x, h0, Wx, Wh, b):
+def rnn_temporal(x, h0, Wx, Wh, b, bptt=None):
     """
     Run a vanilla RNN forward on an entire sequence of data. We assume an input
     sequence composed of T vectors, each of dimension D. The RNN uses a hidden
     size of H, and we work over a minibatch containing N sequences. After running
     the RNN forward, we return the hidden states for all timesteps.
 
+    The whole sequence is one primitive: hidden states are written into a
+    preallocated buffer, and the backward pass is a single loop in reverse time.
+
     Inputs:
     - x: Input data for the entire timeseries, of shape (N, T, D).
     - h0: Initial hidden state, of shape (N, H)
     - Wx: Weight matrix for input-to-hidden connections, of shape (D, H)
     - Wh: Weight matrix for hidden-to-hidden connections, of shape (H, H)
     - b: Biases of shape (H,)
+    - bptt: If given, truncate backpropagation through time to windows of bptt
+      timesteps: gradients do not flow from timestep k * bptt to the ones before.
 
     Returns a tuple of:
     - h: Hidden states for the entire timeseries, of shape (N, T, H).
     """
-    N, T, _ = x.shape
-    H = h0.shape[1]
-    h = np.zeros([N, 0, H])
-    for t in range(T):
-        h_step = rnn_step(x[:, t, :], h0 if t == 0 else h[:, t - 1, :], Wx, Wh,
-                          b).reshape(N, 1, H)
-        h = np.append(h, h_step, axis=1)
-    return h
+    return np.rnn_temporal(x, h0, Wx, Wh, b, bptt)
 
 
 def gru_step(x, prev_h, Wx, Wh, b, Wxh, Whh, bh):
@@ -340,13 +338,11 @@ def gru_step(x, prev_h, Wx, Wh, b, Wxh, Whh, bh):
     -----
     Implementation follows
     http://jmlr.org/proceedings/papers/v37/jozefowicz15.pdf
+
+    The step is a single primitive. Its gradient reuses the gate activations of
+    the forward pass.
     """
-    _, H = prev_h.shape
-    a = sigmoid(np.dot(x, Wx) + np.dot(prev_h, Wh) + b)
-    r = a[:, 0:H]
-    z = a[:, H:2 * H]
-    h_m = np.tanh(np.dot(x, Wxh) + np.dot(r * prev_h, Whh) + bh)
-    next_h = z * prev_h + (1 - z) * h_m
+    next_h, _ = np.gru_step(x, prev_h, Wx, Wh, b, Wxh, Whh, bh)
     return next_h
 
 
@@ -365,25 +361,18 @@ def lstm_step(x, prev_h, prev_c, Wx, Wh, b):
     - Wh: Hidden-to-hidden weights, of shape (H, 4H)
     - b: Biases, of shape (4H,)
 
+    The step is a single primitive. Its gradient reuses the gate activations of
+    the forward pass.
+
     Returns a tuple of:
     - next_h: Next hidden state, of shape (N, H)
     - next_c: Next cell state, of shape (N, H)
     """
-    _, H = prev_c.shape
-    # 1. activation vector
-    a = np.dot(x, Wx) + np.dot(prev_h, Wh) + b
-    # 2. gate fuctions
-    i = sigmoid(a[:, 0:H])
-    f = sigmoid(a[:, H:2 * H])
-    o = sigmoid(a[:, 2 * H:3 * H])
-    g = np.tanh(a[:, 3 * H:4 * H])
-    # 3. next cell state
-    next_c = f * prev_c + i * g
-    next_h = o * np.tanh(next_c)
+    next_h, next_c, _ = np.lstm_step(x, prev_h, prev_c, Wx, Wh, b)
     return next_h, next_c
 
 
-def lstm_temporal(x, h0, Wx, Wh, b):
+def lstm_temporal(x, h0, Wx, Wh, b, bptt=None):
     """
     Forward pass for an LSTM over an entire sequence of data. We assume an input
     sequence composed of T vectors, each of dimension D. The LSTM uses a hidden
@@ -394,30 +383,22 @@ def lstm_temporal(x, h0, Wx, Wh, b):
     state is set to zero. Also note that the cell state is not returned; it is
     an internal variable to the LSTM and is not accessed from outside.
 
+    The whole sequence is one primitive: hidden states are written into a
+    preallocated buffer, and the backward pass is a single loop in reverse time.
+
     Inputs:
     - x: Input data of shape (N, T, D)
     - h0: Initial hidden state of shape (N, H)
     - Wx: Weights for input-to-hidden connections, of shape (D, 4H)
     - Wh: Weights for hidden-to-hidden connections, of shape (H, 4H)
     - b: Biases of shape (4H,)
+    - bptt: If given, truncate backpropagation through time to windows of bptt
+      timesteps: gradients do not flow from timestep k * bptt to the ones before.
 
     Returns a tuple of:
     - h: Hidden states for all timesteps of all sequences, of shape (N, T, H)
     """
-    N, T, _ = x.shape
-    _, H = h0.shape
-    c = np.zeros([N, 0, H])
-    h = np.zeros([N, 0, H])
-    for t in range(T):
-        h_step, c_step = lstm_step(x[:, t, :], h[:, t - 1, :]
-                                   if t > 0 else h0, c[:, t - 1, :]
-                                   if t > 0 else np.zeros((N, H)), Wx, Wh,
-                                   b)  # pylint: disable=line-too-long
-        h_step = h_step.reshape(N, 1, H)
-        c_step = c_step.reshape(N, 1, H)
-        h = np.append(h, h_step, axis=1)
-        c = np.append(c, c_step, axis=1)
-    return h
+    return np.lstm_temporal(x, h0, Wx, Wh, b, bptt)
 
 
 def temporal_affine(x, w, b):
@@ -720,11 +720,13 @@ class _ConfigParser(object):
 
 
 class Updater(_ConfigParser):
-    def __init__(self, model, **kwargs):
+    def __init__(self, model, fused=False, **kwargs):
         # duplicate so that there could be multiple updaters for one model
         configs = copy.deepcopy(model._update_configs)
         super(Updater, self).__init__(configs)
         object.__setattr__(self, '_model', model)
+        # update all parameters in one vectorized pass per group if fused
+        object.__setattr__(self, '_fused', minpy.nn.optim.FusedUpdater() if fused else None)
 
         # only accept attributes applying to all parameters in constructor
         # those attributes are local to self
@@ -735,6 +737,9 @@ class Updater(_ConfigParser):
         """ Only update parameters corresponding to gradients contained in grad_dict.
             User could update parameters selectively by manipulating grad_dict.
         """
+        if self._fused is not None:
+            self._model.params.update(self._fused(self._model.params, grad_dict, self._configs))
+            return
         for param_name, grad in grad_dict.items():
             param = self._model.params[param_name]
             update_rule = self._configs[param_name]['update_rule']
@@ -167,7 +167,11 @@ class Symbolic(minpy.nn.model_builder.Layer):
                 self._module_aux_param_names,
                 _get_shapes(self._get_aux_params(*self._aux_param_names))
             )))
-            self._func = minpy.core.Function(self._symbol, shapes)
+            # Parameters are bound directly to the executors, so that updating them in place
+            # needs no copy in the next forward.
+            self._func = minpy.core.Function(
+                self._symbol, shapes,
+                bind_params=tuple(self._module_param_names) + tuple(self._module_aux_param_names))
 
         kwargs.update(dict(zip(self._module_param_names, self._get_params(*self._param_names))))
         kwargs.update(dict(zip(self._module_aux_param_names, self._get_aux_params(*self._aux_param_names))))
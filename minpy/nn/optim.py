@@ -1,6 +1,13 @@
 # pylint: disable=invalid-name, pointless-string-statement
 """ Optimizer codes. Adapted from cs231n lab codes. """
+import numbers
+
+import numpy
+
 import minpy.numpy as np
+from minpy import array
+from minpy.array_variants import ArrayType
+from minpy.backend import mxnet
 """
 This file implements various first-order update rules that are commonly used for
 training neural networks. Each update rule accepts current weights and the
@@ -139,3 +146,381 @@ def adam(x, dx, config=None):
     config['t'] = t
 
     return next_x, config
+
+
+"""
+Fused update rules.
+
+The update rules above dispatch several MinPy operations per parameter. For models
+with many small parameters, that per-parameter overhead dominates the update.
+FusedUpdater applies sgd, sgd_momentum, rmsprop and adam to all parameters of the same
+context, dtype and hyperparameters at once: parameters and gradients are flattened into
+one buffer, optimizer state lives in persistent flat buffers, and the update runs as a
+single vectorized pass with the same arithmetic as the rules above. Updated parameters
+and state in the config dictionaries are views into these buffers, so they remain
+usable with the unfused rules.
+"""
+
+
+def _sgd_kernel(w, dw, state, config, sqrt): # pylint: disable=unused-argument
+    return w - config['learning_rate'] * dw
+
+
+def _sgd_momentum_kernel(w, dw, state, config, sqrt): # pylint: disable=unused-argument
+    v = state['velocity']
+    v *= config['momentum']
+    v -= dw * config['learning_rate']
+    return w + v
+
+
+def _rmsprop_kernel(x, dx, state, config, sqrt):
+    cache = state['cache']
+    cache *= config['decay_rate']
+    cache += dx**2 * (1 - config['decay_rate'])
+    return x - config['learning_rate'] * dx / (sqrt(cache) + config['epsilon'])
+
+
+def _adam_kernel(x, dx, state, config, sqrt):
+    m = state['m']
+    v = state['v']
+    t = config['t']
+    m *= config['beta1']
+    m += (1 - config['beta1']) * dx
+    v *= config['beta2']
+    v += (1 - config['beta2']) * (dx**2)
+    m_ = m / (1 - config['beta1']**t)
+    v_ = v / (1 - config['beta2']**t)
+    return x - config['learning_rate'] * m_ / (sqrt(v_) + config['epsilon'])
+
+
+# Rule name -> (kernel, default hyperparameters, names of state buffers).
+_fused_rules = {
+    'sgd': (_sgd_kernel, {'learning_rate': 1e-2}, ()),
+    'sgd_momentum': (_sgd_momentum_kernel,
+                     {'learning_rate': 1e-2, 'momentum': 0.9}, ('velocity', )),
+    'rmsprop': (_rmsprop_kernel,
+                {'learning_rate': 1e-2, 'decay_rate': 0.99, 'epsilon': 1e-8},
+                ('cache', )),
+    'adam': (_adam_kernel,
+             {'learning_rate': 1e-3, 'beta1': 0.9, 'beta2': 0.999, 'epsilon': 1e-8,
+              't': 0}, ('m', 'v')),
+}
+
+
+class _FusedGroup(object):
+    """Flat buffers of parameters updated together."""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, names, shapes, atype):
+        self.names = names
+        self.shapes = shapes
+        self.atype = atype
+        self.offsets = [0]
+        for shape in shapes:
+            self.offsets.append(self.offsets[-1] + int(numpy.prod(shape)))
+        # Flat buffer of the latest parameters and their wrappers.
+        self.params = None
+        self.param_values = None
+        # State name -> flat buffer and wrappers of its views.
+        self.state = {}
+        self.state_values = {}
+
+    def flatten(self, values, latest=None, latest_values=None, dtype=None, ctx=None):
+        """Return flat buffer of values, reusing the latest buffer if they are its views.
+
+        Missing values are filled with zeros.
+        """
+        # pylint: disable=too-many-arguments
+        if latest is not None and all(val is old for val, old in zip(values, latest_values)):
+            return latest
+        sizes = numpy.diff(self.offsets)
+        if self.atype == ArrayType.NUMPY:
+            return numpy.concatenate([
+                numpy.zeros(size, dtype=dtype) if val is None else
+                array.wrap(val).get_data(ArrayType.NUMPY).ravel()
+                for val, size in zip(values, sizes)])
+        return mxnet.nd.concat(*[
+            mxnet.nd.zeros(int(size), ctx=ctx, dtype=dtype) if val is None else
+            array.wrap(val).get_data(ArrayType.MXNET).reshape((-1, ))
+            for val, size in zip(values, sizes)], dim=0)
+
+    def unflatten(self, flat, context):
+        """Return arrays viewing parts of a flat buffer."""
+        return [array.Array(flat[start:stop].reshape(shape), self.atype, context)
+                for start, stop, shape in zip(self.offsets[:-1], self.offsets[1:],
+                                              self.shapes)]
+
+
+class FusedUpdater(object):
+    """
+    Apply update rules to many parameters with one vectorized pass per group.
+
+    Parameters are grouped by update rule, context, dtype and hyperparameters. Rules
+    other than sgd, sgd_momentum, rmsprop and adam are applied per parameter.
+
+    Inputs:
+    - update_rule: Name of the update rule or one of the rules of this module, used for
+      parameters whose config has no 'update_rule' entry.
+
+    Calling it with dictionaries of parameters, gradients and configs returns the
+    dictionary of next parameters. Configs are updated in place.
+    """
+
+    def __init__(self, update_rule='sgd'):
+        if not isinstance(update_rule, str):
+            update_rule = update_rule.__name__
+        self.update_rule = update_rule
+        self._groups = {}
+
+    def __call__(self, params, grads, configs):
+        next_params = {}
+        members = {}
+        for name, dw in grads.items():
+            w = params[name]
+            config = configs[name]
+            rule = config.get('update_rule', self.update_rule)
+            if rule not in _fused_rules or not isinstance(w, array.Array) or \
+               not isinstance(dw, array.Array):
+                next_params[name], configs[name] = globals()[rule](w, dw, config)
+                continue
+            _, defaults, state_names = _fused_rules[rule]
+            for key, value in defaults.items():
+                config.setdefault(key, value)
+            hyper = tuple(sorted(
+                (key, value) for key, value in config.items()
+                if key not in state_names and key not in ('t', 'update_rule') and
+                isinstance(value, (numbers.Number, str))))
+            context = w.context
+            key = (rule, context.device_typeid, context.device_id, str(w.dtype), hyper)
+            members.setdefault(key, []).append(name)
+        groups = {}
+        for key, names in members.items():
+            names = tuple(names)
+            group = self._groups.get((key, names))
+            if group is None:
+                context = params[names[0]].context
+                atype = ArrayType.NUMPY if context.device_type == 'cpu' \
+                        else ArrayType.MXNET
+                group = _FusedGroup(names, [params[name].shape for name in names], atype)
+            groups[(key, names)] = group
+            next_params.update(self._update(key[0], group, params, grads, configs))
+        # Groups that are not used anymore, e.g. after changing the learning rate,
+        # are dropped. Their state is kept in the configs.
+        self._groups = groups
+        return next_params
+
+    @staticmethod
+    def _update(rule, group, params, grads, configs):
+        """Update parameters of a group."""
+        kernel, _, state_names = _fused_rules[rule]
+        first = params[group.names[0]]
+        context = first.context
+        ctx = context.as_mxnet_context()
+        config = dict(configs[group.names[0]])
+        if rule == 'adam':
+            config['t'] += 1
+        w = group.flatten([params[name] for name in group.names],
+                          group.params, group.param_values)
+        dw = group.flatten([grads[name] for name in group.names])
+        state = {}
+        for state_name in state_names:
+            state[state_name] = group.flatten(
+                [configs[name].get(state_name) for name in group.names],
+                group.state.get(state_name), group.state_values.get(state_name),
+                dtype=first.dtype, ctx=ctx)
+        sqrt = numpy.sqrt if group.atype == ArrayType.NUMPY else mxnet.nd.sqrt
+        next_w = kernel(w, dw, state, config, sqrt)
+        group.params = next_w
+        group.param_values = group.unflatten(next_w, context)
+        for state_name in state_names:
+            group.state[state_name] = state[state_name]
+            group.state_values[state_name] = group.unflatten(state[state_name], context)
+        for i, name in enumerate(group.names):
+            for state_name in state_names:
+                configs[name][state_name] = group.state_values[state_name][i]
+            if rule == 'adam':
+                configs[name]['t'] = config['t']
+        return zip(group.names, group.param_values)
+
+
+"""
+In-place update rules.
+
+sgd_inplace, sgd_momentum_inplace, rmsprop_inplace and adam_inplace compute the same
+updates as the rules above, but mutate the parameter through `get_data_mutable` and
+keep optimizer state and scratch space as raw buffers of the backend holding the
+latest parameter data (MXNet on GPU, or when the MXNet data of the parameter is up to
+date, e.g. bound to the executors of `minpy.core.Function`, so that they are updated
+without a copy).
+They return the same `w`, record nothing on the tape, and allocate nothing once the
+buffers exist.
+"""
+
+
+def _active_type(w):
+    """Return the array type to update a parameter with."""
+    if w.context.device_type != 'cpu':
+        return ArrayType.MXNET
+    if w.has_valid_data(ArrayType.MXNET):
+        return ArrayType.MXNET
+    return ArrayType.NUMPY
+
+
+def _inplace_buffers(w, dw, config, names):
+    """
+    Return raw parameter, gradient and buffers of the given config entries.
+
+    Buffers that are missing, of another backend or shape are (re)created. Existing
+    state of another backend, e.g. from the rules above, is copied.
+    """
+    atype = _active_type(w)
+    raw_w = w.get_data_mutable(atype)
+    raw_dw = array.wrap(dw).get_data(atype)
+    raw_type = type(raw_w)
+    buffers = []
+    for name in names:
+        buf = config.get(name)
+        if not isinstance(buf, raw_type) or buf.shape != raw_w.shape:
+            if buf is None or buf.shape != raw_w.shape:
+                if atype == ArrayType.NUMPY:
+                    buf = numpy.zeros(raw_w.shape, dtype=raw_w.dtype)
+                else:
+                    buf = mxnet.nd.zeros(raw_w.shape, ctx=raw_w.context, dtype=raw_w.dtype)
+            else:
+                buf = array.wrap(buf).get_data(atype).copy()
+            config[name] = buf
+        buffers.append(buf)
+    return raw_w, raw_dw, buffers
+
+
+def _sqrt_inplace(x):
+    """Take square root of a raw buffer in place."""
+    if isinstance(x, numpy.ndarray):
+        numpy.sqrt(x, out=x)
+    else:
+        mxnet.nd.sqrt(x, out=x)
+
+
+def sgd_inplace(w, dw, config=None):
+    """
+    Performs vanilla stochastic gradient descent in place.
+
+    config format:
+    - learning_rate: Scalar learning rate.
+    - scratch: Buffer of the same shape as w.
+    """
+    if config is None:
+        config = {}
+    config.setdefault('learning_rate', 1e-2)
+    raw_w, raw_dw, (s, ) = _inplace_buffers(w, dw, config, ('scratch', ))
+
+    s[:] = raw_dw
+    s *= config['learning_rate']
+    raw_w -= s
+    return w, config
+
+
+def sgd_momentum_inplace(w, dw, config=None):
+    """
+    Performs stochastic gradient descent with momentum in place.
+
+    config format:
+    - learning_rate: Scalar learning rate.
+    - momentum: Scalar between 0 and 1 giving the momentum value.
+    - velocity: Buffer of the same shape as w storing a moving average of the gradients.
+    - scratch: Buffer of the same shape as w.
+    """
+    if config is None:
+        config = {}
+    config.setdefault('learning_rate', 1e-2)
+    config.setdefault('momentum', 0.9)
+    raw_w, raw_dw, (v, s) = _inplace_buffers(w, dw, config, ('velocity', 'scratch'))
+
+    v *= config['momentum']
+    s[:] = raw_dw
+    s *= config['learning_rate']
+    v -= s
+    raw_w += v
+    return w, config
+
+
+def rmsprop_inplace(x, dx, config=None):
+    """
+    Uses the RMSProp update rule in place.
+
+    config format:
+    - learning_rate: Scalar learning rate.
+    - decay_rate: Scalar between 0 and 1 giving the decay rate for the squared
+                  gradient cache.
+    - epsilon: Small scalar used for smoothing to avoid dividing by zero.
+    - cache: Moving average of second moments of gradients.
+    - scratch, scratch2: Buffers of the same shape as x.
+    """
+    if config is None:
+        config = {}
+    config.setdefault('learning_rate', 1e-2)
+    config.setdefault('decay_rate', 0.99)
+    config.setdefault('epsilon', 1e-8)
+    raw_x, raw_dx, (cache, s, s2) = _inplace_buffers(
+        x, dx, config, ('cache', 'scratch', 'scratch2'))
+
+    cache *= config['decay_rate']
+    s[:] = raw_dx
+    s *= raw_dx
+    s *= 1 - config['decay_rate']
+    cache += s
+    s[:] = cache
+    _sqrt_inplace(s)
+    s += config['epsilon']
+    s2[:] = raw_dx
+    s2 *= config['learning_rate']
+    s2 /= s
+    raw_x -= s2
+    return x, config
+
+
+def adam_inplace(x, dx, config=None):
+    """
+    Uses the Adam update rule in place.
+
+    config format:
+    - learning_rate: Scalar learning rate.
+    - beta1: Decay rate for moving average of first moment of gradient.
+    - beta2: Decay rate for moving average of second moment of gradient.
+    - epsilon: Small scalar used for smoothing to avoid dividing by zero.
+    - m: Moving average of gradient.
+    - v: Moving average of squared gradient.
+    - t: Iteration number.
+    - scratch, scratch2: Buffers of the same shape as x.
+    """
+    if config is None:
+        config = {}
+    config.setdefault('learning_rate', 1e-3)
+    config.setdefault('beta1', 0.9)
+    config.setdefault('beta2', 0.999)
+    config.setdefault('epsilon', 1e-8)
+    config.setdefault('t', 0)
+    raw_x, raw_dx, (m, v, s, s2) = _inplace_buffers(
+        x, dx, config, ('m', 'v', 'scratch', 'scratch2'))
+    config['t'] += 1
+    t = config['t']
+
+    m *= config['beta1']
+    s[:] = raw_dx
+    s *= 1 - config['beta1']
+    m += s
+    v *= config['beta2']
+    s[:] = raw_dx
+    s *= raw_dx
+    s *= 1 - config['beta2']
+    v += s
+    s[:] = m
+    s /= 1 - config['beta1']**t
+    s2[:] = v
+    s2 /= 1 - config['beta2']**t
+    _sqrt_inplace(s2)
+    s2 += config['epsilon']
+    s *= config['learning_rate']
+    s /= s2
+    raw_x -= s
+    return x, config
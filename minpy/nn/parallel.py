@@ -0,0 +1,430 @@
+""" Data-parallel and asynchronous training with worker processes. """
+from __future__ import division
+from __future__ import absolute_import
+from __future__ import print_function
+
+import collections
+import multiprocessing
+import os
+import sys
+import threading
+import traceback
+
+import numpy
+
+from minpy import array
+from minpy.nn import optim
+from minpy.nn.io import DataBatch
+from minpy.nn.solver import Solver
+from minpy.utils import log
+
+# pylint: disable=invalid-name, too-many-instance-attributes, attribute-defined-outside-init
+_logger = log.get_logger(__name__)
+
+
+def _shared_array(context, shape, dtype):
+    """Allocate NumPy array in shared memory, which is inherited by forked processes."""
+    dtype = numpy.dtype(dtype)
+    raw = context.RawArray('b', max(int(numpy.prod(shape)), 1) * dtype.itemsize)
+    return numpy.frombuffer(raw, dtype=dtype)[:int(numpy.prod(shape))].reshape(shape)
+
+
+class DataParallelSolver(Solver):
+    """
+    A Solver that splits each batch across worker processes on CPU.
+
+    On the first step, `num_workers - 1` processes are forked from the training process,
+    which acts as worker 0. For every batch:
+
+    1. The training process writes the batch and the current parameters into shared
+       memory.
+    2. Every worker computes gradients and loss on its shard of the batch, weighted by
+       the shard size, and writes them into its slot of a shared gradient buffer.
+    3. The gradients are all-reduced in shared memory: each worker sums its own
+       1/num_workers of every gradient over all slots (reduce-scatter), and the
+       reduced parts form the shared result that every worker can read (all-gather).
+    4. The training process applies one optimizer update with the reduced gradients.
+       Workers load the updated parameters on the next batch, so replicas stay in sync.
+
+    The optimizer state, learning rate decay, and accuracy checks live in the training
+    process only. Auxiliary parameters (e.g. running statistics) are updated by the
+    training process from its own shard.
+
+    Parameters
+    ----------
+    num_workers : int, optional
+        Number of processes computing gradients, including the training process.
+        Default is 2.
+
+    Other arguments are the same as `Solver`. The model's forward function should work
+    with any batch size, as shards are smaller than batches.
+    """
+
+    def __init__(self, model, train_dataiter, test_dataiter, **kwargs):
+        self.num_workers = kwargs.pop('num_workers', 2)
+        if self.num_workers < 1:
+            raise ValueError('num_workers should be positive.')
+        self._workers = None
+        super(DataParallelSolver, self).__init__(model, train_dataiter,
+                                                 test_dataiter, **kwargs)
+
+    def train(self):
+        """
+        Run optimization to train the model. Worker processes are stopped afterwards.
+        """
+        try:
+            super(DataParallelSolver, self).train()
+        finally:
+            self.close()
+
+    def _start(self, batch):
+        """Allocate shared memory for batches like the given one and fork workers."""
+        if sys.platform == 'win32':
+            raise RuntimeError('DataParallelSolver needs to fork worker processes.')
+        context = multiprocessing
+        if hasattr(multiprocessing, 'get_context'):
+            context = multiprocessing.get_context('fork')
+        num = self.num_workers
+        self._batch_data = [_shared_array(context, d.shape, d.dtype) for d in batch.data]
+        self._batch_label = [_shared_array(context, l.shape, l.dtype) for l in batch.label]
+        self._param_keys = list(self.model.params.keys())
+        self._shared_params = {}
+        self._grad_slots = {}
+        self._reduced = {}
+        for name in self._param_keys:
+            param = self.model.params[name]
+            self._shared_params[name] = _shared_array(context, param.shape, param.dtype)
+            self._grad_slots[name] = _shared_array(
+                context, (num, int(numpy.prod(param.shape))), param.dtype)
+            self._reduced[name] = _shared_array(context, param.shape, param.dtype)
+        self._losses = _shared_array(context, (num, ), numpy.float64)
+        self._stop = context.RawValue('b', 0)
+        self._barrier = context.Barrier(num)
+        self._workers = []
+        for rank in range(1, num):
+            worker = context.Process(target=self._worker_loop, args=(rank, ))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+        _logger.info('Started %d data parallel workers.', num - 1)
+
+    def close(self):
+        """Stop the worker processes."""
+        if self._workers is None:
+            return
+        self._stop.value = 1
+        try:
+            self._barrier.wait(timeout=10.0)
+        except threading.BrokenBarrierError:
+            pass
+        for worker in self._workers:
+            worker.join(timeout=10.0)
+            if worker.is_alive():
+                worker.terminate()
+        self._workers = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception: # pylint: disable=broad-except
+            pass
+
+    def _wait(self):
+        """Wait for all workers."""
+        try:
+            self._barrier.wait()
+        except threading.BrokenBarrierError:
+            self._workers, workers = None, self._workers
+            for worker in workers or []:
+                worker.terminate()
+            raise RuntimeError('A data parallel worker failed.')
+
+    def _worker_loop(self, rank):
+        """Body of a worker process."""
+        try:
+            while True:
+                self._barrier.wait()
+                if self._stop.value:
+                    break
+                self._run_shard(rank)
+                self._barrier.wait()
+                self._reduce(rank)
+                self._barrier.wait()
+        except threading.BrokenBarrierError:
+            pass
+        except Exception: # pylint: disable=broad-except
+            traceback.print_exc()
+            self._barrier.abort()
+        # Skip cleanup inherited from the training process.
+        os._exit(0) # pylint: disable=protected-access
+
+    def _shard(self, rank):
+        """Return the row range of a worker."""
+        num_rows = self._batch_data[0].shape[0]
+        return rank * num_rows // self.num_workers, (rank + 1) * num_rows // self.num_workers
+
+    def _run_shard(self, rank):
+        """Compute weighted gradients and loss on the shard of a worker."""
+        low, high = self._shard(rank)
+        num_rows = self._batch_data[0].shape[0]
+        if high == low:
+            for name in self._param_keys:
+                self._grad_slots[name][rank] = 0
+            self._losses[rank] = 0
+            return
+        if rank != 0:
+            for name in self._param_keys:
+                self.model.params[name] = array.wrap(numpy.array(self._shared_params[name]))
+        shard = DataBatch(
+            data=[array.wrap(numpy.array(d[low:high])) for d in self._batch_data],
+            label=[array.wrap(numpy.array(l[low:high])) for l in self._batch_label])
+        grads, loss = self._compute_gradients(shard)
+        weight = (high - low) / num_rows
+        for name in self._param_keys:
+            self._grad_slots[name][rank] = grads[name].asnumpy().ravel() * weight
+        self._losses[rank] = float(loss.asnumpy()) * weight
+
+    def _reduce(self, rank):
+        """Sum the part of every gradient owned by a worker over all slots."""
+        for name in self._param_keys:
+            slots = self._grad_slots[name]
+            size = slots.shape[1]
+            low = rank * size // self.num_workers
+            high = (rank + 1) * size // self.num_workers
+            self._reduced[name].reshape(-1)[low:high] = slots[:, low:high].sum(axis=0)
+
+    def _step(self, batch):
+        """
+        Make a single gradient update with all workers.
+        """
+        if self._workers is None:
+            self._start(batch)
+        for buf, data in zip(self._batch_data + self._batch_label,
+                             list(batch.data) + list(batch.label)):
+            data = data.asnumpy() if isinstance(data, array.Array) else numpy.asarray(data)
+            if data.shape != buf.shape:
+                raise ValueError('All batches should have shape %s, got %s.' %
+                                 (buf.shape, data.shape))
+            buf[...] = data
+        for name in self._param_keys:
+            self._shared_params[name][...] = self.model.params[name].asnumpy()
+        self._wait()
+        self._run_shard(0)
+        self._wait()
+        self._reduce(0)
+        self._wait()
+        grads = {name: array.wrap(numpy.array(self._reduced[name]))
+                 for name in self._param_keys}
+        self.loss_history.append(numpy.float64(self._losses.sum()))
+        self._update(grads)
+
+
+AsyncTrainerStats = collections.namedtuple(
+    'AsyncTrainerStats', ['applied', 'dropped', 'max_staleness_seen'])
+
+
+class ParameterClient(object):
+    # pylint: disable=protected-access
+    """
+    Access of a worker process to the parameter server of an `AsyncTrainer`.
+
+    Workers pull the latest parameters, compute gradients on their own data and push
+    them back. A push returns as soon as the gradients are written into the worker's
+    slot in shared memory; the next push waits until the server has consumed them.
+    """
+
+    def __init__(self, rank, trainer):
+        self.rank = rank
+        self._trainer = trainer
+        self.version = 0
+
+    def pull(self):
+        """
+        Return the latest parameters as a dictionary of arrays. Gradients pushed next
+        are considered to be computed on them.
+        """
+        trainer = self._trainer
+        with trainer._lock:
+            params = {name: array.wrap(numpy.array(buf))
+                      for name, buf in trainer._shared_params.items()}
+            self.version = trainer._version.value
+        return params
+
+    def push(self, grads):
+        """Send gradients of all parameters to the server."""
+        trainer = self._trainer
+        trainer._slot_free[self.rank].acquire()
+        for name, buf in trainer._grad_slots[self.rank].items():
+            grad = grads[name]
+            buf[...] = grad.asnumpy() if isinstance(grad, array.Array) else grad
+        trainer._messages.put((self.rank, self.version))
+
+    def should_stop(self):
+        """Return whether the server has applied enough updates."""
+        return bool(self._trainer._stop.value)
+
+
+class AsyncTrainer(object):
+    """
+    Asynchronous (A3C-style) training with a parameter server process.
+
+    `num_workers` processes run a user function that repeatedly pulls parameters,
+    computes gradients on its own rollouts or data, and pushes them. A server process
+    applies each pushed gradient with the update rule as soon as it arrives and serves
+    the updated parameters to later pulls. Parameters and gradients are exchanged
+    through shared memory; only small messages go through a queue.
+
+    A gradient is stale by the number of updates applied since the parameters it was
+    computed on were pulled. Gradients more stale than `max_staleness` are dropped.
+
+    Parameters
+    ----------
+    params : dict
+        Initial parameters, name to array.
+    update_rule : optional
+        Update rule in optim.py, or its name. Default is 'sgd'.
+    optim_config : dict, optional
+        Hyperparameters of the update rule, shared by all parameters.
+    num_workers : int, optional
+        Number of worker processes. Default is 2.
+    max_staleness : int, optional
+        Maximal staleness of applied gradients. Default is None, for no bound.
+    """
+
+    def __init__(self, params, update_rule='sgd', optim_config=None, num_workers=2,
+                 max_staleness=None):
+        # pylint: disable=too-many-arguments
+        if isinstance(update_rule, str):
+            update_rule = getattr(optim, update_rule)
+        self.update_rule = update_rule
+        self.optim_config = dict(optim_config or {})
+        self.num_workers = num_workers
+        self.max_staleness = max_staleness
+        self.params = {name: array.wrap(value) for name, value in params.items()}
+        self.stats = AsyncTrainerStats(0, 0, 0)
+
+    def _setup(self, context):
+        """Allocate shared memory and synchronization primitives."""
+        self._shared_params = {}
+        for name, value in self.params.items():
+            value = value.asnumpy()
+            self._shared_params[name] = _shared_array(context, value.shape, value.dtype)
+            self._shared_params[name][...] = value
+        self._grad_slots = [{name: _shared_array(context, buf.shape, buf.dtype)
+                             for name, buf in self._shared_params.items()}
+                            for _ in range(self.num_workers)]
+        self._slot_free = [context.Semaphore(1) for _ in range(self.num_workers)]
+        self._lock = context.Lock()
+        self._version = context.RawValue('l', 0)
+        self._stop = context.RawValue('b', 0)
+        self._counters = context.RawArray('l', 3)
+        self._messages = context.Queue()
+
+    def run(self, worker_fn, num_updates):
+        """
+        Train until the server has applied `num_updates` gradients.
+
+        Parameters
+        ----------
+        worker_fn
+            Function of the worker rank and a `ParameterClient`, run in each worker
+            process. It should pull and push until `client.should_stop()`.
+        num_updates : int
+            Number of gradients to apply.
+
+        Returns
+        -------
+        dict
+            The trained parameters, which are also stored in `self.params`.
+        """
+        if sys.platform == 'win32':
+            raise RuntimeError('AsyncTrainer needs to fork worker processes.')
+        context = multiprocessing
+        if hasattr(multiprocessing, 'get_context'):
+            context = multiprocessing.get_context('fork')
+        self._setup(context)
+        server = context.Process(target=self._server_loop, args=(num_updates, ))
+        server.daemon = True
+        server.start()
+        workers = []
+        for rank in range(self.num_workers):
+            worker = context.Process(target=self._worker_main, args=(worker_fn, rank))
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+        for worker in workers:
+            worker.join()
+        server.join()
+        failed = [worker.exitcode for worker in workers + [server] if worker.exitcode != 0]
+        self.params = {name: array.wrap(numpy.array(buf))
+                       for name, buf in self._shared_params.items()}
+        self.stats = AsyncTrainerStats(*self._counters)
+        if failed:
+            raise RuntimeError('Asynchronous training processes failed.')
+        _logger.info('Applied %d gradients, dropped %d stale ones.',
+                     self.stats.applied, self.stats.dropped)
+        return self.params
+
+    def _worker_main(self, worker_fn, rank):
+        """Body of a worker process."""
+        code = 0
+        try:
+            worker_fn(rank, ParameterClient(rank, self))
+        except Exception: # pylint: disable=broad-except
+            traceback.print_exc()
+            # Let the others finish.
+            self._stop.value = 1
+            code = 1
+        self._messages.put((rank, None))
+        # Flush the queue before exiting without cleanup.
+        self._messages.close()
+        self._messages.join_thread()
+        os._exit(code) # pylint: disable=protected-access
+
+    def _server_loop(self, num_updates):
+        """Body of the server process."""
+        code = 0
+        try:
+            self._serve(num_updates)
+        except Exception: # pylint: disable=broad-except
+            traceback.print_exc()
+            code = 1
+        os._exit(code) # pylint: disable=protected-access
+
+    def _serve(self, num_updates):
+        """Apply pushed gradients until enough are applied and all workers exited."""
+        params = {name: array.wrap(numpy.array(buf))
+                  for name, buf in self._shared_params.items()}
+        configs = {name: dict(self.optim_config) for name in params}
+        applied, dropped, max_seen = 0, 0, 0
+        num_running = self.num_workers
+        while num_running > 0:
+            rank, version = self._messages.get()
+            if version is None:
+                num_running -= 1
+                continue
+            staleness = self._version.value - version
+            if self._stop.value:
+                # Training is finished, only free the slot.
+                self._slot_free[rank].release()
+                continue
+            if self.max_staleness is not None and staleness > self.max_staleness:
+                dropped += 1
+                self._slot_free[rank].release()
+                self._counters[1] = dropped
+                continue
+            max_seen = max(max_seen, staleness)
+            for name, buf in self._grad_slots[rank].items():
+                grad = array.wrap(numpy.array(buf))
+                params[name], configs[name] = self.update_rule(params[name], grad,
+                                                               configs[name])
+            self._slot_free[rank].release()
+            with self._lock:
+                for name, buf in self._shared_params.items():
+                    buf[...] = params[name].asnumpy()
+                self._version.value += 1
+            applied += 1
+            self._counters[:] = [applied, dropped, max_seen]
+            if applied >= num_updates:
+                self._stop.value = 1
+        self._counters[:] = [applied, dropped, max_seen]
@@ -5,6 +5,7 @@ from __future__ import print_function
 import time
 
 from minpy.nn import optim, init
+from minpy.nn.io import DataBatch
 from minpy import core
 import minpy.numpy as np
 # pylint: disable=fixme, invalid-name, too-many-instance-attributes, no-member, attribute-defined-outside-init
@@ -83,6 +84,14 @@ class Solver(object):
         Training losses will be printed every print_every iterations.
     verbose : bool, optional
         If false, no output will be printed during training.
+    replay : bool, optional
+        If true, the primitives called by the forward and loss functions of the
+        model are traced on the first batch and replayed for the following
+        batches of the same shape, see `core.grad_and_loss`. The model should
+        not update Python state (e.g. running statistics) during forward.
+    fused_update : bool, optional
+        If true, sgd, sgd_momentum, rmsprop and adam updates of all parameters
+        are applied in one vectorized pass, see `optim.FusedUpdater`.
     """
 
     def __init__(self, model, train_dataiter, test_dataiter, **kwargs):
@@ -101,6 +110,8 @@ class Solver(object):
         self.train_acc_num_samples = kwargs.pop('train_acc_num_samples', 1000)
         self.print_every = kwargs.pop('print_every', 10)
         self.verbose = kwargs.pop('verbose', True)
+        self.replay = kwargs.pop('replay', False)
+        self.fused_update = kwargs.pop('fused_update', False)
 
         # Throw an error if there are extra keyword arguments
         if len(kwargs) > 0:
@@ -112,6 +123,9 @@ class Solver(object):
         if not hasattr(optim, self.update_rule):
             raise ValueError('Invalid update_rule "%s"' % self.update_rule)
         self.update_rule = getattr(optim, self.update_rule)
+        self._fused_updater = None
+        if self.fused_update:
+            self._fused_updater = optim.FusedUpdater(self.update_rule)
 
         self._reset()
 
@@ -127,6 +141,8 @@ class Solver(object):
         self.loss_history = []
         self.train_acc_history = []
         self.val_acc_history = []
+        self._replay_func = None
+        self._replay_batch = None
         self._reset_data_iterators()
 
         # Make a deep copy of the optim_config for each parameter
@@ -166,6 +182,14 @@ class Solver(object):
         Make a single gradient update. This is called by train() and should not
         be called manually.
         """
+        grads, loss = self._compute_gradients(batch)
+        self.loss_history.append(loss.asnumpy())
+        self._update(grads)
+
+    def _compute_gradients(self, batch):
+        """
+        Compute gradients of all parameters and the loss on a batch.
+        """
         # Compute loss and gradient
         def loss_func(*params): # pylint: disable=unused-argument
             """
@@ -179,14 +203,23 @@ class Solver(object):
 
         param_arrays = list(self.model.params.values())
         param_keys = list(self.model.params.keys())
-        grad_and_loss_func = core.grad_and_loss(
-            loss_func, argnum=range(len(param_arrays)))
-        grad_arrays, loss = grad_and_loss_func(*param_arrays)
-        grads = dict(zip(param_keys, grad_arrays))
-
-        self.loss_history.append(loss.asnumpy())
+        if self.replay:
+            grad_arrays, loss = self._replay_step(batch, param_arrays)
+        else:
+            grad_and_loss_func = core.grad_and_loss(
+                loss_func, argnum=range(len(param_arrays)))
+            grad_arrays, loss = grad_and_loss_func(*param_arrays)
+        return dict(zip(param_keys, grad_arrays)), loss
 
-        # Perform a parameter update
+    def _update(self, grads):
+        """
+        Perform a parameter update with the given gradients.
+        """
+        if self._fused_updater is not None:
+            next_params = self._fused_updater(self.model.params, grads, self.optim_configs)
+            for p in grads:
+                self.model.params[p] = next_params[p]
+            return
         for p, w in self.model.params.items():
             dw = grads[p]
             config = self.optim_configs[p]
@@ -194,6 +227,35 @@ class Solver(object):
             self.model.params[p] = next_w
             self.optim_configs[p] = next_config
 
+    def _replay_step(self, batch, param_arrays):
+        """
+        Compute gradients and loss with a replayable loss function. Batch data
+        and labels are passed as arguments so that traces could be reused for
+        the following batches.
+        """
+        num_params = len(param_arrays)
+        if self._replay_func is None:
+            def loss_func(*args):
+                """
+                Loss function of parameters followed by batch data and labels
+                """
+                num_data = len(self._replay_batch.data)
+                replay_batch = DataBatch(
+                    list(args[num_params:num_params + num_data]),
+                    list(args[num_params + num_data:]),
+                    self._replay_batch.pad, self._replay_batch.index)
+                predict = self.model.forward_batch(replay_batch, mode='train')
+                return self.model.loss_batch(replay_batch, predict)
+
+            self._replay_func = core.grad_and_loss(
+                loss_func, argnum=range(num_params), replay=True)
+        self._replay_batch = batch
+        try:
+            return self._replay_func(*(param_arrays + list(batch.data) +
+                                       list(batch.label)))
+        finally:
+            self._replay_batch = None
+
     def check_accuracy(self, dataiter, num_samples=None):
         """
         Check accuracy of the model on the provided data.
@@ -290,6 +352,10 @@ class Solver(object):
                 print('(Epoch {} / {}) train {}: {}, val {}: {}, time: {}.'.
                       format(self.epoch, self.num_epochs, target, train_acc,
                              target, val_acc, time.time() - start))
+                wait_times = getattr(self.train_dataiter, 'epoch_wait_times', None)
+                if wait_times:
+                    print('(Epoch {} / {}) waited {:.3f}s for data.'.format(
+                        self.epoch, self.num_epochs, wait_times[-1]))
 
             # Keep track of the best model
             if val_acc > self.best_val_acc:
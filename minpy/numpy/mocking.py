@@ -7,6 +7,7 @@ by policy which could be specified by user.
 """
 from __future__ import absolute_import
 
+import functools
 import importlib
 
 import minpy
@@ -16,6 +17,11 @@ from minpy.dispatch.primitive_selector import PrimitiveSelector
 from minpy.primitive import Primitive
 from minpy.utils import log
 
+def _make_primitive(vtype, func, *args, **kwargs):
+    """Create a primitive of the given implementation type."""
+    return Primitive(func, vtype, *args, **kwargs)
+
+
 class Module(object):
     """Mocking module class for name dispatching.
 
@@ -36,6 +42,8 @@ class Module(object):
         # Add module itself into global config
         minpy.Config['modules'].append(self)
         self._registry = Registry(old['__name__'])
+        # Names of primitives resolved to attributes under the current policy.
+        self._resolved = set()
         self._logger = log.get_logger(old['__name__'])
         self._logger.info('Initialize module: %s.', old['__name__'])
         self._old = old
@@ -50,17 +58,18 @@ class Module(object):
                 modname = 'minpy.array_variants.{}.{}'.format(vname, name)
             mod = importlib.import_module(modname)
             self._logger.info('Importing from %s.', modname)
-            primitive_wrapper = lambda func, *args, **kwargs:\
-                    Primitive(func, vtype, *args, **kwargs)
+            # Primitives may be created after the loop, so the type is bound here.
+            primitive_wrapper = functools.partial(_make_primitive, vtype)
             # Register all primitives of the module.
-            before = len(self._registry._reg)
+            before = len(self._registry.names())
             mod.register_primitives(self._registry, primitive_wrapper)
             self._logger.info('Got %d primitives from %s',
-                              len(self._registry._reg) - before, modname)
-            primitive_getter = lambda name: self._registry.get(name, vtype)
+                              len(self._registry.names()) - before, modname)
+            # Gradients are attached when a primitive is created.
+            primitive_getter = functools.partial(self._registry.grad_definitions, ptype=vtype)
             # Define gradients of primitives.
             mod.def_grads(primitive_getter)
-        self._logger.info('Import %d primitives', len(self._registry._reg))
+        self._logger.info('Import %d primitives', len(self._registry.names()))
         self.generate_attrs(minpy.Config['default_policy'])
         # pylint: enable= protected-access, cell-var-from-loop
 
@@ -77,25 +86,46 @@ class Module(object):
         self.policy.show_op_stat()
 
     def generate_attrs(self, policy, use_selector=False):
-        """Generate attributes for this module"""
+        """Generate attributes for this module.
+
+        Names of primitives are resolved on first access by :meth:`__getattr__`.
+        """
         self.policy = policy
+        self._use_selector = use_selector or policy.resolve_per_call
+        # Drop primitives resolved under the previous policy.
+        for k in self._resolved:
+            delattr(self, k)
+        self._resolved = set()
         # The latter will override the former, so set attributes in reverse priority order
         for k, val in self._old.items():
             setattr(self, k, val)
         for k in self._name_injector.keys():
             setattr(self, k, self._name_injector[k])
-        for k, prims in self._registry._reg.items(): # pylint: disable= protected-access
-            if not use_selector:
-                prim_type = self.policy.decide(prims.values())
-                if prim_type is not None:
-                    setattr(self, k, prims[prim_type])
-            else:
-                fun = PrimitiveSelector(k, self)
-                setattr(self, k, fun)
         if '__all__' in dir(self._old):
             setattr(self, '__all__', self._old.__all__)
         setattr(self, '__registry__', self._registry)
 
+    def __getattr__(self, name):
+        # Only called for attributes not set yet, i.e. primitives not resolved yet.
+        if name.startswith('__'):
+            raise AttributeError(name)
+        registry = self.__dict__.get('_registry')
+        if registry is None or not registry.has_name(name):
+            raise AttributeError('module {} has no attribute {}'.format(
+                registry.nspace if registry is not None else '', name))
+        if self._use_selector:
+            fun = PrimitiveSelector(name, self)
+        else:
+            prims = registry.get_all(name)
+            prim_type = self.policy.decide(prims.values())
+            if prim_type is None:
+                raise AttributeError('No implementation of {} is available under the '
+                                     'current policy'.format(name))
+            fun = prims[prim_type]
+        setattr(self, name, fun)
+        self._resolved.add(name)
+        return fun
+
 
 class NameInjector(object):
     """A proxy class dispatching given names into another class
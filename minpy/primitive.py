@@ -206,7 +206,23 @@ class Primitive(object):
                           current_tape))
         return bp_idx, bp_kw
 
-    def call(self, args, kwargs):  # pylint: disable= too-many-branches
+    def _call_raw(self, arg_values, kwarg_values):
+        """Call the wrapped function on converted arguments and wrap the result."""
+        if self.type == ArrayType.MXNET:
+            with context.current_context().as_mxnet_context():
+                result_value = self._func(*arg_values, **kwarg_values)
+        else:
+            result_value = self._func(*arg_values, **kwarg_values)
+
+        # Wrap the result raw value with wrapper and node.
+        if isinstance(result_value, tuple):
+            # Multiple return values.
+            result = tuple(array.wrap(ret) for ret in result_value)
+        else:
+            result = array.wrap(result_value)  # pylint: disable= redefined-variable-type
+        return result_value, result
+
+    def call(self, args, kwargs):
         """Call wrapped function -- compact argument ver.
 
         Parameters
@@ -226,156 +242,174 @@ class Primitive(object):
         IndexError, KeyError
             No corresponding gradient function.
         """
-        # pylint: disable=too-many-locals, too-many-nested-blocks
-        _logger.debug(
-            'Calling "{}" type "{}".'.format(self._func, self.typestr))
+        _logger.debug('Calling "%s" type "%s".', self._func, self.typestr)
 
         # Call the real function with raw value.
         # Convert arguments.
         arg_values, kwarg_values = self._convert_args(args, kwargs)
-        if self.type == ArrayType.MXNET:
-            with context.current_context().as_mxnet_context():
-                result_value = self._func(*arg_values, **kwarg_values)
-        else:
-            result_value = self._func(*arg_values, **kwarg_values)
-
-        # Wrap the result raw value with wrapper and node.
-        if isinstance(result_value, tuple):
-            # Multiple return values.
-            result = tuple(array.wrap(ret) for ret in result_value)
-        else:
-            result = array.wrap(result_value)  # pylint: disable= redefined-variable-type
+        result_value, result = self._call_raw(arg_values, kwarg_values)
 
         # Check whether the result value is on the path of bp phase.
         # If all the input arguments are not on the bp path, the result value
         # is not as well.
         current_tape = tape.global_tape()
         bp_idx, bp_kw = Primitive._get_bp_args(args, kwargs, current_tape)
-        need_bp = len(bp_idx) != 0 or len(bp_kw) != 0
+        if len(bp_idx) != 0 or len(bp_kw) != 0:
+            self._record_partial_derivatives(args, kwargs, arg_values,
+                                             kwarg_values, result_value,
+                                             result, bp_idx, bp_kw,
+                                             current_tape)
+        # pylint: disable= protected-access
+        if array._active_trace is not None:
+            array._active_trace.record(self, args, kwargs, result, bp_idx, bp_kw)
+        # pylint: enable= protected-access
+        return result
 
-        if need_bp:
-            if isinstance(result, tuple):
-                for res in result:
-                    res.mark_for_bp(current_tape)
-            else:
-                result.mark_for_bp(current_tape)  # pylint: disable= no-member
+    def replay(self, args, kwargs, bp_idx, bp_kw, current_tape):
+        """Call wrapped function with the back propagation arguments already known.
 
-            # Record partial derivative paths, only for `array.Value` type values.
-            # If no gradient function is defined, also omit it.
-            visited_arg_indices = set()
+        Used by :mod:`minpy.trace` to re-run a recorded call without dispatching
+        and without scanning arguments for back propagation.
 
-            def get_context(result):
-                """Get context of result."""
-                if isinstance(result, array.Value):
-                    return result.context
-                else:
-                    return get_context(result[0])
+        Parameters
+        ----------
+        args
+            Arguments for the wrapped function.
+        kwargs
+            Keyword arguments for the wrapped function.
+        bp_idx : tuple
+            Indices of positional arguments that need back propagation.
+        bp_kw : tuple
+            Keywords of arguments that need back propagation.
+        current_tape : tape.Tape
+            Tape to record partial derivatives on.
 
-            def context_wrapper(func):
-                """A context wrapper only for gradient function."""
+        Returns
+        -------
+        array.Value
+            An :class:`array.Value` representing the result.
+        """
+        arg_values, kwarg_values = self._convert_args(args, kwargs)
+        result_value, result = self._call_raw(arg_values, kwarg_values)
+        if len(bp_idx) != 0 or len(bp_kw) != 0:
+            self._record_partial_derivatives(args, kwargs, arg_values,
+                                             kwarg_values, result_value,
+                                             result, bp_idx, bp_kw,
+                                             current_tape)
+        return result
 
-                @functools.wraps(func)
-                def wrapped(result):  # pylint: disable= missing-docstring
-                    with get_context(result).as_mxnet_context():
-                        return func(result)
+    def _record_partial_derivatives(self, args, kwargs, arg_values,
+                                    kwarg_values, result_value, result,
+                                    bp_idx, bp_kw, current_tape):
+        """Mark result for back propagation and record its partial derivatives on the tape."""
+        # pylint: disable=too-many-locals, too-many-branches
+        if isinstance(result, tuple):
+            for res in result:
+                res.mark_for_bp(current_tape)
+        else:
+            result.mark_for_bp(current_tape)  # pylint: disable= no-member
 
-                return wrapped
+        # Record partial derivative paths, only for `array.Value` type values.
+        # If no gradient function is defined, also omit it.
+        visited_arg_indices = set()
 
-            def raw_value_wrapper(func):
-                """Unwrap Value for gradient function."""
+        def get_context(result):
+            """Get context of result."""
+            if isinstance(result, array.Value):
+                return result.context
+            else:
+                return get_context(result[0])
+
+        def context_wrapper(func):
+            """A context wrapper only for gradient function."""
 
-                @functools.wraps(func)
-                def wrapped(result):  # pylint: disable= missing-docstring
-                    if isinstance(result, tuple):
-                        result = (elm.get_data(self.type) for elm in result)
-                    else:
-                        result = result.get_data(self.type)  # pylint: disable= no-member
+            @functools.wraps(func)
+            def wrapped(result):  # pylint: disable= missing-docstring
+                with get_context(result).as_mxnet_context():
                     return func(result)
 
-                return wrapped
-
-            # Add derivative for positional arguments.
-            for i in bp_idx:
-                arg = args[i]
-                if i in visited_arg_indices:
-                    # Derivative on this index has already been recorded.
-                    continue
-                visited_arg_indices.add(i)
-                if i not in self._grad_func:
-                    _logger.debug(
-                        'Partial derivative of {} "{}" on'
-                        'argument {} is not defined.'
-                        .format(self._type_str, self._func.__name__, i))
-                    grad_func = FakeGradFunc(
-                        self._type_str + ' ' + self._func.__name__, i)
-                    owner = arg
-                else:
-                    _logger.debug(
-                        'Adding partial derivative to func "{}" on argument {}.'.
-                        format(self._func, i))
-                    grad_func_rec = self._grad_func[i]
-                    # Save forward results and arguments in the gradient function closure
-                    # for later use.
-                    grad_func = grad_func_rec.f(result_value, *arg_values, **
-                                                kwarg_values)
-
-                    if grad_func_rec.multi_grad_indices is None:
-                        # Derivative function of each argument is defined separately.
-                        owner = arg
-                    else:
-                        # Derivative function could compute gradients of multiple arguments
-                        # in one call.
-                        owner = []
-                        for grad_index in grad_func_rec.multi_grad_indices:
-                            if (isinstance(args[grad_index], array.Value) and \
-                                args[grad_index].is_marked_for_bp(current_tape)):
-                                owner.append(args[grad_index])
-                            else:
-                                # Use None as placeholder for arguments that do not require
-                                # gradient computation.
-                                owner.append(None)
-                            visited_arg_indices.add(grad_index)
-                    grad_func = raw_value_wrapper(grad_func)  # pylint: disable=redefined-variable-type
-                    if self.type == ArrayType.MXNET:
-                        grad_func = context_wrapper(grad_func)
+            return wrapped
+
+        def raw_value_wrapper(func):
+            """Unwrap Value for gradient function."""
+
+            @functools.wraps(func)
+            def wrapped(result):  # pylint: disable= missing-docstring
                 if isinstance(result, tuple):
-                    for elm in result:
-                        current_tape.add_partial_derivative(grad_func, owner,
-                                                            elm)
-                else:
-                    current_tape.add_partial_derivative(grad_func, owner,
-                                                        result)
-
-            # Add derivative for keyword arguments.
-            for k in bp_kw:
-                arg = kwargs[k]
-                if k not in self._grad_func_kw:
-                    _logger.debug(
-                        'Partial derivative of {} "{}" on keyword argument "{}"'
-                        'is not defined.'.format(self._type_str,
-                                                 self._func.__name__, k))
-                    grad_func = FakeGradFunc(
-                        self._type_str + ' ' + self._func.__name__, k)
+                    result = tuple(elm.get_data(self.type) for elm in result)
                 else:
-                    _logger.debug(
-                        'Adding partial derivative to func "{}" on keyword argument "{}".'.
-                        format(self._func, k))
-                    grad_func_rec = self._grad_func_kw[k]
-                    grad_func = grad_func_rec.f(result_value, *arg_values,
-                                                **kwarg_values)
-                    grad_func = raw_value_wrapper(grad_func)
-                    if self.type == ArrayType.MXNET:
-                        grad_func = context_wrapper(grad_func)
-                if isinstance(result, tuple):
-                    for elm in result:
-                        current_tape.add_partial_derivative(grad_func, owner,
-                                                            elm)
+                    result = result.get_data(self.type)  # pylint: disable= no-member
+                return func(result)
+
+            return wrapped
+
+        # Add derivative for positional arguments.
+        for i in bp_idx:
+            arg = args[i]
+            if i in visited_arg_indices:
+                # Derivative on this index has already been recorded.
+                continue
+            visited_arg_indices.add(i)
+            if i not in self._grad_func:
+                _logger.debug(
+                    'Partial derivative of %s "%s" on argument %s is not defined.',
+                    self._type_str, self._func.__name__, i)
+                grad_func = FakeGradFunc(
+                    self._type_str + ' ' + self._func.__name__, i)
+                owner = arg
+            else:
+                _logger.debug(
+                    'Adding partial derivative to func "%s" on argument %s.',
+                    self._func, i)
+                grad_func_rec = self._grad_func[i]
+                # Save forward results and arguments in the gradient function closure
+                # for later use.
+                grad_func = grad_func_rec.f(result_value, *arg_values, **
+                                            kwarg_values)
+
+                if grad_func_rec.multi_grad_indices is None:
+                    # Derivative function of each argument is defined separately.
+                    owner = arg
                 else:
-                    current_tape.add_partial_derivative(grad_func, owner,
-                                                        result)
-
-        return result
-        # pylint: enable=invalid-name, too-many-locals
+                    # Derivative function could compute gradients of multiple arguments
+                    # in one call.
+                    owner = []
+                    for grad_index in grad_func_rec.multi_grad_indices:
+                        if (isinstance(args[grad_index], array.Value) and \
+                            args[grad_index].is_marked_for_bp(current_tape)):
+                            owner.append(args[grad_index])
+                        else:
+                            # Use None as placeholder for arguments that do not require
+                            # gradient computation.
+                            owner.append(None)
+                        visited_arg_indices.add(grad_index)
+                grad_func = raw_value_wrapper(grad_func)  # pylint: disable=redefined-variable-type
+                if self.type == ArrayType.MXNET:
+                    grad_func = context_wrapper(grad_func)
+            # Gradient functions of primitives with multiple results are called once
+            # with the tuple of gradients of all results.
+            current_tape.add_partial_derivative(grad_func, owner, result)
+
+        # Add derivative for keyword arguments.
+        for k in bp_kw:
+            arg = kwargs[k]
+            if k not in self._grad_func_kw:
+                _logger.debug(
+                    'Partial derivative of %s "%s" on keyword argument "%s" '
+                    'is not defined.', self._type_str, self._func.__name__, k)
+                grad_func = FakeGradFunc(
+                    self._type_str + ' ' + self._func.__name__, k)
+            else:
+                _logger.debug(
+                    'Adding partial derivative to func "%s" on keyword argument "%s".',
+                    self._func, k)
+                grad_func_rec = self._grad_func_kw[k]
+                grad_func = grad_func_rec.f(result_value, *arg_values,
+                                            **kwarg_values)
+                grad_func = raw_value_wrapper(grad_func)
+                if self.type == ArrayType.MXNET:
+                    grad_func = context_wrapper(grad_func)
+            current_tape.add_partial_derivative(grad_func, arg, result)
 
     def def_grad(self, func, argnum=0):
         """Define gradient function.
@@ -7,11 +7,11 @@ from __future__ import with_statement
 
 import contextlib
 import collections
-import copy
 
 import numpy
 
 from . import array
+from .array_variants import ArrayType
 from .utils import log
 
 # pylint: disable=invalid-name
@@ -22,22 +22,42 @@ GradRecord = collections.namedtuple('GradRecord',
                                     ['grad_func', 'result', 'owner'])
 
 
+def _iter_values(obj):
+    """Iterate over `Value` objects of an owner or result (single, or list with placeholders)."""
+    if isinstance(obj, array.Value):
+        yield obj
+    elif obj is not None:
+        for sub_obj in obj:
+            if isinstance(sub_obj, array.Value):
+                yield sub_obj
+
+
+def _grad_nbytes(grad):
+    """Return the number of bytes held by a gradient value."""
+    if isinstance(grad, array.Array):
+        return grad.nbytes
+    return 0
+
+
 class Tape(object):
     """Records gradient calculation."""
     global_tape = None
     timestamp = 0
+    # Statistics of the last backward pass.
+    last_stats = None
 
     def __init__(self):
         # Stores grad value result from target back to [KEY]. Array -> grad result (Array)
         self._grads = {}
-        # Store derivation path (forward). ArrayId -> reference counts
-        # This maps from arrays to the number of gradient functions required to compute its
-        # gradient.
-        self._array_grad_refcount = collections.defaultdict(int)
         # Store derivation path (backward). ArrayId -> list of grad records
         # This maps from arrays to the gradient functions that use them as inputs.
         self._result_grad_records = collections.defaultdict(list)
         self._recording = False
+        self._live_grad_bytes = 0
+        # Ids of arrays whose gradient buffer is allocated by the tape itself. Only those
+        # buffers could be accumulated in place, since other buffers may be shared.
+        self._owned_grads = set()
+        self._stats = {'peak_grad_bytes': 0, 'executed_records': 0, 'saved_allocations': 0}
         self.__class__.timestamp += 1
 
     def start_recording(self):
@@ -53,6 +73,19 @@ class Tape(object):
         """Return whether the tape is recording gradient path."""
         return self._recording
 
+    @property
+    def stats(self):
+        """Return statistics of the backward pass.
+
+        Returns
+        -------
+        dict
+            ``peak_grad_bytes`` is the peak number of bytes held by live gradients,
+            ``executed_records`` is the number of gradient functions called,
+            ``saved_allocations`` is the number of gradients accumulated in place.
+        """
+        return self._stats
+
     def add_partial_derivative(self, grad_func, owner, result):
         """Add partial derivative.
 
@@ -68,14 +101,6 @@ class Tape(object):
         if not self._recording:
             return
         grad_rec = GradRecord(grad_func=grad_func, result=result, owner=owner)
-        # Create forward derivation path.
-        if isinstance(owner, array.Value):
-            #print('add', owner.id)
-            self._array_grad_refcount[owner.id] += 1
-        elif owner is not None: # None means a placeholder for an array that needs no gradient.
-            for sub_owner in owner:
-                if isinstance(sub_owner, array.Value):
-                    self._array_grad_refcount[sub_owner.id] += 1
         # Create backward derivation path.
         if isinstance(result, array.Value):
             self._result_grad_records[result.id].append(grad_rec)
@@ -87,81 +112,188 @@ class Tape(object):
         """Set gradient targets to ones."""
         # Set gradient target for one.
         if isinstance(target, array.Value):
-            self._grads[target.id] = array.wrap(1.0 if isinstance(
-                target, array.Number) else numpy.ones(target.shape))
+            self._set_grad(target.id, array.wrap(1.0 if isinstance(
+                target, array.Number) else numpy.ones(target.shape)))
+            self._owned_grads.add(target.id)
         else:
             for sub_target in target:
                 self._set_gradient_target(sub_target)
 
+    def _set_grad(self, arr_id, grad):
+        """Set gradient of the given array id and keep track of live gradient bytes."""
+        old_grad = self._grads.get(arr_id)
+        if old_grad is not None:
+            self._live_grad_bytes -= _grad_nbytes(old_grad)
+        self._grads[arr_id] = grad
+        self._live_grad_bytes += _grad_nbytes(grad)
+        if self._live_grad_bytes > self._stats['peak_grad_bytes']:
+            self._stats['peak_grad_bytes'] = self._live_grad_bytes
+
+    def _release_grad(self, arr_id):
+        """Release gradient of the given array id."""
+        grad = self._grads.pop(arr_id, None)
+        if grad is not None:
+            self._live_grad_bytes -= _grad_nbytes(grad)
+        self._owned_grads.discard(arr_id)
+
+    @staticmethod
+    def _accumulate_inplace(buf, grad):
+        """Add gradient into buffer in place on the raw backend data.
+
+        Return False if the gradient could not be added without changing the shape
+        or dtype of the buffer.
+        """
+        if not isinstance(buf, array.Array) or numpy.dtype(buf.dtype).kind != 'f':
+            return False
+        if isinstance(grad, array.Array):
+            if (grad.shape != buf.shape or
+                    numpy.result_type(buf.dtype, grad.dtype) != numpy.dtype(buf.dtype)):
+                return False
+            # Avoid synchronization whenever possible.
+            if buf.has_valid_data(ArrayType.MXNET) and (
+                    grad.has_valid_data(ArrayType.MXNET) or
+                    not buf.has_valid_data(ArrayType.NUMPY)):
+                atype = ArrayType.MXNET
+            else:
+                atype = ArrayType.NUMPY
+        elif isinstance(grad, array.Number):
+            atype = (ArrayType.MXNET if buf.has_valid_data(ArrayType.MXNET)
+                     else ArrayType.NUMPY)
+        else:
+            return False
+        raw_grad = grad.get_data(atype)
+        raw_buf = buf.get_data_mutable(atype)
+        if atype == ArrayType.NUMPY:
+            numpy.add(raw_buf, raw_grad, out=raw_buf)
+        else:
+            raw_buf += raw_grad
+        return True
+
     def _cumulate_gradient(self, arr, grad):
         """Cumulate gradients belonging to the same array.
 
+        The first contribution is stored as is, since it may share memory with
+        other values. The second one is summed into a new buffer owned by the tape,
+        into which all further contributions are added in place.
+
         Recurse when handle multiple arrays.
         """
         if isinstance(arr, array.Value):
             current_gradient = array.wrap(grad)
-            if arr.id in self._grads:
-                self._grads[arr.id] += current_gradient
+            old_gradient = self._grads.get(arr.id)
+            if old_gradient is None:
+                self._set_grad(arr.id, current_gradient)
+            elif arr.id in self._owned_grads and Tape._accumulate_inplace(
+                    old_gradient, current_gradient):
+                self._stats['saved_allocations'] += 1
             else:
-                self._grads[arr.id] = current_gradient
+                self._set_grad(arr.id, old_gradient + current_gradient)
+                self._owned_grads.add(arr.id)
         elif arr is not None:
             if len(arr) != len(grad):
                 _logger.fatal('Number of gradients does not match.')
             for sub_arr, sub_grad in zip(arr, grad):
                 self._cumulate_gradient(sub_arr, sub_grad)
 
-    def _prune_gradient_path(self, target_queue):
-        """Remove gradients that are not required to be computed.
-
-        Traversal from target to eliminate grad_records that do not
-        contribute to the target.
-        Example:
-        def foo(x):
-          y = x + 1
-          z = print(np.argmax(y))
-          return y
-        The argmax above should not be involed in gradient computation.
+    def _schedule(self, target_ids):
+        """Compute the reverse-topological schedule of the backward pass.
+
+        Only grad records that contribute to the targets are scheduled. For
+        example, the argmax below is not involved in gradient computation.
+
+        ::
+
+            def foo(x):
+              y = x + 1
+              z = print(np.argmax(y))
+              return y
+
+        Parameters
+        ----------
+        target_ids : list
+            Ids of target arrays.
+
+        Returns
+        -------
+        collections.deque
+            Steps of ``(array_id, ready_records, release_ids)``. When an array is
+            visited, all the contributions to its gradient have been computed.
+            ``ready_records`` are the grad records whose results are all complete
+            afterwards, and ``release_ids`` are the arrays whose gradients and grad
+            records are no longer needed once ``ready_records`` have been run.
         """
-        # pylint: disable= too-many-nested-blocks, too-many-branches
-        touched = set()
-        touch_queue = copy.deepcopy(target_queue)
-        while len(touch_queue) != 0:
-            current_id = touch_queue.popleft()
-            if current_id in touched:
+        # pylint: disable= too-many-locals, too-many-branches
+        # Find arrays reachable from targets along the backward path.
+        reachable = set(target_ids)
+        stack = list(reachable)
+        while len(stack) != 0:
+            current_id = stack.pop()
+            for grad_record in self._result_grad_records.get(current_id, ()):
+                for owner in _iter_values(grad_record.owner):
+                    if owner.id not in reachable:
+                        reachable.add(owner.id)
+                        stack.append(owner.id)
+        # Number of reachable results each record waits for, number of reachable
+        # records contributing to each array, and number of records using each array.
+        pending_results = {}
+        refcount = collections.defaultdict(int)
+        consumers = {}
+        for arr_id in reachable:
+            grad_records = self._result_grad_records.get(arr_id)
+            if not grad_records:
                 continue
-            else:
-                touched.add(current_id)
-            for grad_record in self._result_grad_records[current_id]:
-                owner = grad_record.owner
-                if isinstance(owner, array.Value):
-                    touch_queue.append(owner.id)
+            consumers[arr_id] = len(grad_records)
+            for grad_record in grad_records:
+                key = id(grad_record)
+                if key in pending_results:
+                    pending_results[key] += 1
                 else:
-                    for sub_owner in owner:
-                        if isinstance(sub_owner, array.Value):
-                            touch_queue.append(sub_owner.id)
-        to_delete = []
-        for arrid, grad_records in self._result_grad_records.items():
-            if not arrid in touched:
-                for grad_record in grad_records:
-                    owner = grad_record.owner
-                    if isinstance(owner, array.Value):
-                        self._array_grad_refcount[owner.id] -= 1
-                    else:
-                        for sub_owner in owner:
-                            if isinstance(sub_owner, array.Value):
-                                self._array_grad_refcount[sub_owner.id] -= 1
-                to_delete.append(arrid)
-        for arrid in to_delete:
-            self._result_grad_records.pop(arrid, None)
-        # pylint: enable= too-many-nested-blocks, too-many-branches
+                    pending_results[key] = 1
+                    for owner in _iter_values(grad_record.owner):
+                        refcount[owner.id] += 1
+        # Kahn's algorithm from targets to origins.
+        steps = collections.deque()
+        queue = collections.deque()
+        visited = set()
+        for arr_id in target_ids:
+            if arr_id not in visited and refcount[arr_id] == 0:
+                visited.add(arr_id)
+                queue.append(arr_id)
+        while len(queue) != 0:
+            current_id = queue.popleft()
+            ready_records = []
+            release_ids = []
+            for grad_record in self._result_grad_records.get(current_id, ()):
+                key = id(grad_record)
+                pending_results[key] -= 1
+                if pending_results[key] == 0:
+                    ready_records.append(grad_record)
+            for grad_record in ready_records:
+                for owner in _iter_values(grad_record.owner):
+                    refcount[owner.id] -= 1
+                    if refcount[owner.id] == 0 and owner.id not in visited:
+                        visited.add(owner.id)
+                        queue.append(owner.id)
+                for result in _iter_values(grad_record.result):
+                    if result.id in consumers:
+                        consumers[result.id] -= 1
+                        if consumers[result.id] == 0:
+                            release_ids.append(result.id)
+            if current_id not in consumers:
+                release_ids.append(current_id)
+            steps.append((current_id, ready_records, release_ids))
+        return steps
+        # pylint: enable= too-many-locals, too-many-branches
 
     def get_gradient(self, origin, target):
         """Get gradient of the specified array.
 
         This will first set the gradients of target (using value 1.0) and
         then compute the gradient using the backward path recorded during
-        forward computation. Currently, we use BFS order if more than one
-        gradient operators could be computed at the same time.
+        forward computation. Grad records are run in a precomputed
+        reverse-topological order, and the gradient of each intermediate array,
+        together with the grad records capturing its forward values, is released
+        as soon as its last consumer has run.
 
         Parameters
         ----------
@@ -176,75 +308,43 @@ class Tape(object):
         tuple of Array
             The gradient of input arrays.
         """
-        # pylint: disable= too-many-locals, too-many-branches
-        def decr_refcount(owner):
-            """Decrement the reference count of the given owner.
-
-            Return true if the owner has no other grad records to be resolved
-            (and thus has finished gradient computation).
-            """
-            assert isinstance(owner, array.Value)
-            assert owner.id in self._array_grad_refcount, owner.id
-            self._array_grad_refcount[owner.id] -= 1
-            if self._array_grad_refcount[owner.id] == 0:
-                self._array_grad_refcount.pop(owner.id, None)
-                return True
-            else:
-                return False
-
         def compute_grad_record(grad_record):
             """Run the function in the grad record."""
             if isinstance(grad_record.result, array.Value):
                 return grad_record.grad_func(self._grads[grad_record.result.id])
             else:
+                # Results that received no gradient contribute zero.
                 return grad_record.grad_func(
-                    tuple(self._grads[rst.id] for rst in grad_record.result))
+                    tuple(self._grads.get(rst.id, array.wrap(0.0))
+                          for rst in grad_record.result))
 
         origin_id = set(arr.id for arr in origin)
 
         # Set gradient target.
         self._set_gradient_target(target)
+        target_ids = [sub_target.id for sub_target in _iter_values(target)]
 
-        # Initialize bfs queue.
-        bfs_queue = collections.deque()
-        if isinstance(target, array.Value):
-            bfs_queue.append(target.id)
-        else:
-            for sub_target in target:
-                bfs_queue.append(sub_target.id)
-
-        # First do an extra traversal to remove extra gradients.
-        self._prune_gradient_path(bfs_queue)
+        steps = self._schedule(target_ids)
+        _logger.debug('Scheduled %d steps for backward pass.', len(steps))
 
         # Compute gradients from target to origin.
-        while len(bfs_queue) != 0:
-            current_id = bfs_queue.popleft()
-            # Resolve all grad_records that will use gradient of the current array.
-            grad_records = self._result_grad_records[current_id]
-            while len(grad_records) != 0:
-                grad_record = grad_records.pop()
-                # TODO(minjie): add primitive_type info in debug info later.
+        while len(steps) != 0:
+            _, ready_records, release_ids = steps.popleft()
+            while len(ready_records) != 0:
+                grad_record = ready_records.pop()
                 _logger.debug(
                     'Calling derivative func "%s"', grad_record.grad_func)
-                # TODO(minjie): this may raise error if the grad_record has multiple
-                # results. We should check all the result gradients are available
-                # before calling this function.
                 grad = compute_grad_record(grad_record)
-                owner = grad_record.owner
-                self._cumulate_gradient(owner, grad)
-                # Remove grad_record in forward path and trigger those arrays
-                # whose grad_records in the forward path have been resolved.
-                if isinstance(owner, array.Value):
-                    if decr_refcount(owner):
-                        bfs_queue.append(owner.id)
-                elif owner is not None:
-                    for sub_owner in owner:
-                        if isinstance(sub_owner, array.Value) and decr_refcount(sub_owner):
-                            bfs_queue.append(sub_owner.id)
-            # Release memory of the gradient of the current array.
-            self._result_grad_records.pop(current_id, None)
-            if not current_id in origin_id:
-                self._grads.pop(current_id, None)
+                self._cumulate_gradient(grad_record.owner, grad)
+                self._stats['executed_records'] += 1
+                # Drop references so that captured forward values could be freed.
+                grad_record = grad = None
+            # Release memory of gradients and captured values that are no longer needed.
+            for arr_id in release_ids:
+                self._result_grad_records.pop(arr_id, None)
+                if arr_id not in origin_id:
+                    self._release_grad(arr_id)
+        self.__class__.last_stats = self._stats
 
         origin_grad = []
         for arr in origin:
@@ -255,7 +355,6 @@ class Tape(object):
                 # TODO(minjie): This may need to return a zero array of proper shape.
                 origin_grad.append(0.0)
         return origin_grad
-        # pylint: enable= too-many-locals, too-many-branches
 
 
 @contextlib.contextmanager
@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Trace of primitive calls for replaying static computations.
+
+A :class:`Trace` records the primitives called by a function and how their arguments
+relate to the inputs of the function and to results of earlier calls. If the inputs are
+only used through primitives, the trace can later be replayed on new inputs of the same
+signature. Replaying skips the Python body of the function, primitive dispatching and
+the search for arguments that need back propagation.
+
+A trace is dropped (and the function runs normally) if the function
+
+* passes a value that is neither an input nor a traced result to a primitive
+  (e.g. a raw array or a global array that could be reassigned between calls),
+* reads the data of a traced value (e.g. ``asnumpy``, or ``float``, ``int`` and ``bool`` of
+  a scalar), which usually means Python control flow depends on it,
+* writes into a traced value with ``__setitem__``.
+
+Python scalars and other constants passed to primitives are assumed not to change
+between calls with the same signature. Functions of the ``math`` module read scalars
+without notice, so they should not be applied to traced values.
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+import collections
+import contextlib
+
+from . import array
+from .array_variants import array_types
+from .utils import log
+
+# pylint: disable=invalid-name
+_logger = log.get_logger(__name__)
+# pylint: enable=invalid-name
+
+# Kinds of argument references.
+INPUT = 0
+VALUE = 1
+CONST = 2
+LIST = 3
+
+_raw_array_types = tuple(array_types.values())  # pylint: disable= invalid-name
+
+TracedCall = collections.namedtuple(
+    'TracedCall', ['prim', 'args', 'kwargs', 'bp_idx', 'bp_kw', 'num_results'])
+
+TraceCacheInfo = collections.namedtuple(
+    'TraceCacheInfo', ['hits', 'misses', 'fallbacks', 'size'])
+
+
+class UntraceableError(ValueError):
+    """Error of a value that could not be referenced in a trace."""
+    pass
+
+
+def _is_constant(obj):
+    """Return whether the object could be baked into a trace."""
+    if isinstance(obj, (array.Value, ) + _raw_array_types):
+        return False
+    if isinstance(obj, (tuple, list)):
+        return all(_is_constant(elm) for elm in obj)
+    return True
+
+
+class Trace(object):
+    """Sequence of primitive calls recorded from one run of a function.
+
+    Parameters
+    ----------
+    inputs : tuple
+        Inputs of the traced function.
+    """
+
+    def __init__(self, inputs):
+        self._calls = []
+        # Value id -> reference.
+        self._refs = {}
+        for i, inp in enumerate(inputs):
+            if isinstance(inp, array.Value) and inp.id not in self._refs:
+                self._refs[inp.id] = (INPUT, i)
+        self._num_values = 0
+        # Shapes of traced results, None for non-array results.
+        self._shapes = []
+        self._result = None
+        self._reason = None
+
+    @property
+    def replayable(self):
+        """Return whether the trace could be replayed."""
+        return self._reason is None
+
+    @property
+    def reason(self):
+        """Return why the trace could not be replayed, or None."""
+        return self._reason
+
+    @property
+    def calls(self):
+        """Return the list of recorded calls."""
+        return self._calls
+
+    @property
+    def result(self):
+        """Return the reference to the returned value of the traced function."""
+        return self._result
+
+    @property
+    def shapes(self):
+        """Return shapes of traced results, indexed by `VALUE` references."""
+        return self._shapes
+
+    def __len__(self):
+        return len(self._calls)
+
+    def invalidate(self, reason):
+        """Mark the trace as not replayable."""
+        if self._reason is None:
+            _logger.debug('Trace dropped: %s.', reason)
+            self._reason = reason
+
+    def on_read(self, value):
+        """Called when the data of a value is read outside of primitives."""
+        if self._reason is None and value.id in self._refs:
+            self.invalidate('data of a traced value is read')
+
+    def on_write(self, value):
+        """Called when a value is mutated outside of primitives."""
+        if self._reason is None and value.id in self._refs:
+            self.invalidate('a traced value is assigned to')
+
+    def _make_ref(self, obj):
+        """Return the reference to an argument."""
+        if isinstance(obj, array.Value):
+            ref = self._refs.get(obj.id)
+            if ref is None:
+                raise UntraceableError('value is not produced inside the trace')
+            return ref
+        if isinstance(obj, list) and len(obj) != 0 and isinstance(obj[0], array.Value):
+            return (LIST, tuple(self._make_ref(elm) for elm in obj))
+        if not _is_constant(obj):
+            raise UntraceableError('raw array is passed to a primitive')
+        return (CONST, obj)
+
+    def record(self, prim, args, kwargs, result, bp_idx, bp_kw):
+        """Record a primitive call.
+
+        Parameters
+        ----------
+        prim : primitive.Primitive
+            The called primitive.
+        args : tuple
+            Positional arguments of the call.
+        kwargs : dict
+            Keyword arguments of the call.
+        result
+            Result of the call.
+        bp_idx : tuple
+            Indices of positional arguments that need back propagation.
+        bp_kw : tuple
+            Keywords of arguments that need back propagation.
+        """
+        # pylint: disable=too-many-arguments
+        if self._reason is not None:
+            return
+        try:
+            arg_refs = tuple(self._make_ref(arg) for arg in args)
+            kwarg_refs = tuple(
+                (key, self._make_ref(arg)) for key, arg in kwargs.items())
+        except UntraceableError as err:
+            self.invalidate(str(err))
+            return
+        if isinstance(result, tuple):
+            num_results = len(result)
+            results = result
+        else:
+            num_results = None
+            results = (result, )
+        for res in results:
+            if isinstance(res, array.Value):
+                self._refs[res.id] = (VALUE, self._num_values)
+            self._shapes.append(res.shape if isinstance(res, array.Array) else None)
+            self._num_values += 1
+        self._calls.append(
+            TracedCall(prim, arg_refs, kwarg_refs, bp_idx, bp_kw, num_results))
+
+    def set_result(self, result):
+        """Record the returned value of the traced function."""
+        if self._reason is not None:
+            return
+        try:
+            if isinstance(result, tuple):
+                self._result = (LIST, tuple(self._make_ref(res) for res in result))
+            else:
+                self._result = self._make_ref(result)
+        except UntraceableError as err:
+            self.invalidate(str(err))
+            return
+        if self._result[0] == CONST:
+            self.invalidate('result is not an array')
+
+    @staticmethod
+    def _resolve(ref, inputs, values):
+        """Return the argument of a reference."""
+        kind, val = ref
+        if kind == INPUT:
+            return inputs[val]
+        elif kind == VALUE:
+            return values[val]
+        elif kind == LIST:
+            return [Trace._resolve(sub_ref, inputs, values) for sub_ref in val]
+        else:
+            return val
+
+    def replay(self, inputs, current_tape):
+        """Replay the trace on new inputs.
+
+        Parameters
+        ----------
+        inputs : tuple
+            Inputs of the same signature as the traced ones. Inputs that need gradients
+            should already be marked on the tape.
+        current_tape : tape.Tape
+            Tape to record partial derivatives on.
+
+        Returns
+        -------
+        Result of the function, in the same structure as the traced one.
+        """
+        values = []
+        resolve = Trace._resolve
+        for call in self._calls:
+            args = tuple(resolve(ref, inputs, values) for ref in call.args)
+            kwargs = {key: resolve(ref, inputs, values) for key, ref in call.kwargs}
+            result = call.prim.replay(args, kwargs, call.bp_idx, call.bp_kw,
+                                      current_tape)
+            if call.num_results is None:
+                values.append(result)
+            else:
+                values.extend(result)
+        result = resolve(self._result, inputs, values)
+        if isinstance(result, list):
+            result = tuple(result)
+        return result
+
+
+def signature(inputs):
+    """Return hashable signature of inputs, or None if inputs could not be used as key."""
+    sig = []
+    first_index = {}
+    for i, inp in enumerate(inputs):
+        if isinstance(inp, array.Value):
+            # Passing the same value twice is part of the signature.
+            alias = first_index.setdefault(id(inp), i)
+            if isinstance(inp, array.Array):
+                sig.append((array.Array, inp.shape, inp.dtype, alias))
+            else:
+                sig.append((array.Number, alias))
+        else:
+            try:
+                hash(inp)
+            except TypeError:
+                return None
+            sig.append((type(inp), inp))
+    return tuple(sig)
+
+
+@contextlib.contextmanager
+def _tracing(current_trace):
+    """Make the trace active within the scope."""
+    # pylint: disable= protected-access
+    previous = array._active_trace
+    array._active_trace = current_trace
+    try:
+        yield current_trace
+    finally:
+        array._active_trace = previous
+    # pylint: enable= protected-access
+
+
+class TraceCache(object):
+    """Cache of traces of a function, one per input signature.
+
+    Parameters
+    ----------
+    capacity : int
+        Maximal number of signatures to keep. The least recently used one is evicted.
+    """
+
+    def __init__(self, capacity=8):
+        self._capacity = capacity
+        # Signature -> Trace, or None if the function could not be traced.
+        self._traces = collections.OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._fallbacks = 0
+
+    def cache_info(self):
+        """Return statistics of the cache.
+
+        Returns
+        -------
+        TraceCacheInfo
+            Number of replayed calls, number of traced calls, number of calls that run
+            normally because their signature could not be traced, and number of
+            cached signatures.
+        """
+        return TraceCacheInfo(self._hits, self._misses, self._fallbacks,
+                              len(self._traces))
+
+    def clear(self):
+        """Drop all traces."""
+        self._traces.clear()
+
+    def get(self, sig):
+        """Return the trace of the given signature, or None if there is no replayable one."""
+        return self._traces.get(sig)
+
+    def __call__(self, func, inputs, current_tape):
+        """Call function on inputs, replaying the trace of the same signature if any.
+
+        Parameters
+        ----------
+        func
+            Function to call.
+        inputs : tuple
+            Inputs of the function.
+        current_tape : tape.Tape
+            Tape to record partial derivatives on.
+
+        Returns
+        -------
+        Result of the function.
+        """
+        sig = signature(inputs)
+        if sig is None:
+            self._fallbacks += 1
+            return func(*inputs)
+        if sig in self._traces:
+            recorded = self._traces.pop(sig)
+            self._traces[sig] = recorded
+            if recorded is None:
+                self._fallbacks += 1
+                return func(*inputs)
+            self._hits += 1
+            return recorded.replay(inputs, current_tape)
+        self._misses += 1
+        new_trace = Trace(inputs)
+        with _tracing(new_trace):
+            result = func(*inputs)
+            new_trace.set_result(result)
+        if new_trace.replayable:
+            _logger.debug('Traced %d primitive calls.', len(new_trace))
+            self._traces[sig] = new_trace
+        else:
+            _logger.info('Function %s could not be traced: %s.',
+                         getattr(func, '__name__', func), new_trace.reason)
+            self._traces[sig] = None
+        while len(self._traces) > self._capacity:
+            self._traces.popitem(last=False)
+        return result
@@ -4,11 +4,17 @@
 """Test Cases for Generating Blacklist"""
 from __future__ import division
 from math import pi
+import copy
+import multiprocessing
 import minpy
 import minpy.numpy as np
 from minpy.dispatch.policy import AutoBlacklistPolicy
+from minpy.dispatch.rule import Blacklist
+from minpy.utils import log
 import logging
 
+_logger = log.get_logger(__name__)
+
 
 def test_ufunc():
     x = np.array([-1.2, 1.2])
@@ -666,19 +672,67 @@ def test_fromnumeric():
     np.var(a)
     np.var(a, dtype=np.float64)
 
-def generate_default_blacklist():
-    p = AutoBlacklistPolicy(gen_rule=True, append_rule=True)
-    with p:
-        test_ufunc()
-        test_numeric()
-        test_fromnumeric()
+# Probe functions, run by separate workers in parallel generation.
+PROBES = [test_ufunc, test_numeric, test_fromnumeric]
+
+
+def _run_probe(index):
+    """Run a probe function from empty rules and return the rules it generated."""
+    old_policy = minpy.get_global_policy()
+    # Generated rules are saved by generate_blacklist, after merging those of all probes.
+    p = AutoBlacklistPolicy(gen_rule=True, append_rule=False, loc=Blacklist._loc,
+                            save_config_atexit=False)
+    minpy.set_global_policy(p)
+    try:
+        PROBES[index]()
+    except Exception:
+        # Rules generated before the failure are kept.
+        _logger.warning('Probe %s failed.', PROBES[index].__name__, exc_info=True)
+    finally:
+        minpy.set_global_policy(old_policy)
+    return Blacklist._rules
+
+
+def generate_blacklist(num_workers=None, loc=None):
+    """Generate blacklist rules by running the probe functions in a pool of processes.
+
+    Rules of all probes are merged into the loaded rules and saved.
+
+    Parameters
+    ----------
+    num_workers : int
+        Number of worker processes. Defaults to the number of CPUs (at most one per
+        probe). With 0, probes are run serially in this process.
+    loc : str
+        Path to rule configuration file.
+    """
+    p = AutoBlacklistPolicy(gen_rule=False, loc=loc)
+    if num_workers is None:
+        num_workers = min(multiprocessing.cpu_count(), len(PROBES))
+    if num_workers == 0:
+        old_rules = copy.deepcopy(Blacklist._rules)
+        results = [_run_probe(i) for i in range(len(PROBES))]
+        Blacklist._rules = old_rules
+    else:
+        context = multiprocessing
+        if hasattr(multiprocessing, 'get_context'):
+            context = multiprocessing.get_context('fork')
+        pool = context.Pool(num_workers)
+        try:
+            results = pool.map(_run_probe, range(len(PROBES)), chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    for rules in results:
+        Blacklist.merge_rules(rules)
     p.save_rules()
 
+
+def generate_default_blacklist():
+    generate_blacklist()
+
+
 if __name__ == '__main__':
-    p = AutoBlacklistPolicy(gen_rule=True, append_rule=True)
-    minpy.set_global_policy(p)
     logging.getLogger('minpy.dispatch.policy').setLevel(logging.DEBUG)
-    test_ufunc()
-    test_numeric()
-    test_fromnumeric()
+    generate_blacklist()
     logging.getLogger('minpy.dispatch.policy').setLevel(logging.WARN)
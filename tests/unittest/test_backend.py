@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+
+def test_numpy_only():
+    code = ('import sys\n'
+            'import minpy\n'
+            'import minpy.numpy as np\n'
+            'from minpy.core import grad\n'
+            'from minpy.nn import layers, solver\n'
+            'assert "mxnet" not in sys.modules\n'
+            'assert isinstance(minpy.get_global_policy(), minpy.policy.OnlyNumPyPolicy)\n'
+            'g = grad(lambda x: np.sum(layers.relu(x)))(np.ones((2, 3)))\n'
+            'assert (g.asnumpy() == 1).all()\n'
+            'assert str(g.context) == "cpu(0)"\n'
+            'try:\n'
+            '    g.context.as_mxnet_context()\n'
+            '    assert False\n'
+            'except minpy.backend.BackendError:\n'
+            '    pass\n')
+    env = dict(os.environ, MINPY_POLICY='only_numpy')
+    subprocess.check_call([sys.executable, '-c', code], env=env)
+
+if __name__ == "__main__":
+    test_numpy_only()
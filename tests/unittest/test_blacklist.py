@@ -0,0 +1,67 @@
+import os
+import tempfile
+import yaml
+import minpy.numpy as np
+from minpy.array_variants import ArrayType
+from minpy.dispatch.rule import Blacklist
+from minpy.utils import blacklist_generator
+
+# MXNet implementations of these calls fail, so that rules are generated.
+def probe_round():
+    np.round(np.ones((2, 3)), 1)
+
+def probe_round_where():
+    x = np.ones((2, 3))
+    np.where(x > 0, x, 0)
+    np.round(x, 1)
+
+def test_rule_index():
+    loc = os.path.join(tempfile.gettempdir(), '.minpy_rules_test.conf')
+    with open(loc, 'w') as config_file:
+        yaml.safe_dump({'minpy.numpy': {
+            'dot': [{'args': ['array_dim2', 'array_dim2']}],
+            'sum': [{'args': ['array_dim1'], 'kwargs': ['keepdims', 'axis']}],
+            'negative': None}}, config_file)
+    rules = Blacklist(loc=loc)
+    rules.load_rules_config(force=True)
+    x = np.ones((2, 2))
+    y = np.ones(2)
+    mx = ArrayType.MXNET
+    assert not rules.allow('dot', 'minpy.numpy', mx, (x, x), {})
+    assert rules.allow('dot', 'minpy.numpy', mx, (x, y), {})
+    assert not rules.allow('sum', 'minpy.numpy', mx, (y,), {'axis': 0, 'keepdims': True})
+    assert rules.allow('sum', 'minpy.numpy', mx, (y,), {'axis': 0})
+    assert not rules.allow('negative', 'minpy.numpy', mx, (y,), {})
+    rules.add('dot', 'minpy.numpy', mx, (x, y), {})
+    assert not rules.allow('dot', 'minpy.numpy', mx, (x, y), {})
+    # Merging skips rules already present.
+    Blacklist.merge_rules({'minpy.numpy': {'dot': [{'args': ['array_dim2', 'array_dim1']},
+                                                   {'args': ['array_dim1', 'array_dim1']}]}})
+    assert len(Blacklist._rules['minpy.numpy']['dot']) == 3
+    assert not rules.allow('dot', 'minpy.numpy', mx, (y, y), {})
+
+def test_parallel_generator():
+    loc = os.path.join(tempfile.gettempdir(), '.minpy_rules_test.conf')
+    save_config_atexit = Blacklist._save_config_atexit
+    old_probes = blacklist_generator.PROBES
+    blacklist_generator.PROBES = [probe_round, probe_round_where]
+    try:
+        # Serial generation in this process does not save rules at exit as well.
+        for num_workers in [2, 0]:
+            Blacklist(loc=loc)
+            Blacklist.reset_rules()
+            blacklist_generator.generate_blacklist(num_workers=num_workers, loc=loc)
+            assert Blacklist._save_config_atexit == save_config_atexit
+            with open(loc) as config_file:
+                generated = yaml.safe_load(config_file)
+            assert generated == Blacklist._rules
+            # Rules of the same call in both probes are merged.
+            assert generated['minpy.numpy']['round'] == [{'args': ['array_dim2', 'int']}]
+            assert generated['minpy.numpy']['where'] == [
+                {'args': ['array_dim2', 'array_dim2', 'int']}]
+    finally:
+        blacklist_generator.PROBES = old_probes
+
+if __name__ == "__main__":
+    test_rule_index()
+    test_parallel_generator()
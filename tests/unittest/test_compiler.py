@@ -0,0 +1,52 @@
+import numpy as py_np
+import minpy.numpy as np
+from minpy import compiler
+from minpy.core import grad_and_loss
+
+def mlp_loss(w1, w2, x):
+    h = np.maximum(np.dot(x, w1), 0)
+    z = np.dot(h, w2)
+    y = np.tanh(z) * 0.5 + 1.0 / (1.0 + np.exp(-z))
+    return np.sum(y * y) / x.shape[0]
+
+def test_compiled_grad_and_loss():
+    compiled = compiler.grad_and_loss(mlp_loss, argnum=[0, 1])
+    plain = grad_and_loss(mlp_loss, argnum=[0, 1])
+    w1 = py_np.random.randn(8, 16)
+    w2 = py_np.random.randn(16, 4)
+    for _ in range(3):
+        x = py_np.random.randn(32, 8)
+        grads, loss = compiled(w1, w2, x)
+        expected_grads, expected_loss = plain(w1, w2, x)
+        for grad, expected in zip(grads, expected_grads):
+            assert py_np.allclose(grad.asnumpy(), expected.asnumpy(), rtol=1e-4, atol=1e-4)
+        assert py_np.allclose(loss.asnumpy(), expected_loss.asnumpy(), rtol=1e-4)
+    assert len(compiled.compiled) == 1
+    assert all(func is not None for func in compiled.compiled.values())
+    # Compiling does not create the lazily registered primitives.
+    assert np.__registry__._lazy
+
+def test_fallback():
+    def loss_with_slice(x):
+        return np.sum(np.tanh(x)[1:3])
+
+    compiled = compiler.grad_and_loss(loss_with_slice)
+    x = py_np.random.randn(4, 4)
+    for _ in range(2):
+        grad, _ = compiled(x)
+        expected = py_np.zeros_like(x)
+        expected[1:3] = 1 - py_np.tanh(x[1:3]) ** 2
+        assert py_np.allclose(grad.asnumpy(), expected, atol=1e-5)
+    assert list(compiled.compiled.values()) == [None]
+    assert compiled.trace_cache.cache_info().hits == 1
+
+def test_bounded_cache():
+    compiled = compiler.grad_and_loss(lambda x: np.sum(np.tanh(x)))
+    for rows in range(1, 11):
+        compiled(py_np.random.randn(rows, 2))
+    assert len(compiled.compiled) == compiled.trace_cache.cache_info().size == 8
+
+if __name__ == "__main__":
+    test_compiled_grad_and_loss()
+    test_fallback()
+    test_bounded_cache()
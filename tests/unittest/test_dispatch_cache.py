@@ -0,0 +1,30 @@
+import minpy
+from minpy.core import grad
+import minpy.numpy as np
+import minpy.numpy.random as random
+
+def test_dispatch_cache():
+
+    def training_loss(weights, inputs):
+        preds = np.tanh(np.dot(inputs, weights))
+        return np.sum(preds * preds)
+
+    np.record_op_stat()
+    plc = minpy.get_global_policy()
+    plc.invalidate_dispatch_cache()
+    inputs = random.rand(16, 8)
+    weights = random.rand(8, 4)
+    training_gradient_fun = grad(training_loss)
+    for _ in range(10):
+        weights -= training_gradient_fun(weights, inputs) * 0.01
+    hits, misses, size = plc.dispatch_cache_stat
+    # Every distinct signature misses once, later iterations only hit.
+    assert misses == size
+    assert hits > misses
+
+    minpy.set_global_policy(plc)
+    assert plc.dispatch_cache_stat[2] == 0
+    np.show_op_stat()
+
+if __name__ == "__main__":
+    test_dispatch_cache()
@@ -0,0 +1,148 @@
+import mxnet as mx
+import numpy as py_np
+import minpy.numpy as np
+from minpy import array
+from minpy import core
+from minpy.array_variants import ArrayType
+
+def test_executor_cache():
+    data = mx.sym.Variable('x')
+    net = mx.sym.FullyConnected(data=data, num_hidden=4, name='fc')
+    func = core.Function(net, {'x': (8, 6), 'fc_weight': (4, 6), 'fc_bias': (4, )})
+    weight = py_np.random.randn(4, 6)
+    bias = py_np.random.randn(4)
+
+    def loss(weight, bias, x):
+        return np.sum(func(x=x, fc_weight=weight, fc_bias=bias))
+
+    grad_func = core.grad(loss, argnum=[0, 1])
+    for batch_size in [8, 8, 4, 8, 4]:
+        x = py_np.random.randn(batch_size, 6)
+        grad_w, grad_b = grad_func(weight, bias, x)
+        assert py_np.allclose(grad_w.asnumpy(), py_np.tile(x.sum(axis=0), (4, 1)), atol=1e-4)
+        assert py_np.allclose(grad_b.asnumpy(), batch_size, atol=1e-4)
+    # Calling twice in one forward needs two executors.
+    def twice(weight, bias, x):
+        return np.sum(func(x=x, fc_weight=weight, fc_bias=bias) *
+                      func(x=x * 2, fc_weight=weight, fc_bias=bias))
+    x = py_np.random.randn(8, 6)
+    grad_w, _ = core.grad(twice, argnum=[0, 1])(weight, bias, x)
+    first = x.dot(weight.T) + bias
+    second = 2 * x.dot(weight.T) + bias
+    expected = second.T.dot(x) + first.T.dot(2 * x)
+    assert py_np.allclose(grad_w.asnumpy(), expected, rtol=1e-3, atol=1e-3)
+    info = func.cache_info()
+    assert info.misses == 3
+    assert info.hits == 4
+    assert info.size == 3
+    # Results do not alias executor buffers.
+    x = py_np.random.randn(8, 6)
+    first = func(x=x, fc_weight=weight, fc_bias=bias)
+    expected = first.asnumpy()
+    func(x=x * 3, fc_weight=weight, fc_bias=bias)
+    assert py_np.allclose(first.asnumpy(), expected)
+    # Executors reused without gradients see new parameters.
+    assert py_np.allclose(func(x=x, fc_weight=2 * weight, fc_bias=bias).asnumpy(),
+                          2 * expected - bias, rtol=1e-3, atol=1e-3)
+    # Calls without gradients bind no gradient buffers.
+    for (_, _, grad_req, _), pool in func._executors.items():
+        if 'write' not in grad_req:
+            assert all(grad is None for cached in pool for grad in cached.executor.grad_arrays)
+    func.clear_cache()
+    assert func.cache_info().size == 0
+
+def test_bind_params():
+    data = mx.sym.Variable('x')
+    net = mx.sym.FullyConnected(data=data, num_hidden=4, name='fc')
+    func = core.Function(net, bind_params=['fc_weight', 'fc_bias'])
+    weight = array.wrap(mx.nd.array(py_np.random.randn(4, 6)))
+    bias = array.wrap(mx.nd.zeros((4, )))
+    old_weight = weight.asnumpy()
+    x = py_np.random.randn(8, 6).astype(py_np.float32)
+    expected = x.dot(old_weight.T)
+    assert py_np.allclose(func(x=x, fc_weight=weight, fc_bias=bias).asnumpy(), expected,
+                          atol=1e-4)
+    # Parameters share storage with the executor: in place updates need no copy.
+    mx_weight = weight.get_data_mutable(ArrayType.MXNET)
+    mx_weight *= 2
+    assert py_np.allclose(func(x=x, fc_weight=weight, fc_bias=bias).asnumpy(), 2 * expected,
+                          atol=1e-4)
+    assert func.cache_info().misses == 1
+    # A new parameter value is copied in without changing the old one.
+    new_weight = array.wrap(mx.nd.array(old_weight * 3))
+    assert py_np.allclose(func(x=x, fc_weight=new_weight, fc_bias=bias).asnumpy(),
+                          3 * expected, atol=1e-4)
+    assert py_np.allclose(weight.asnumpy(), 2 * old_weight, atol=1e-5)
+    grad_w = core.grad(lambda w: np.sum(func(x=x, fc_weight=w, fc_bias=bias)))(new_weight)
+    assert py_np.allclose(grad_w.asnumpy(), py_np.tile(x.sum(axis=0), (4, 1)), atol=1e-4)
+
+def test_bind_params_in_place():
+    from minpy.nn import optim
+    data = mx.sym.Variable('x')
+    net = mx.sym.FullyConnected(data=data, num_hidden=4, name='fc')
+    func = core.Function(net, bind_params=['fc_weight', 'fc_bias'])
+    weight = array.wrap(py_np.ones((4, 6), dtype=py_np.float32))
+    bias = array.wrap(py_np.zeros((4, ), dtype=py_np.float32))
+    x = py_np.ones((8, 6), dtype=py_np.float32)
+    grad_func = core.grad(lambda w: np.sum(func(x=x, fc_weight=w, fc_bias=bias)))
+    for step in range(3):
+        grad_w = grad_func(weight)
+        storage = func._bound_args['fc_weight'].data
+        # Parameters own the bound storage: in place updates need no copy.
+        assert weight.get_data(ArrayType.MXNET) is storage
+        weight.get_data_mutable(ArrayType.MXNET)[:] -= grad_w.get_data(ArrayType.MXNET) / 8
+        assert weight.get_data(ArrayType.MXNET) is storage
+        assert py_np.allclose(weight.asnumpy(), -step)
+    # Another parameter value does not overwrite the previous one.
+    func = core.Function(net, bind_params=['fc_weight', 'fc_bias'])
+    weight = array.wrap(py_np.ones((4, 6), dtype=py_np.float32))
+    func(x=x, fc_weight=weight, fc_bias=bias)
+    optim.sgd_inplace(weight, array.wrap(py_np.ones((4, 6), dtype=py_np.float32)),
+                      {'learning_rate': 1.0})
+    func(x=x, fc_weight=weight, fc_bias=bias)
+    new_weight = array.wrap(py_np.full((4, 6), 5, dtype=py_np.float32))
+    assert py_np.allclose(func(x=x, fc_weight=new_weight, fc_bias=bias).asnumpy(), 30)
+    assert py_np.allclose(weight.asnumpy(), 0)
+    assert py_np.allclose(func(x=x, fc_weight=weight, fc_bias=bias).asnumpy(), 0)
+    assert py_np.allclose(new_weight.asnumpy(), 5)
+
+def test_concurrent_binds():
+    import os
+    import threading
+    data = mx.sym.Variable('x')
+    net = mx.sym.FullyConnected(data=data, num_hidden=4, name='fc')
+    weight = py_np.random.randn(4, 6)
+    bias = py_np.random.randn(4)
+    previous = os.environ.get('MXNET_SUBGRAPH_BACKEND')
+    errors = []
+
+    def run(need_grad):
+        try:
+            for batch_size in range(1, 9):
+                func = core.Function(net)
+                x = py_np.random.randn(batch_size, 6)
+                if need_grad:
+                    core.grad(lambda w: np.sum(func(x=x, fc_weight=w, fc_bias=bias)))(weight)
+                else:
+                    # Inference executors see new parameters.
+                    for scale in [1, 2]:
+                        out = func(x=x, fc_weight=scale * weight, fc_bias=bias).asnumpy()
+                        assert py_np.allclose(out, x.dot(scale * weight.T) + bias,
+                                              rtol=1e-3, atol=1e-3)
+        except Exception as err:  # pylint: disable=broad-except
+            errors.append(err)
+
+    threads = [threading.Thread(target=run, args=(need_grad, ))
+               for need_grad in [False, True, False, True]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert os.environ.get('MXNET_SUBGRAPH_BACKEND') == previous
+
+if __name__ == "__main__":
+    test_executor_cache()
+    test_bind_params()
+    test_bind_params_in_place()
+    test_concurrent_binds()
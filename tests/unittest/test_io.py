@@ -2,6 +2,7 @@ import numpy as ori_np
 import minpy.numpy as np
 import minpy.nn.io as io
 import os, gzip
+import tempfile
 import pickle as pickle
 import time
 import sys
@@ -103,5 +104,147 @@ def test_NDArrayIter():
         else:
             assert(labelcount[i] == 100)
 
+def test_PrefetchingIter():
+    datas = ori_np.arange(1000 * 4, dtype=ori_np.float32).reshape([1000, 2, 2])
+    labels = ori_np.arange(1000, dtype=ori_np.float32).reshape([1000, 1])
+    base = io.NDArrayIter(datas, labels, batch_size = 128, shuffle = False, last_batch_handle='pad')
+    dataiter = io.PrefetchingIter(base, depth = 3)
+    assert(dataiter.num_data == 1000)
+    for epoch in range(2):
+        batchidx = 0
+        for batch in dataiter:
+            start = batchidx * 128
+            expected = ori_np.arange(start, start + 128) % 1000
+            assert((batch.label[0].asnumpy().flatten() == expected).all())
+            assert((batch.data[0].asnumpy()[:, 0, 0] == expected * 4).all())
+            batchidx += 1
+        assert(batchidx == 8)
+        assert(batch.pad == 24)
+        dataiter.reset()
+    assert(len(dataiter.epoch_wait_times) == 2)
+    # Stop in the middle of an epoch.
+    next(dataiter)
+    dataiter.reset()
+    assert(sum(1 for _ in dataiter) == 8)
+
+def test_NDArrayIter_index_shuffle():
+    datas = ori_np.arange(1000 * 4, dtype=ori_np.float32).reshape([1000, 2, 2])
+    labels = ori_np.arange(1000, dtype=ori_np.float32).reshape([1000, 1])
+    path = os.path.join(tempfile.mkdtemp(), 'data.npy')
+    ori_np.save(path, datas)
+    dataiter = io.NDArrayIter(path, labels, batch_size = 128, shuffle = True,
+                              last_batch_handle='pad', shuffle_mode='index')
+    assert(isinstance(dataiter.data[0][1], ori_np.memmap))
+    orders = []
+    for epoch in range(2):
+        seen = []
+        for batch in dataiter:
+            label = batch.label[0].asnumpy().flatten()
+            assert((batch.data[0].asnumpy()[:, 0, 0] == label * 4).all())
+            seen.append(label[:128 - batch.pad])
+        seen = ori_np.concatenate(seen)
+        assert((ori_np.sort(seen) == ori_np.arange(1000)).all())
+        orders.append(seen)
+        dataiter.reset()
+    # Reshuffled on reset.
+    assert((orders[0] != orders[1]).any())
+    # Sources are not copied.
+    assert(dataiter.label[0][1] is labels)
+
+    subiter = dataiter.getsubiter(300)
+    seen = ori_np.concatenate([batch.label[0].asnumpy().flatten()[:128 - batch.pad]
+                               for batch in subiter])
+    assert(len(ori_np.unique(seen)) == 300)
+
+def test_MultiProcessIter():
+    datas = ori_np.arange(300 * 4, dtype=ori_np.float32).reshape([300, 4])
+    labels = ori_np.arange(300, dtype=ori_np.float32).reshape([300, 1])
+
+    def transform(sample, rng):
+        # Crop and add noise.
+        return sample[:2] + rng.randint(10) * 10000
+
+    def run(num_workers):
+        dataiter = io.MultiProcessIter(datas, labels, batch_size = 32, transform = transform,
+                                       num_workers = num_workers, shuffle = True, seed = 7)
+        assert(dataiter.provide_data[0][1] == (32, 2))
+        epochs = []
+        for epoch in range(2):
+            batches = list(dataiter)
+            assert(len(batches) == 10)
+            assert(batches[-1].pad == 20)
+            data = ori_np.concatenate([b.data[0].asnumpy() for b in batches])
+            label = ori_np.concatenate([b.label[0].asnumpy() for b in batches]).flatten()
+            assert(((data[:, 0] % 10000) == label * 4).all())
+            assert(len(ori_np.unique(label)) == 300)
+            epochs.append(data)
+            dataiter.reset()
+        dataiter.close()
+        return epochs
+
+    epochs = run(1)
+    assert((epochs[0] != epochs[1]).any())
+    # Sub dataiters are gathered without workers.
+    dataiter = io.MultiProcessIter(datas, labels, batch_size = 32, transform = transform)
+    subiter = dataiter.getsubiter(100)
+    assert(dataiter._workers is None)
+    batches = list(subiter)
+    data = ori_np.concatenate([b.data[0].asnumpy()[:32 - b.pad] for b in batches])
+    label = ori_np.concatenate([b.label[0].asnumpy()[:32 - b.pad] for b in batches]).flatten()
+    assert(data.shape == (100, 2))
+    assert(((data[:, 0] % 10000) == label * 4).all())
+    assert(len(ori_np.unique(label)) == 100)
+    # The order and transforms only depend on the seed.
+    for expected, data in zip(epochs, run(3)):
+        assert((expected == data).all())
+
+def test_ChunkedDataIter():
+    datas = ori_np.arange(1000 * 4, dtype=ori_np.float32).reshape([1000, 2, 2])
+    labels = ori_np.arange(1000, dtype=ori_np.int64).reshape([1000, 1])
+    tmpdir = tempfile.mkdtemp()
+    pickle_file = os.path.join(tmpdir, 'data.pkl')
+    io.save_data_labels(datas, labels, pickle_file)
+    directory = os.path.join(tmpdir, 'chunked')
+    io.convert_pickle_to_chunked(pickle_file, directory, shard_size = 128)
+
+    for use_mmap in [True, False]:
+        dataiter = io.ChunkedDataIter(directory, batch_size = 64, shuffle = True,
+                                      buffer_size = 256, seed = 3, use_mmap = use_mmap)
+        assert(dataiter.provide_data == [('data', (64, 2, 2))])
+        batches = list(dataiter)
+        assert(len(batches) == 16)
+        assert(batches[-1].pad == 24)
+        label = ori_np.concatenate([b.label[0].asnumpy().flatten()[:64 - b.pad]
+                                    for b in batches])
+        data = ori_np.concatenate([b.data[0].asnumpy()[:64 - b.pad, 0, 0] for b in batches])
+        assert((data == label * 4).all())
+        assert((ori_np.sort(label) == ori_np.arange(1000)).all())
+        assert((label != ori_np.arange(1000)).any())
+        # Only a window of shards is kept loaded.
+        assert(len(dataiter._loaded) <= dataiter._max_loaded < 8)
+
+    # iter_next() walks the same batches as next().
+    dataiter.hard_reset()
+    num_batches = 0
+    while dataiter.iter_next():
+        assert((dataiter.getlabel()[0].asnumpy() == batches[num_batches].label[0].asnumpy()).all())
+        assert(dataiter.getpad() == batches[num_batches].pad)
+        num_batches += 1
+    assert(num_batches == 16)
+
+    # Resume in the middle of the epoch.
+    resumed = io.ChunkedDataIter(directory, batch_size = 64, shuffle = True,
+                                 buffer_size = 256, seed = 3)
+    resumed.seek(10)
+    for expected, batch in zip(batches[10:], resumed):
+        assert((expected.label[0].asnumpy() == batch.label[0].asnumpy()).all())
+    # The next epoch is shuffled differently.
+    dataiter.reset()
+    assert((next(dataiter).label[0].asnumpy() != batches[0].label[0].asnumpy()).any())
+
 if __name__ == "__main__":
     test_NDArrayIter()
+    test_PrefetchingIter()
+    test_NDArrayIter_index_shuffle()
+    test_MultiProcessIter()
+    test_ChunkedDataIter()
@@ -1,6 +1,7 @@
 import sys
 import numpy as np
 import mxnet as mx
+import minpy
 import minpy.numpy as mp
 from minpy import core
 import minpy.nn.layers as layers
@@ -131,5 +132,92 @@ def test_layers():
             and test_mxnet_affine()
             and test_mxnet_softmax())
 
+def test_step_layers():
+    N, D, H = 3, 4, 5
+
+    def composed_lstm_step(x, prev_h, prev_c, Wx, Wh, b):
+        a = mp.dot(x, Wx) + mp.dot(prev_h, Wh) + b
+        i, f, o = [layers.sigmoid(a[:, k * H:(k + 1) * H]) for k in range(3)]
+        next_c = f * prev_c + i * mp.tanh(a[:, 3 * H:])
+        return o * mp.tanh(next_c), next_c
+
+    def composed_gru_step(x, prev_h, Wx, Wh, b, Wxh, Whh, bh):
+        a = layers.sigmoid(mp.dot(x, Wx) + mp.dot(prev_h, Wh) + b)
+        r, z = a[:, :H], a[:, H:]
+        h_m = mp.tanh(mp.dot(x, Wxh) + mp.dot(r * prev_h, Whh) + bh)
+        return z * prev_h + (1 - z) * h_m
+
+    lstm_args = [rng.randn(N, D), rng.randn(N, H), rng.randn(N, H),
+                 rng.randn(D, 4 * H), rng.randn(H, 4 * H), rng.randn(4 * H)]
+    gru_args = [rng.randn(N, D), rng.randn(N, H), rng.randn(D, 2 * H), rng.randn(H, 2 * H),
+                rng.randn(2 * H), rng.randn(D, H), rng.randn(H, H), rng.randn(H)]
+    dh, dc = rng.randn(N, H), rng.randn(N, H)
+    losses = [
+        (layers.lstm_step, composed_lstm_step, lstm_args,
+         lambda out: mp.sum(out[0] * dh) + mp.sum(out[1] * dc)),
+        # Only the hidden state is used, the cell state gets no gradient.
+        (layers.lstm_step, composed_lstm_step, lstm_args, lambda out: mp.sum(out[0] * dh)),
+        (layers.gru_step, composed_gru_step, gru_args, lambda out: mp.sum(out * dh)),
+    ]
+    try:
+        for fused, composed, args, loss in losses:
+            argnums = range(len(args))
+            minpy.set_global_policy('only_numpy')
+            expected, _ = core.grad_and_loss(lambda *a: loss(composed(*a)), argnums)(*args)
+            for policy in ['only_numpy', 'prefer_mxnet']:
+                minpy.set_global_policy(policy)
+                actual, _ = core.grad_and_loss(lambda *a: loss(fused(*a)), argnums)(*args)
+                for grad, value in zip(actual, expected):
+                    assert np.allclose(grad.asnumpy(), value.asnumpy(), rtol=1e-4, atol=1e-5)
+    finally:
+        minpy.set_global_policy('prefer_mxnet')
+
+def test_temporal_layers():
+    N, T, D, H = 3, 7, 4, 5
+
+    def stepped_lstm(x, h0, Wx, Wh, b):
+        # Reference built from single steps, as layers.lstm_temporal used to be.
+        h, c = h0.reshape(N, 1, H), mp.zeros((N, 1, H))
+        for t in range(T):
+            h_step, c_step = layers.lstm_step(x[:, t, :], h[:, t, :], c[:, t, :], Wx, Wh, b)
+            h = mp.append(h, h_step.reshape(N, 1, H), axis=1)
+            c = mp.append(c, c_step.reshape(N, 1, H), axis=1)
+        return h[:, 1:, :]
+
+    def stepped_rnn(x, h0, Wx, Wh, b):
+        h = h0.reshape(N, 1, H)
+        for t in range(T):
+            h_step = layers.rnn_step(x[:, t, :], h[:, t, :], Wx, Wh, b)
+            h = mp.append(h, h_step.reshape(N, 1, H), axis=1)
+        return h[:, 1:, :]
+
+    def grads(func, args, dh, policy, **kwargs):
+        minpy.set_global_policy(policy)
+        grad_vals, loss = core.grad_and_loss(
+            lambda *a: mp.sum(func(*a, **kwargs) * dh), range(5))(*args)
+        return [loss.asnumpy()] + [g.asnumpy() for g in grad_vals]
+
+    try:
+        for fused, stepped, G in [(layers.rnn_temporal, stepped_rnn, 1),
+                                  (layers.lstm_temporal, stepped_lstm, 4)]:
+            args = [rng.randn(N, T, D), rng.randn(N, H), rng.randn(D, G * H) * 0.3,
+                    rng.randn(H, G * H) * 0.3, rng.randn(G * H)]
+            dh = rng.randn(N, T, H)
+            expected = grads(stepped, args, dh, 'only_numpy')
+            for policy in ['only_numpy', 'prefer_mxnet']:
+                for actual, value in zip(grads(fused, args, dh, policy), expected):
+                    assert np.allclose(actual, value, rtol=1e-4, atol=1e-5)
+            # Truncated BPTT: the same on both variants, and no gradient crosses windows.
+            truncated = grads(fused, args, dh, 'only_numpy', bptt=3)
+            for actual, value in zip(grads(fused, args, dh, 'prefer_mxnet', bptt=3), truncated):
+                assert np.allclose(actual, value, rtol=1e-4, atol=1e-5)
+            minpy.set_global_policy('only_numpy')
+            dx = core.grad(lambda x: mp.sum(fused(x, *args[1:], bptt=3)[:, 3:, :]))(args[0])
+            assert np.all(dx.asnumpy()[:, :3] == 0)
+    finally:
+        minpy.set_global_policy('prefer_mxnet')
+
 if __name__ == '__main__':
+    test_step_layers()
+    test_temporal_layers()
     sys.exit(not test_layers())
@@ -0,0 +1,78 @@
+import numpy as py_np
+from minpy import array
+from minpy.array_variants import ArrayType
+from minpy.nn import optim
+
+def test_fused_updater():
+    py_np.random.seed(0)
+    shapes = [(30, 20), (20,), (20, 10), (10,)]
+    for rule in ['sgd', 'sgd_momentum', 'rmsprop', 'adam']:
+        params = {str(i): array.wrap(py_np.random.randn(*shape).astype(py_np.float32))
+                  for i, shape in enumerate(shapes)}
+        expected = dict(params)
+        expected_configs = {name: {} for name in params}
+        configs = {name: {} for name in params}
+        fused = optim.FusedUpdater(rule)
+        for step in range(4):
+            grads = {name: array.wrap(py_np.random.randn(*w.shape).astype(py_np.float32))
+                     for name, w in params.items()}
+            for name in params:
+                expected[name], expected_configs[name] = getattr(optim, rule)(
+                    expected[name], grads[name], expected_configs[name])
+            params.update(fused(params, grads, configs))
+            if step == 1:
+                # Changing hyperparameters regroups parameters and keeps the state.
+                for config in list(configs.values()) + list(expected_configs.values()):
+                    config['learning_rate'] *= 0.5
+        for name in params:
+            assert py_np.allclose(params[name].asnumpy(), expected[name].asnumpy())
+
+def test_inplace_rules():
+    py_np.random.seed(0)
+    for rule in ['sgd', 'sgd_momentum', 'rmsprop', 'adam']:
+        for use_mxnet in [False, True]:
+            init = py_np.random.randn(20, 10).astype(py_np.float32)
+            expected = array.wrap(init.copy())
+            w = array.wrap(init.copy())
+            if use_mxnet:
+                w.get_data_mutable(ArrayType.MXNET)
+            expected_config = {}
+            config = {}
+            for step in range(4):
+                dw = array.wrap(py_np.random.randn(20, 10).astype(py_np.float32))
+                expected, expected_config = getattr(optim, rule)(expected, dw, expected_config)
+                next_w, config = getattr(optim, rule + '_inplace')(w, dw, config)
+                assert next_w is w
+                if step == 0:
+                    buffers = {k: v for k, v in config.items() if hasattr(v, 'shape')}
+            # State is updated in the same buffers.
+            assert all(config[k] is v for k, v in buffers.items())
+            assert py_np.allclose(w.asnumpy(), expected.asnumpy())
+
+def test_inplace_bound_params():
+    import mxnet as mx
+    import minpy.numpy as np
+    from minpy import core
+    net = mx.sym.FullyConnected(data=mx.sym.Variable('x'), num_hidden=4, name='fc')
+    func = core.Function(net, bind_params=['fc_weight', 'fc_bias'])
+    weight = array.wrap(py_np.ones((4, 6), dtype=py_np.float32))
+    bias = array.wrap(py_np.zeros((4, ), dtype=py_np.float32))
+    x = py_np.ones((8, 6), dtype=py_np.float32)
+    grad_func = core.grad(lambda w, b: np.sum(func(x=x, fc_weight=w, fc_bias=b)), argnum=[0, 1])
+    configs = [{'learning_rate': 0.125}, {'learning_rate': 0.125}]
+    for step in range(3):
+        grads = grad_func(weight, bias)
+        # Reading parameters makes their NumPy data valid as well.
+        assert py_np.allclose(weight.asnumpy(), 1 - step)
+        # Parameters are updated in the bound storage of the executors.
+        for param, grad, config in zip([weight, bias], grads, configs):
+            optim.sgd_inplace(param, grad, config)
+        assert weight.get_data(ArrayType.MXNET) is func._bound_args['fc_weight'].data
+        assert bias.get_data(ArrayType.MXNET) is func._bound_args['fc_bias'].data
+    assert py_np.allclose(weight.asnumpy(), -2)
+    assert py_np.allclose(bias.asnumpy(), -3)
+
+if __name__ == "__main__":
+    test_fused_updater()
+    test_inplace_rules()
+    test_inplace_bound_params()
@@ -0,0 +1,71 @@
+import numpy as py_np
+from minpy import array
+from minpy.nn import layers
+from minpy.nn.io import NDArrayIter
+from minpy.nn.model import ModelBase
+from minpy.nn.solver import Solver
+from minpy.nn.parallel import DataParallelSolver, AsyncTrainer
+
+class TwoLayerNet(ModelBase):
+    def __init__(self):
+        super(TwoLayerNet, self).__init__()
+        self.add_param(name='w1', shape=(20, 32)) \
+            .add_param(name='b1', shape=(32,)) \
+            .add_param(name='w2', shape=(32, 5)) \
+            .add_param(name='b2', shape=(5,))
+
+    def forward(self, X, mode):
+        y1 = layers.relu(layers.affine(X, self.params['w1'], self.params['b1']))
+        return layers.affine(y1, self.params['w2'], self.params['b2'])
+
+    def loss(self, predict, y):
+        return layers.softmax_loss(predict, y)
+
+def test_data_parallel_solver():
+    X = py_np.random.randn(200, 20).astype(py_np.float32)
+    y = py_np.random.randint(5, size=200)
+    dataiter = NDArrayIter(X, y, batch_size=50)
+    config = {'learning_rate': 0.1}
+    model = TwoLayerNet()
+    solver = Solver(model, dataiter, dataiter, verbose=False,
+                    update_rule='sgd_momentum', optim_config=config)
+    solver.init()
+    parallel_model = TwoLayerNet()
+    # Shards of 17, 16 and 17 samples.
+    parallel_solver = DataParallelSolver(parallel_model, dataiter, dataiter, verbose=False,
+                                         update_rule='sgd_momentum', optim_config=config,
+                                         num_workers=3)
+    parallel_solver.init()
+    for name, value in model.params.items():
+        parallel_model.params[name] = array.wrap(value.asnumpy().copy())
+    try:
+        for batch in dataiter:
+            solver._step(batch)
+            parallel_solver._step(batch)
+            assert py_np.allclose(solver.loss_history[-1], parallel_solver.loss_history[-1])
+    finally:
+        parallel_solver.close()
+    for name, value in model.params.items():
+        assert py_np.allclose(value.asnumpy(), parallel_model.params[name].asnumpy(),
+                              atol=1e-5)
+
+def test_async_trainer():
+    # Minimize |w - target|^2 from several workers.
+    target = py_np.arange(6, dtype=py_np.float32).reshape(2, 3)
+
+    def worker(rank, client):
+        while not client.should_stop():
+            params = client.pull()
+            client.push({'w': 2 * (params['w'].asnumpy() - target)})
+
+    trainer = AsyncTrainer({'w': py_np.zeros((2, 3), dtype=py_np.float32)},
+                           update_rule='sgd', optim_config={'learning_rate': 0.05},
+                           num_workers=3, max_staleness=2)
+    params = trainer.run(worker, num_updates=200)
+    assert trainer.stats.applied == 200
+    assert trainer.stats.max_staleness_seen <= 2
+    assert py_np.allclose(params['w'].asnumpy(), target, atol=1e-3)
+
+if __name__ == "__main__":
+    test_data_parallel_solver()
+    test_async_trainer()
@@ -1,3 +1,5 @@
+import os
+import tempfile
 import minpy
 import minpy.numpy as np
 import minpy.numpy.random as random
@@ -63,5 +65,77 @@ def test_policy():
     weight = random.randn(num_features, num_classes)
     train(weight, data, 100)
 
+def test_auto_tune_policy():
+    from minpy.dispatch.policy import AutoTunePolicy
+    from minpy.dispatch.rule import AutoTuneRules
+    from minpy.array_variants import ArrayType
+    loc = os.path.join(tempfile.gettempdir(), '.minpy_autotune_test.conf')
+    old_policy = minpy.get_global_policy()
+    plc = AutoTunePolicy(warmup=2, loc=loc)
+    minpy.set_global_policy(plc)
+    try:
+        x = np.ones((3, 5))
+        w = np.ones((5, 2))
+        for _ in range(4):
+            y = np.dot(x, w)
+            dw, _ = grad_and_loss(lambda w: np.sum(np.dot(x, w)))(w)
+        assert (y.asnumpy() == 5).all()
+        assert (dw.asnumpy() == 3).all()
+        rules = plc._rules
+        key = rules.rule_key((x, w), {})
+        choice, speedup = rules.tuned('dot', 'minpy.numpy', key)
+        assert choice in (ArrayType.NUMPY, ArrayType.MXNET)
+        # Unknown if MXNet failed.
+        assert speedup is None or speedup >= 1
+        # Decisions are loaded by later runs.
+        plc.save_rules()
+        AutoTuneRules.reset_rules()
+        AutoTuneRules.load_rules_config(force=True)
+        assert rules.tuned('dot', 'minpy.numpy', key) == (choice, speedup)
+    finally:
+        minpy.set_global_policy(old_policy)
+
+def test_transfer_aware_policy():
+    import numpy as py_np
+    from minpy.dispatch.policy import TransferAwarePolicy
+    from minpy.dispatch.rule import AutoTuneRules
+    from minpy.array_variants import ArrayType
+    old_policy = minpy.get_global_policy()
+    plc = TransferAwarePolicy()
+    minpy.set_global_policy(plc)
+    try:
+        # Data in NumPy stays in NumPy.
+        x = minpy.array.wrap(py_np.ones((4, 5)))
+        for _ in range(3):
+            x = np.tanh(x) + 1
+        assert x.has_valid_data(ArrayType.NUMPY) and not x.has_type(ArrayType.MXNET)
+        transfers, _, avoided, avoided_bytes = plc.transfer_stat
+        assert transfers == 0
+        # Both tanh and add of each iteration.
+        assert avoided == 6 and avoided_bytes == 6 * x.nbytes
+        # Ops known to be faster in MXNet are pinned to it.
+        plc = TransferAwarePolicy(faster={'tanh': ArrayType.MXNET})
+        minpy.set_global_policy(plc)
+        y = np.tanh(x)
+        assert y.has_valid_data(ArrayType.MXNET)
+        assert plc.transfer_stat[:2] == (1, x.nbytes)
+        assert py_np.allclose(y.asnumpy(), py_np.tanh(x.asnumpy()))
+        # So are ops measured to be much faster by auto-tuning.
+        x = minpy.array.wrap(py_np.ones((4, 5)))
+        rules = AutoTuneRules()
+        key = rules.rule_key((x, ), {})
+        rules.add_choice('tanh', 'minpy.numpy', ArrayType.MXNET, key, speedup=1.5)
+        minpy.set_global_policy(TransferAwarePolicy(min_speedup=2))
+        assert not np.tanh(x).has_type(ArrayType.MXNET)
+        rules.add_choice('tanh', 'minpy.numpy', ArrayType.MXNET, key, speedup=3)
+        assert np.tanh(x).has_valid_data(ArrayType.MXNET)
+        minpy.set_global_policy(TransferAwarePolicy(min_speedup=None))
+        x = minpy.array.wrap(py_np.ones((4, 5)))
+        assert not np.tanh(x).has_type(ArrayType.MXNET)
+    finally:
+        minpy.set_global_policy(old_policy)
+
 if __name__ == "__main__":
     test_policy()
+    test_auto_tune_policy()
+    test_transfer_aware_policy()
@@ -1,3 +1,5 @@
+import subprocess
+import sys
 import minpy.numpy as np
 import minpy.dispatch.policy as policy
 import time
@@ -20,5 +22,26 @@ def test_startup_perf():
     end = time.time()
     print('Third call:', end - start)
 
+def test_import_perf():
+    # Time the import of minpy alone, with its dependencies already loaded.
+    code = ('import time, numpy, mxnet\n'
+            'start = time.time()\n'
+            'import minpy.numpy as np\n'
+            'print(time.time() - start)\n'
+            'registry = np.__registry__\n'
+            'print(len(registry.names()))\n'
+            'print(len(registry._reg))\n'
+            'np.arctanh(np.zeros((2, 2)))\n'
+            'print(len(registry._reg))\n')
+    out = subprocess.check_output([sys.executable, '-c', code]).decode().split()
+    import_time, num_names, num_created, num_created_after_use = (
+        float(out[0]), int(out[1]), int(out[2]), int(out[3]))
+    print('Import:', import_time)
+    print('Names created at import: %d of %d' % (num_created, num_names))
+    # Primitives of a name are only created when it is first used.
+    assert num_created < num_names
+    assert num_created_after_use > num_created
+
 if __name__ == "__main__":
     test_startup_perf()
+    test_import_perf()
@@ -0,0 +1,52 @@
+from __future__ import print_function
+
+import numpy as py_np
+import minpy.numpy as np
+from minpy import tape
+from minpy.core import grad
+
+def test_diamond_graph():
+    def func(x):
+        y = np.tanh(x)
+        a = y * 2
+        b = y * y
+        z = np.argmax(y)  # Not on the gradient path.
+        return np.sum(a + b)
+
+    x = py_np.random.randn(4, 5)
+    expected = (2 + 2 * py_np.tanh(x)) * (1 - py_np.tanh(x) ** 2)
+    gradient = grad(func)(x)
+    assert py_np.allclose(gradient.asnumpy(), expected, atol=1e-5)
+
+def test_peak_grad_bytes():
+    def chain(x):
+        for _ in range(10):
+            x = np.tanh(x)
+        return np.sum(x)
+
+    x = py_np.random.randn(64, 64)
+    grad(chain)(x)
+    stats = tape.Tape.last_stats
+    # Gradients of the chain are released as soon as they are consumed, so at most
+    # a handful of them are alive at the same time.
+    nbytes = x.size * 8
+    assert stats['peak_grad_bytes'] <= 3 * nbytes
+    assert stats['executed_records'] == 11
+
+def test_inplace_accumulation():
+    def fan_in(x):
+        y = np.tanh(x)
+        return np.sum(y * 1.0 + y * 2.0 + y * 3.0 + y * 4.0)
+
+    x = py_np.random.randn(8, 8)
+    gradient = grad(fan_in)(x)
+    expected = 10 * (1 - py_np.tanh(x) ** 2)
+    assert py_np.allclose(gradient.asnumpy(), expected, atol=1e-4)
+    # Four contributions to the gradient of y: the first one is borrowed, the second
+    # one allocates the accumulation buffer and the last two are added in place.
+    assert tape.Tape.last_stats['saved_allocations'] >= 2
+
+if __name__ == "__main__":
+    test_diamond_graph()
+    test_peak_grad_bytes()
+    test_inplace_accumulation()
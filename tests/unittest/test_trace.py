@@ -0,0 +1,72 @@
+import numpy as py_np
+import minpy.numpy as np
+from minpy.core import grad_and_loss
+
+def loss_func(w, x, scale):
+    y = np.tanh(np.dot(x, w))
+    return np.sum(y * y) * scale
+
+def test_replay():
+    replayed = grad_and_loss(loss_func, argnum=0, replay=True)
+    plain = grad_and_loss(loss_func, argnum=0)
+    w = py_np.random.randn(8, 4)
+    for _ in range(3):
+        x = py_np.random.randn(16, 8)
+        grad, loss = replayed(w, x, 0.5)
+        expected_grad, expected_loss = plain(w, x, 0.5)
+        assert py_np.allclose(grad.asnumpy(), expected_grad.asnumpy(), atol=1e-5)
+        assert py_np.allclose(loss.asnumpy(), expected_loss.asnumpy(), atol=1e-5)
+    info = replayed.trace_cache.cache_info()
+    assert info.misses == 1
+    assert info.hits == 2
+    # A new shape is traced again; scalar arguments are inputs of the trace.
+    x = py_np.random.randn(32, 8)
+    _, loss = replayed(w, x, 0.5)
+    _, scaled_loss = replayed(w, x, 2.0)
+    assert py_np.allclose(scaled_loss.asnumpy(), 4 * loss.asnumpy(), atol=1e-4)
+    info = replayed.trace_cache.cache_info()
+    assert info.misses == 2
+    assert info.hits == 3
+    assert info.size == 2
+
+def test_untraceable():
+    def branchy(x):
+        y = np.tanh(x)
+        if np.sum(y).asnumpy() > 0:
+            return np.sum(y * 2)
+        return np.sum(y * 3)
+
+    replayed = grad_and_loss(branchy, replay=True)
+    for sign in [1, -1, 1]:
+        x = sign * py_np.abs(py_np.random.randn(4, 4))
+        grad, _ = replayed(x)
+        factor = 2 if sign > 0 else 3
+        expected = factor * (1 - py_np.tanh(x) ** 2)
+        assert py_np.allclose(grad.asnumpy(), expected, atol=1e-5)
+    info = replayed.trace_cache.cache_info()
+    assert info.hits == 0
+    assert info.fallbacks == 2
+
+def test_untraceable_scalar():
+    def branchy(x):
+        if float(np.sum(x, axis=0)[0]) > 0:
+            return np.sum(x * 2)
+        return np.sum(x * 3)
+
+    replayed = grad_and_loss(branchy, replay=True)
+    plain = grad_and_loss(branchy)
+    x = py_np.ones((2, 2))
+    _, loss = replayed(x)
+    assert py_np.allclose(loss.asnumpy(), 8)
+    _, loss = replayed(-x)
+    _, expected_loss = plain(-x)
+    assert py_np.allclose(loss.asnumpy(), expected_loss.asnumpy())
+    assert py_np.allclose(loss.asnumpy(), -12)
+    info = replayed.trace_cache.cache_info()
+    assert info.hits == 0
+    assert info.fallbacks == 1
+
+if __name__ == "__main__":
+    test_replay()
+    test_untraceable()
+    test_untraceable_scalar()
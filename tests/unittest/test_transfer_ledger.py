@@ -0,0 +1,68 @@
+import numpy
+import minpy.numpy as np
+from minpy import array
+from minpy.array_variants import ArrayType
+
+def test_transfer_ledger():
+    array.set_zero_copy(False)
+    ledger = array.transfer_ledger
+    ledger.reset()
+    ledger.start()
+    try:
+        x = array.wrap(np.ones((8, 4)).asnumpy())
+        y = np.tanh(x)
+        y.get_data(ArrayType.MXNET)
+        z = y[2:4]
+        z.asnumpy()
+        ledger.stop()
+        directions = [rec.direction for rec in ledger.records]
+        assert 'numpy->mxnet' in directions
+        assert ledger.total_bytes >= x.nbytes
+        assert sum(cnt for cnt, _ in ledger.totals().values()) == len(ledger.records)
+        ledger.show()
+    finally:
+        ledger.stop()
+        ledger.reset()
+        # Zero-copy is enabled by default.
+        array.set_zero_copy(True)
+
+def test_write_through():
+    x = array.wrap(np.zeros((8, 4)).asnumpy())
+    x.get_data(ArrayType.MXNET)
+    array.set_write_through(True)
+    try:
+        x[3] = 1.0
+        x[5:7] = 2.0
+        assert x.has_valid_data(ArrayType.MXNET)
+        assert x.has_valid_data(ArrayType.NUMPY)
+        mx_copy = x.get_data(ArrayType.MXNET).asnumpy()
+        assert (mx_copy == x.asnumpy()).all()
+    finally:
+        array.set_write_through(False)
+    x[0] = 3.0
+    assert not x.has_valid_data(ArrayType.MXNET)
+
+def test_zero_copy():
+    if not array.set_zero_copy(True):
+        return
+    x = array.wrap(numpy.ones((16, 8), dtype=numpy.float32))
+    ledger = array.transfer_ledger
+    ledger.reset()
+    ledger.start()
+    try:
+        y = x.get_data(ArrayType.MXNET)
+    finally:
+        ledger.stop()
+    assert ledger.total_bytes == 0
+    assert (y.asnumpy() == 1).all()
+    # Mutable NumPy access must not alias a read-only MXNet view.
+    z = array.wrap(y * 2)
+    z[0] = 0.0
+    assert z.asnumpy()[0].sum() == 0
+    assert (y.asnumpy() == 1).all()
+    ledger.reset()
+
+if __name__ == "__main__":
+    test_transfer_ledger()
+    test_write_through()
+    test_zero_copy()